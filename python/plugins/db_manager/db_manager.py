@@ -143,6 +143,10 @@ class DBManager(QMainWindow):
         self.info.setDirty()
         self.table.setDirty()
         self.preview.setDirty()
+        # read the catalog again instead of the cached metadata
+        db = self.tree.currentDatabase()
+        if db is not None:
+            db.connector.invalidateMetadata()
         self.refreshItem()
 
     def importActionSlot(self):
@@ -31,7 +31,7 @@ from .db_plugins import supportedDbTypes, createDbPlugin
 from .db_plugins.plugin import BaseError, Table, Database
 from .dlg_db_error import DlgDbError
 
-from qgis.core import QgsApplication, QgsDataSourceUri, QgsVectorLayer, QgsRasterLayer, QgsMimeDataUtils
+from qgis.core import QgsApplication, QgsDataSourceUri, QgsVectorLayer, QgsRasterLayer, QgsMimeDataUtils, QgsTask
 from qgis.utils import OverrideCursor
 
 from . import resources_rc  # NOQA
@@ -52,6 +52,9 @@ class TreeItem(QObject):
         self.populated = False
         self.itemData = data
         self.childItems = []
+        # data of the children not created yet, see DBModel.fetchMore()
+        self.pendingChildren = []
+        self.loadingTask = None
         if parent:
             parent.appendChild(self)
 
@@ -68,6 +71,25 @@ class TreeItem(QObject):
         self.populated = True
         return True
 
+    def loadInBackground(self):
+        """ whether loadChildren() can run in a background task """
+        return False
+
+    def loadChildren(self):
+        """ read the data of the children created by createChild() """
+        return []
+
+    def createChild(self, data):
+        return None
+
+    def cancelLoading(self):
+        if self.loadingTask is not None:
+            self.loadingTask.cancel()
+        self.loadingTask = None
+        self.pendingChildren = []
+        for child in self.childItems:
+            child.cancelLoading()
+
     def getItemData(self):
         return self.itemData
 
@@ -80,7 +102,9 @@ class TreeItem(QObject):
 
     def removeChild(self, row):
         if row >= 0 and row < len(self.childItems):
-            self.childItems[row].itemData.deleteLater()
+            self.childItems[row].cancelLoading()
+            if self.childItems[row].itemData is not None:
+                self.childItems[row].itemData.deleteLater()
             self.childItems[row].deleted.disconnect(self.childRemoved)
             del self.childItems[row]
 
@@ -111,6 +135,37 @@ class TreeItem(QObject):
         return pathList
 
 
+class LoadingItem(TreeItem):
+
+    """ placeholder shown while the children of its parent are read """
+
+    def __init__(self, parent):
+        TreeItem.__init__(self, None, parent)
+        self.populated = True
+
+    def data(self, column):
+        if column == 0:
+            return QApplication.translate("DBManagerPlugin", "Loading…")
+        return None
+
+
+class TreeItemLoadingTask(QgsTask):
+
+    def __init__(self, item):
+        super().__init__(QApplication.translate("DBManagerPlugin", "Loading {0}").format(item.data(0)), QgsTask.CanCancel)
+        self.item = item
+        self.error = None
+        self.children = None
+
+    def run(self):
+        try:
+            self.children = self.item.loadChildren()
+        except BaseError as e:
+            self.error = e
+            return False
+        return not self.isCanceled()
+
+
 class PluginItem(TreeItem):
 
     def __init__(self, dbplugin, parent=None):
@@ -178,18 +233,26 @@ class ConnectionItem(TreeItem):
         database.changed.connect(self.itemChanged)
         database.deleted.connect(self.itemDeleted)
 
-        schemas = database.schemas()
-        if schemas is not None:
-            for s in schemas:
-                SchemaItem(s, self)
-        else:
-            tables = database.tables()
-            for t in tables:
-                TableItem(t, self)
-
         self.populated = True
         return True
 
+    def loadInBackground(self):
+        return self.getItemData().database().connector.hasBackgroundQuerySupport()
+
+    def loadChildren(self):
+        connector = self.getItemData().database().connector
+        schemas = connector.getSchemas()
+        if schemas is not None:
+            return [(SchemaItem, row) for row in schemas]
+        return [(TableItem, row) for row in connector.getTables(None, False)]
+
+    def createChild(self, data):
+        itemClass, row = data
+        database = self.getItemData().database()
+        if itemClass is SchemaItem:
+            return SchemaItem(database.schemasFactory(row, database), self)
+        return TableItem(database.tablesFactory(row, database), self)
+
     def isConnected(self):
         return self.getItemData().database() is not None
 
@@ -217,15 +280,21 @@ class SchemaItem(TreeItem):
         return self.schemaIcon
 
     def populate(self):
-        if self.populated:
-            return True
-
-        for t in self.getItemData().tables():
-            TableItem(t, self)
-
         self.populated = True
         return True
 
+    def loadInBackground(self):
+        return self.getItemData().database().connector.hasBackgroundQuerySupport()
+
+    def loadChildren(self):
+        schema = self.getItemData()
+        return schema.database().connector.getTables(schema.name, False)
+
+    def createChild(self, row):
+        schema = self.getItemData()
+        database = schema.database()
+        return TableItem(database.tablesFactory(row, database, schema), self)
+
 
 class TableItem(TreeItem):
 
@@ -293,6 +362,9 @@ class DBModel(QAbstractItemModel):
     importVector = pyqtSignal(QgsVectorLayer, Database, QgsDataSourceUri, QModelIndex)
     notPopulated = pyqtSignal(QModelIndex)
 
+    # number of children created at once, the next ones are created when scrolling
+    FETCH_BATCH = 1000
+
     def __init__(self, parent=None):
         global isImportVectorAvail
 
@@ -383,7 +455,7 @@ class DBModel(QAbstractItemModel):
     def flags(self, index):
         global isImportVectorAvail
 
-        if not index.isValid():
+        if not index.isValid() or isinstance(index.internalPointer(), LoadingItem):
             return Qt.NoItemFlags
 
         flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
@@ -446,7 +518,38 @@ class DBModel(QAbstractItemModel):
 
     def hasChildren(self, parent):
         parentItem = parent.internalPointer() if parent.isValid() else self.rootItem
-        return parentItem.childCount() > 0 or not parentItem.populated
+        return parentItem.childCount() > 0 or len(parentItem.pendingChildren) > 0 or not parentItem.populated
+
+    def canFetchMore(self, parent):
+        parentItem = parent.internalPointer() if parent.isValid() else self.rootItem
+        return len(parentItem.pendingChildren) > 0
+
+    def fetchMore(self, parent):
+        parentItem = parent.internalPointer() if parent.isValid() else self.rootItem
+        count = min(len(parentItem.pendingChildren), self.FETCH_BATCH)
+        if count == 0:
+            return
+
+        first = parentItem.childCount()
+        self.beginInsertRows(parent, first, first + count - 1)
+        self._createChildren(parentItem, count)
+        self.endInsertRows()
+        for child in parentItem.childItems[first:]:
+            child.changed.connect(partial(self.refreshItem, child))
+
+    def _createChildren(self, item, count):
+        pending = item.pendingChildren[:count]
+        del item.pendingChildren[:count]
+        for data in pending:
+            try:
+                item.createChild(data)
+            except BaseError as e:
+                qDebug(e.msg)
+
+    def _itemIndex(self, item):
+        if item is self.rootItem:
+            return QModelIndex()
+        return self.createIndex(item.row(), 0, item)
 
     def setData(self, index, value, role):
         if role != Qt.EditRole or index.column() != 0:
@@ -475,6 +578,8 @@ class DBModel(QAbstractItemModel):
         return False
 
     def removeRows(self, row, count, parent):
+        if count <= 0:
+            return
         self.beginRemoveRows(parent, row, count + row - 1)
         item = parent.internalPointer()
         for i in range(row, count + row):
@@ -487,10 +592,17 @@ class DBModel(QAbstractItemModel):
                 item = index.internalPointer() if index.isValid() else self.rootItem
                 prevPopulated = item.populated
                 if prevPopulated:
+                    # the cached children are read again
                     self.removeRows(0, self.rowCount(index), index)
+                    item.cancelLoading()
                     item.populated = False
                 if prevPopulated or force:
                     if item.populate():
+                        if item.loadInBackground():
+                            self._loadChildrenInBackground(item)
+                        else:
+                            item.pendingChildren = list(item.loadChildren())
+                            self._createChildren(item, self.FETCH_BATCH)
                         for child in item.childItems:
                             child.changed.connect(partial(self.refreshItem, child))
                         self._onDataChanged(index)
@@ -500,6 +612,36 @@ class DBModel(QAbstractItemModel):
             except BaseError:
                 item.populated = False
 
+    def _loadChildrenInBackground(self, item):
+        # a placeholder is shown until the children are read
+        LoadingItem(item)
+
+        task = TreeItemLoadingTask(item)
+        item.loadingTask = task
+        task.taskCompleted.connect(partial(self._childrenLoaded, item, task))
+        task.taskTerminated.connect(partial(self._childrenLoaded, item, task))
+        QgsApplication.taskManager().addTask(task)
+
+    def _childrenLoaded(self, item, task):
+        if item.loadingTask is not task:
+            # the item was refreshed or removed in the meantime
+            return
+        item.loadingTask = None
+
+        index = self._itemIndex(item)
+        self.removeRows(0, item.childCount(), index)
+
+        if task.children is None:
+            item.populated = False
+            if task.error is not None:
+                DlgDbError.showError(task.error, self.treeView)
+            self.notPopulated.emit(index)
+            return
+
+        item.pendingChildren = list(task.children)
+        self.fetchMore(index)
+        self._onDataChanged(index)
+
     def _onDataChanged(self, indexFrom, indexTo=None):
         if indexTo is None:
             indexTo = indexFrom
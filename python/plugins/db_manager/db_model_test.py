@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    db_model_test.py
+    ---------------------
+    Date                 : October 2026
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import threading
+import time
+
+from qgis.testing import start_app, unittest
+from qgis.PyQt.QtCore import QCoreApplication, QModelIndex
+
+start_app()
+
+from db_manager.db_model import DBModel, TreeItem, LoadingItem
+
+
+class LeafItem(TreeItem):
+
+    def __init__(self, value, parent):
+        TreeItem.__init__(self, None, parent)
+        self.value = value
+        self.populated = True
+
+    def data(self, column):
+        return str(self.value) if column == 0 else None
+
+
+class ListItem(TreeItem):
+
+    """ item with a child per value, read in a background task when
+    background is set """
+
+    def __init__(self, values, background, parent):
+        TreeItem.__init__(self, None, parent)
+        self.values = values
+        self.background = background
+        self.loadCount = 0
+        # set to let the running loads return
+        self.loaded = threading.Event()
+        self.loaded.set()
+
+    def data(self, column):
+        return "list" if column == 0 else None
+
+    def loadInBackground(self):
+        return self.background
+
+    def loadChildren(self):
+        self.loaded.wait()
+        self.loadCount += 1
+        return self.values
+
+    def createChild(self, data):
+        return LeafItem(data, self)
+
+
+class TestDBManagerModel(unittest.TestCase):
+
+    def createModel(self, values, background):
+        model = DBModel()
+        model.rootItem = TreeItem(None, None)
+        model.rootItem.populated = True
+        item = ListItem(values, background, model.rootItem)
+        return model, item, model.index(0, 0, QModelIndex())
+
+    def waitForLoading(self, item):
+        deadline = time.time() + 10
+        while item.loadingTask is not None and time.time() < deadline:
+            QCoreApplication.processEvents()
+        self.assertIsNone(item.loadingTask)
+
+    def childValues(self, item):
+        return [child.value for child in item.childItems]
+
+    def testFetchMore(self):
+        values = list(range(2500))
+        model, item, index = self.createModel(values, False)
+        self.assertTrue(model.hasChildren(index))
+
+        # the children are created by batches
+        self.assertEqual(model.rowCount(index), model.FETCH_BATCH)
+        self.assertTrue(model.canFetchMore(index))
+        model.fetchMore(index)
+        self.assertEqual(model.rowCount(index), 2 * model.FETCH_BATCH)
+        model.fetchMore(index)
+        self.assertEqual(model.rowCount(index), 2500)
+        self.assertFalse(model.canFetchMore(index))
+        self.assertEqual(self.childValues(item), values)
+        model.fetchMore(index)
+        self.assertEqual(model.rowCount(index), 2500)
+        self.assertEqual(item.loadCount, 1)
+
+        # the children are cached until the item is refreshed
+        self.assertEqual(model.rowCount(index), 2500)
+        self.assertEqual(item.loadCount, 1)
+        model._refreshIndex(index)
+        self.assertEqual(item.loadCount, 2)
+        self.assertEqual(model.rowCount(index), model.FETCH_BATCH)
+        self.assertTrue(model.canFetchMore(index))
+
+    def testLoadInBackground(self):
+        model, item, index = self.createModel(list(range(1500)), True)
+        item.loaded.clear()
+
+        # a placeholder is shown while the children are read
+        self.assertEqual(model.rowCount(index), 1)
+        self.assertIsInstance(item.child(0), LoadingItem)
+        self.assertFalse(model.canFetchMore(index))
+
+        item.loaded.set()
+        self.waitForLoading(item)
+        self.assertEqual(model.rowCount(index), model.FETCH_BATCH)
+        self.assertEqual(self.childValues(item), list(range(model.FETCH_BATCH)))
+        self.assertTrue(model.canFetchMore(index))
+        model.fetchMore(index)
+        self.assertEqual(self.childValues(item), list(range(1500)))
+
+    def testCancelLoading(self):
+        model, item, index = self.createModel([1, 2], True)
+        item.loaded.clear()
+        self.assertEqual(model.rowCount(index), 1)
+        task = item.loadingTask
+        self.assertIsNotNone(task)
+
+        # refreshing the item cancels the running load
+        item.values = [3]
+        model._refreshIndex(index)
+        self.assertTrue(task.isCanceled())
+        self.assertIsNot(item.loadingTask, task)
+
+        # only the children of the last load are shown
+        item.loaded.set()
+        self.waitForLoading(item)
+        self.assertEqual(self.childValues(item), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
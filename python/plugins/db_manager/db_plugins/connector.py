@@ -45,6 +45,10 @@ class DBConnector(object):
     def cancel(self):
         pass
 
+    def invalidateMetadata(self):
+        """ forget the cached metadata of the database, if any """
+        pass
+
     def publicUri(self):
         publicUri = QgsDataSourceUri.removePassword(self._uri.uri(False))
         return QgsDataSourceUri(publicUri)
@@ -64,6 +68,10 @@ class DBConnector(object):
     def hasCustomQuerySupport(self):
         return False
 
+    def hasBackgroundQuerySupport(self):
+        """ whether the connection can be used from a background task """
+        return False
+
     def hasTableColumnEditingSupport(self):
         return False
 
@@ -103,7 +111,7 @@ class DBConnector(object):
     def _get_cursor(self, name=None):
         try:
             if name is not None:
-                name = str(name).encode('ascii', 'replace').replace('?', "_")
+                name = str(name).encode('ascii', 'replace').decode('ascii').replace('?', "_")
                 self._last_cursor_named_id = 0 if not hasattr(self,
                                                               '_last_cursor_named_id') else self._last_cursor_named_id + 1
                 return self.connection.cursor("%s_%d" % (name, self._last_cursor_named_id))
@@ -140,6 +148,18 @@ class DBConnector(object):
             self._rollback()
             raise DbError(e)
 
+    def _fetchmany(self, c, size):
+        try:
+            return c.fetchmany(size)
+
+        except self.connection_error_types() as e:
+            raise ConnectionError(e)
+
+        except self.execution_error_types() as e:
+            # do the rollback to avoid a "current transaction aborted, commands ignored" errors
+            self._rollback()
+            raise DbError(e)
+
     def _fetchone(self, c):
         try:
             return c.fetchone()
@@ -21,11 +21,13 @@ email                : brush.tyler@gmail.com
 """
 from builtins import str
 from builtins import range
+from collections import OrderedDict
 
 from qgis.PyQt.QtCore import (Qt,
                               QTime,
                               QRegExp,
                               QAbstractTableModel,
+                              QModelIndex,
                               pyqtSignal,
                               QObject)
 from qgis.PyQt.QtGui import (QFont,
@@ -33,7 +35,7 @@ from qgis.PyQt.QtGui import (QFont,
                              QStandardItem)
 from qgis.PyQt.QtWidgets import QApplication
 
-from qgis.core import QgsTask
+from qgis.core import QgsTask, QgsMessageLog
 
 from .plugin import DbError, BaseError
 
@@ -187,15 +189,57 @@ class SqlResultModelTask(QgsTask):
 
 class SqlResultModel(BaseTableModel):
 
+    # number of rows read at once from a server side cursor
+    PAGE_SIZE = 1000
+    # number of pages kept in memory, the other ones are read again when needed
+    MAX_CACHED_PAGES = 100
+    # number of rows read before the user has to ask for more of them
+    ROW_LIMIT = 100000
+
+    rowsFetched = pyqtSignal()
+
+    _cursor = None
+    _streamed = False
+    _firstRowSecs = None
+
     def __init__(self, db, sql, parent=None):
         self.db = db.connector
 
         t = QTime()
         t.start()
-        c = self.db._execute(None, sql)
+        c = self._executeSql(sql)
 
         self._affectedRows = 0
         data = []
+
+        if self._isServerSideCursor(c):
+            # rows are read page by page while the view is scrolled, the
+            # columns of a server side cursor are known after the first fetch
+            self._streamed = True
+            self._scrollable = bool(getattr(c, 'scrollable', False))
+            self._pages = OrderedDict()
+            self._evicted = False
+            self._exhausted = False
+            self._rowLimit = self.ROW_LIMIT
+
+            data = self.db._fetchmany(c, self.PAGE_SIZE)
+            header = self.db._get_cursor_columns(c)
+            if header is None:
+                header = []
+            self._firstRowSecs = t.elapsed() / 1000.0
+
+            super().__init__(header, None, parent)
+
+            self._cursor = c
+            self._pages[0] = data
+            self._affectedRows = len(data)
+            if len(data) < self.PAGE_SIZE:
+                self._exhausted = True
+                self._closeCursor()
+            self._secs = t.elapsed() / 1000.0
+            del t
+            return
+
         header = self.db._get_cursor_columns(c)
         if header is None:
             header = []
@@ -218,12 +262,128 @@ class SqlResultModel(BaseTableModel):
         del c
         del t
 
+    def _executeSql(self, sql):
+        """ execute the query, returning the cursor to read the results from """
+        return self.db._execute(None, sql)
+
+    def _isServerSideCursor(self, c):
+        """ whether the results of the cursor are kept on the server and
+        can be read page by page """
+        return False
+
+    def _closeCursor(self):
+        if self._cursor is None:
+            return
+
+        self.db._close_cursor(self._cursor)
+        self._cursor = None
+        self.db._commit()
+
+    def close(self):
+        """ release the server side cursor, the rows not read yet are lost """
+        if self._cursor is not None:
+            self._exhausted = True
+            self._closeCursor()
+
+    def __del__(self):
+        try:
+            self.close()
+        except BaseError:
+            pass
+
     def secs(self):
         return self._secs
 
+    def firstRowSecs(self):
+        return self._firstRowSecs if self._firstRowSecs is not None else self._secs
+
     def affectedRows(self):
         return self._affectedRows
 
+    def rowCount(self, parent=None):
+        if not self._streamed:
+            return super().rowCount(parent)
+        return self._affectedRows
+
+    def getData(self, row, col):
+        if not self._streamed:
+            return super().getData(row, col)
+
+        page, offset = divmod(row, self.PAGE_SIZE)
+        rows = self._pages.get(page)
+        if rows is None:
+            rows = self._fetchPage(page)
+        else:
+            self._pages.move_to_end(page)
+        return rows[offset][col] if offset < len(rows) else None
+
+    def _readRows(self, start):
+        """ read a page of rows starting at the given row of the cursor """
+        try:
+            if self._scrollable:
+                self._cursor.scroll(start, mode='absolute')
+            return self.db._fetchmany(self._cursor, self.PAGE_SIZE)
+        except (BaseError,) + self.db.error_types() as e:
+            # the cursor is lost, e.g. another query ended its transaction
+            QgsMessageLog.logMessage(str(e))
+            self._cursor = None
+            self._exhausted = True
+            return []
+
+    def _fetchPage(self, page):
+        """ read again a page which was dropped from the cache """
+        rows = []
+        if self._cursor is not None:
+            rows = self._readRows(page * self.PAGE_SIZE)
+        if rows:
+            self._cachePage(page, rows)
+        return rows
+
+    def _cachePage(self, page, rows):
+        self._pages[page] = rows
+        # pages can be read again only from a scrollable cursor
+        while self._scrollable and len(self._pages) > self.MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+            self._evicted = True
+
+    def hasMoreRows(self):
+        """ whether the query returns rows which were not read yet """
+        return self._cursor is not None and not self._exhausted
+
+    def canFetchMore(self, parent=None):
+        if parent is not None and parent.isValid():
+            return False
+        return self.hasMoreRows() and self._affectedRows < self._rowLimit
+
+    def fetchMore(self, parent=None):
+        if not self.canFetchMore(parent):
+            return
+
+        t = QTime()
+        t.start()
+        rows = self._readRows(self._affectedRows)
+        self._secs += t.elapsed() / 1000.0
+
+        if rows:
+            self.beginInsertRows(QModelIndex(), self._affectedRows, self._affectedRows + len(rows) - 1)
+            self._cachePage(self._affectedRows // self.PAGE_SIZE, rows)
+            self._affectedRows += len(rows)
+            self.endInsertRows()
+
+        if len(rows) < self.PAGE_SIZE:
+            self._exhausted = True
+            if not self._evicted:
+                self._closeCursor()
+
+        self.rowsFetched.emit()
+
+    def fetchMoreRows(self):
+        """ raise the row limit to read the next rows of the query """
+        if not self.hasMoreRows():
+            return
+        self._rowLimit = self._affectedRows + self.ROW_LIMIT
+        self.fetchMore()
+
 
 class SimpleTableModel(QStandardItemModel):
 
@@ -69,18 +69,53 @@ class ExecError(Exception):
         super(ExecError, self).__init__(*args, **kwargs)
 
 
+def _convertValue(value):
+    if (isinstance(value, QDate) or
+            isinstance(value, QTime) or
+            isinstance(value, QDateTime)):
+        value = value.toString()
+    elif isinstance(value, QByteArray):
+        value = u"GEOMETRY"
+        # value = value.toHex()
+    return value
+
+
+def _convertDateTime(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.toString()
+
+
+def _convertByteArray(value):
+    if isinstance(value, QByteArray):
+        return u"GEOMETRY"
+    return value
+
+
+# values of these types are returned as they are
+_PLAIN_TYPES = (QVariant.Bool, QVariant.Int, QVariant.UInt,
+                QVariant.LongLong, QVariant.ULongLong, QVariant.Double,
+                QVariant.String)
+
+
 class QtSqlDBCursor(object):
 
-    def __init__(self, conn):
+    def __init__(self, conn, arraysize=1, forwardonly=True):
         self.qry = QSqlQuery(conn)
         self.description = None
         self.rowcount = -1
-        self.arraysize = 1
+        # default number of rows returned by fetchmany()
+        self.arraysize = arraysize
+        # rows of a forward only query are not cached, but scroll() can't
+        # go back: set it to False before executing the query to browse it
+        self.forwardonly = forwardonly
+        self.converters = []
 
     def close(self):
         self.qry.finish()
 
     def execute(self, operation, parameters=[]):
+        self.qry.setForwardOnly(self.forwardonly)
         if len(parameters) == 0:
             if not self.qry.exec_(operation):
                 raise ExecError(self.qry.lastError().databaseText())
@@ -96,25 +131,39 @@ class QtSqlDBCursor(object):
 
         self.rowcount = self.qry.size()
         self.description = []
-        for c in range(self.qry.record().count()):
-            f = self.qry.record().field(c)
+        # converters of the values of each column, None when the value
+        # is returned as it is
+        self.converters = []
+        record = self.qry.record()
+        for c in range(record.count()):
+            f = record.field(c)
 
             if f.type() == QVariant.Date:
                 t = Date
+                self.converters.append(_convertDateTime)
             elif f.type() == QVariant.Time:
                 t = Time
+                self.converters.append(_convertDateTime)
             elif f.type() == QVariant.DateTime:
                 t = Timestamp
+                self.converters.append(_convertDateTime)
             elif f.type() == QVariant.Double:
                 t = float
+                self.converters.append(None)
             elif f.type() == QVariant.Int:
                 t = int
+                self.converters.append(None)
             elif f.type() == QVariant.String:
                 t = str
+                self.converters.append(None)
             elif f.type() == QVariant.ByteArray:
                 t = str
+                self.converters.append(_convertByteArray)
             else:
-                continue
+                # rows keep the values of every column, in the order of
+                # the description
+                t = None
+                self.converters.append(None if f.type() in _PLAIN_TYPES else _convertValue)
 
             self.description.append([
                 f.name(),                                 # name
@@ -127,60 +176,52 @@ class QtSqlDBCursor(object):
             ])
 
     def executemany(self, operation, seq_of_parameters):
-        if len(seq_of_parameters) == 0:
+        seq_of_parameters = list(seq_of_parameters)
+        if not seq_of_parameters:
+            self.rowcount = 0
             return
 
         if not self.qry.prepare(operation):
             raise ExecError(self.qry.lastError().databaseText())
 
-        for r in seq_of_parameters:
-            for i in range(len(r)):
-                self.qry.bindValue(i, r[i])
+        # bind a list of values to each placeholder and execute the
+        # statement once for all the rows
+        for column in zip(*seq_of_parameters):
+            self.qry.addBindValue(list(column))
 
-            if not self.qry.exec_():
-                raise ExecError(self.qry.lastError().databaseText())
+        if not self.qry.execBatch():
+            raise ExecError(self.qry.lastError().databaseText())
+
+        self.rowcount = len(seq_of_parameters)
 
     def scroll(self, row):
         return self.qry.seek(row)
 
-    def fetchone(self):
-        if not self.qry.next():
-            return None
-
-        row = []
-        for i in range(len(self.description)):
-            value = self.qry.value(i)
-            if (isinstance(value, QDate) or
-                    isinstance(value, QTime) or
-                    isinstance(value, QDateTime)):
-                value = value.toString()
-            elif isinstance(value, QByteArray):
-                value = u"GEOMETRY"
-                # value = value.toHex()
-
-            row.append(value)
-
-        return row
+    def _fetchRows(self, size=None):
+        """ read up to size rows (all of them if None) from the query """
+        qry = self.qry
+        value = qry.value
+        columns = list(enumerate(self.converters))
 
-    def fetchmany(self, size=10):
         rows = []
-        while len(rows) < size:
-            row = self.fetchone()
-            if row is None:
-                break
-            rows.append(row)
-
+        while (size is None or len(rows) < size) and qry.next():
+            rows.append([value(i) if converter is None else converter(value(i))
+                         for i, converter in columns])
         return rows
 
-    def fetchall(self):
-        rows = []
-        while True:
-            row = self.fetchone()
-            if row is None:
-                break
-            rows.append(row)
+    def fetchone(self):
+        rows = self._fetchRows(1)
+        if not rows:
+            return None
+        return rows[0]
 
-        return rows
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        return self._fetchRows(size)
+
+    def fetchall(self):
+        return self._fetchRows()
 
     def setinputsize(self, sizes):
         raise ExecError("nyi")
@@ -192,7 +233,7 @@ class QtSqlDBCursor(object):
 class QtSqlDBConnection(object):
     connections = 0
 
-    def __init__(self, driver, dbname, user, passwd):
+    def __init__(self, driver, dbname, user, passwd, prefetch=None):
         self.conn = QSqlDatabase.addDatabase(
             driver, "qtsql_%d" % QtSqlDBConnection.connections)
         QtSqlDBConnection.connections += 1
@@ -200,6 +241,11 @@ class QtSqlDBConnection(object):
         self.conn.setUserName(user)
         self.conn.setPassword(passwd)
 
+        # number of rows the OCI drivers transfer at once
+        self.prefetch = prefetch
+        if prefetch is not None and driver.startswith("QOCI"):
+            self.conn.setConnectOptions("OCI_ATTR_PREFETCH_ROWS=%d" % prefetch)
+
         if not self.conn.open():
             raise ConnectionError(self.conn.lastError().databaseText())
 
@@ -213,8 +259,8 @@ class QtSqlDBConnection(object):
         self.conn.rollback()
 
     def cursor(self):
-        return QtSqlDBCursor(self.conn)
+        return QtSqlDBCursor(self.conn, self.prefetch or 1)
 
 
-def connect(driver, dbname, user, passwd):
-    return QtSqlDBConnection(driver, dbname, user, passwd)
+def connect(driver, dbname, user, passwd, prefetch=None):
+    return QtSqlDBConnection(driver, dbname, user, passwd, prefetch)
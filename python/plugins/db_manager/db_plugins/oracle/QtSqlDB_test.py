@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    QtSqlDB_test.py
+    ---------------------
+    Date                 : October 2026
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+from qgis.testing import start_app, unittest
+from qgis.PyQt.QtCore import QByteArray, QDate, QDateTime, QTime
+
+start_app()
+
+from db_manager.db_plugins.oracle import QtSqlDB
+
+
+class TestDBManagerQtSqlDB(unittest.TestCase):
+
+    """ The DB-API shim is driver agnostic, test it with QSQLITE """
+
+    def setUp(self):
+        self.connection = QtSqlDB.connect("QSQLITE", ":memory:", "", "")
+        c = self.connection.cursor()
+        c.execute("CREATE TABLE test (id INTEGER, name TEXT, value REAL, geom BLOB)")
+        c.executemany("INSERT INTO test VALUES (?, ?, ?, ?)",
+                      [(i, 'name{}'.format(i), i / 2.0, QByteArray(b'\x01')) for i in range(10)])
+        self.assertEqual(c.rowcount, 10)
+        c.close()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_fetch(self):
+        c = self.connection.cursor()
+        c.execute("SELECT id, name, value, geom FROM test ORDER BY id")
+        self.assertEqual([d[0] for d in c.description], ['id', 'name', 'value', 'geom'])
+
+        self.assertEqual(c.fetchone(), [0, 'name0', 0.0, 'GEOMETRY'])
+        self.assertEqual(c.fetchmany(3), [[i, 'name{}'.format(i), i / 2.0, 'GEOMETRY'] for i in range(1, 4)])
+        # arraysize rows by default
+        self.assertEqual(len(c.fetchmany()), 1)
+        self.assertEqual([row[0] for row in c.fetchall()], list(range(5, 10)))
+        self.assertIsNone(c.fetchone())
+        self.assertEqual(c.fetchmany(3), [])
+        c.close()
+
+    def test_arraysize(self):
+        connection = QtSqlDB.connect("QSQLITE", ":memory:", "", "", prefetch=4)
+        c = connection.cursor()
+        self.assertEqual(c.arraysize, 4)
+        c.execute("SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5")
+        self.assertEqual(c.fetchmany(), [[1], [2], [3], [4]])
+        self.assertEqual(c.fetchmany(), [[5]])
+        c.close()
+        connection.close()
+
+    def test_parameters(self):
+        c = self.connection.cursor()
+        c.execute("SELECT name FROM test WHERE id = ?", [3])
+        self.assertEqual(c.fetchall(), [['name3']])
+        c.close()
+
+    def test_executemany(self):
+        c = self.connection.cursor()
+        c.executemany("INSERT INTO test (id, name) VALUES (?, ?)", ((i, None) for i in range(10, 13)))
+        self.assertEqual(c.rowcount, 3)
+
+        # nothing is executed for no parameters
+        c.executemany("INSERT INTO missing VALUES (?)", [])
+        self.assertEqual(c.rowcount, 0)
+
+        c.execute("SELECT COUNT(*) FROM test")
+        self.assertEqual(c.fetchone(), [13])
+        c.close()
+
+    def test_execError(self):
+        c = self.connection.cursor()
+        with self.assertRaises(QtSqlDB.ExecError):
+            c.execute("SELECT * FROM missing")
+        with self.assertRaises(QtSqlDB.ExecError):
+            c.executemany("INSERT INTO missing VALUES (?)", [(1,)])
+        c.close()
+
+    def test_converters(self):
+        self.assertEqual(QtSqlDB._convertDateTime(QDate(2018, 3, 4)), QDate(2018, 3, 4).toString())
+        self.assertEqual(QtSqlDB._convertDateTime(QDateTime(QDate(2018, 3, 4), QTime(5, 6))),
+                         QDateTime(QDate(2018, 3, 4), QTime(5, 6)).toString())
+        self.assertIsNone(QtSqlDB._convertDateTime(None))
+        self.assertEqual(QtSqlDB._convertDateTime('2018-03-04'), '2018-03-04')
+
+        self.assertEqual(QtSqlDB._convertByteArray(QByteArray(b'\x01')), 'GEOMETRY')
+        self.assertIsNone(QtSqlDB._convertByteArray(None))
+
+        self.assertEqual(QtSqlDB._convertValue(QTime(5, 6)), QTime(5, 6).toString())
+        self.assertEqual(QtSqlDB._convertValue(QByteArray(b'\x01')), 'GEOMETRY')
+        self.assertEqual(QtSqlDB._convertValue(1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -47,6 +47,9 @@ def classFactory():
 
 class OracleDBConnector(DBConnector):
 
+    # rows transferred at once by default, as in the Oracle provider
+    PREFETCH_ROWS = 1000
+
     ORGeomTypes = {
         2001: QgsWkbTypes.Point,
         2002: QgsWkbTypes.LineString,
@@ -90,12 +93,14 @@ class OracleDBConnector(DBConnector):
             'onlyExistingTypes').lower() == "true"
         self.includeGeoAttributes = uri.param(
             'includeGeoAttributes').lower() == "true"
+        self.prefetchRows = self._prefetchRows(uri.param('dboptions'))
 
         # For refreshing
         self.populated = False
         try:
             self.connection = QtSqlDB.connect(
-                "QOCISPATIAL", self.dbname, self.user, self.passwd)
+                "QOCISPATIAL", self.dbname, self.user, self.passwd,
+                self.prefetchRows)
 
         except self.connection_error_types() as e:
             raise ConnectionError(e)
@@ -127,6 +132,14 @@ class OracleDBConnector(DBConnector):
         self._checkSpatial()
         self._checkGeometryColumnsTable()
 
+    def _prefetchRows(self, options):
+        """ read OCI_ATTR_PREFETCH_ROWS from the connection options """
+        for option in options.split(';'):
+            name, _, value = option.partition('=')
+            if name.strip() == 'OCI_ATTR_PREFETCH_ROWS' and value.strip().isdigit():
+                return int(value)
+        return self.PREFETCH_ROWS
+
     def _connectionInfo(self):
         return str(self._uri.connectionInfo(True))
 
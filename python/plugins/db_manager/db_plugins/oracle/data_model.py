@@ -53,6 +53,8 @@ class ORTableDataModel(TableDataModel):
             (self.table.schemaName(), self.table.name))
 
         self.cursor = self.db._get_cursor()
+        # the rows are browsed back and forth with scroll()
+        self.cursor.forwardonly = False
         sql = u"SELECT {0} FROM {1}".format(fields_txt, table_txt)
 
         self.db._execute(self.cursor, sql)
@@ -107,6 +107,9 @@ class OracleDBPlugin(DBPlugin):
             settings.value("onlyExistingTypes", False, type=bool)))
         uri.setParam('includeGeoAttributes', str(
             settings.value("includeGeoAttributes", False, type=bool)))
+        # connection options, e.g. OCI_ATTR_PREFETCH_ROWS, shared with the
+        # Oracle provider
+        uri.setParam('dboptions', settings.value("dboptions", "", type=str))
 
         settings.endGroup()
 
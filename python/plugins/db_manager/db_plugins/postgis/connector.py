@@ -24,7 +24,8 @@ The content of this file is based on
 from builtins import str
 from builtins import range
 
-from functools import cmp_to_key
+from functools import wraps
+from operator import itemgetter
 
 from qgis.PyQt.QtCore import QRegExp, QFile
 from qgis.core import Qgis, QgsCredentials, QgsDataSourceUri
@@ -33,6 +34,9 @@ from ..connector import DBConnector
 from ..plugin import ConnectionError, DbError, Table
 
 import os
+import re
+import threading
+import time
 import psycopg2
 import psycopg2.extensions
 # use unicode!
@@ -44,8 +48,115 @@ def classFactory():
     return PostGisDBConnector
 
 
+class PostGisMetadataCache(object):
+
+    """ Results of the catalog queries, kept for TTL seconds or until
+    they are invalidated after a DDL statement """
+
+    TTL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.TTL:
+                return entry[1]
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            # don't keep results read while the catalog was changing
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+class PostGisConnectionPool(object):
+
+    """ Idle connections and catalog metadata shared by the connectors
+    of the same database """
+
+    MAX_IDLE_CONNECTIONS = 2
+
+    _pools = {}
+    _poolsLock = threading.Lock()
+
+    @classmethod
+    def forConnectionInfo(cls, connInfo):
+        with cls._poolsLock:
+            if connInfo not in cls._pools:
+                cls._pools[connInfo] = cls()
+            return cls._pools[connInfo]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []
+        self.metadata = PostGisMetadataCache()
+
+    def take(self):
+        """ return an idle connection, or None if a new one must be opened """
+        with self._lock:
+            while self._idle:
+                connection = self._idle.pop()
+                if not connection.closed:
+                    return connection
+        return None
+
+    def release(self, connection):
+        if connection.closed:
+            return
+
+        try:
+            # reset the session as if the connection was a new one
+            cursor = connection.cursor()
+            cursor.execute(u"DISCARD ALL")
+            cursor.close()
+        except psycopg2.Error:
+            connection.close()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.MAX_IDLE_CONNECTIONS:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+def cachedMetadata(method):
+    """ keep the result of a catalog query in the metadata cache shared
+    by the connectors of the database """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        res = self._pool.metadata.get(key, lambda: method(self, *args, **kwargs))
+        # callers may modify the returned list
+        return list(res) if isinstance(res, list) else res
+
+    return wrapper
+
+
 class PostGisDBConnector(DBConnector):
 
+    # statements changing the catalog, which invalidate the cached metadata
+    DDL_RE = re.compile(r'(^|;)\s*(CREATE|ALTER|DROP|COMMENT|GRANT|REVOKE|SECURITY\s+LABEL)\b', re.IGNORECASE)
+
+    CAPABILITIES = ('user', 'dbname',
+                    'has_spatial', 'has_raster',
+                    'has_geometry_columns', 'has_geometry_columns_access', 'is_geometry_columns_view',
+                    'has_raster_columns', 'has_raster_columns_access', 'is_raster_columns_view')
+
     def __init__(self, uri):
         DBConnector.__init__(self, uri)
 
@@ -62,9 +173,29 @@ class PostGisDBConnector(DBConnector):
             self.dbname = uri.database() or os.environ.get('PGDATABASE') or username
             uri.setDatabase(self.dbname)
 
+        # connectors to the same database reuse idle connections and metadata
+        self._pool = PostGisConnectionPool.forConnectionInfo(self.uri().connectionInfo(False))
+        self._credentials = (username, password)
+        # connections of the cursors returned by _get_transaction_cursor()
+        self._transactionConnections = set()
+        self.connection = self._pool.take()
+        if self.connection is None:
+            self.connection = self._connect(username, password)
+
+        self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+        for attr, value in self._pool.metadata.get(('capabilities',), self._checkCapabilities).items():
+            setattr(self, attr, value)
+
+    def __del__(self):
+        if self.connection is not None:
+            self._pool.release(self.connection)
+        self.connection = None
+
+    def _connect(self, username, password):
         expandedConnInfo = self._connectionInfo()
         try:
-            self.connection = psycopg2.connect(expandedConnInfo)
+            return psycopg2.connect(expandedConnInfo)
         except self.connection_error_types() as e:
             # get credentials if cached or asking to the user no more than 3 times
             err = str(e)
@@ -84,8 +215,9 @@ class PostGisDBConnector(DBConnector):
 
                 newExpandedConnInfo = uri.connectionInfo(True)
                 try:
-                    self.connection = psycopg2.connect(newExpandedConnInfo)
+                    connection = psycopg2.connect(newExpandedConnInfo)
                     QgsCredentials.instance().put(conninfo, username, password)
+                    return connection
                 except self.connection_error_types() as e:
                     if i == 2:
                         raise ConnectionError(e)
@@ -97,8 +229,7 @@ class PostGisDBConnector(DBConnector):
             # clear certs of the first connection try
             self._clearSslTempCertsIfAny(expandedConnInfo)
 
-        self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-
+    def _checkCapabilities(self):
         c = self._execute(None, u"SELECT current_user,current_database()")
         self.user, self.dbname = self._fetchone(c)
         self._close_cursor(c)
@@ -107,6 +238,11 @@ class PostGisDBConnector(DBConnector):
         self._checkRaster()
         self._checkGeometryColumnsTable()
         self._checkRasterColumnsTable()
+        return {attr: getattr(self, attr) for attr in self.CAPABILITIES}
+
+    def invalidateMetadata(self):
+        """ forget the cached metadata of the database """
+        self._pool.metadata.invalidate()
 
     def _connectionInfo(self):
         return str(self.uri().connectionInfo(True))
@@ -186,6 +322,45 @@ class PostGisDBConnector(DBConnector):
     def cancel(self):
         if self.connection:
             self.connection.cancel()
+        for connection in list(self._transactionConnections):
+            connection.cancel()
+
+    def _get_transaction_cursor(self, name):
+        """ return a named cursor on a connection of its own, in a
+        transaction lasting until _close_transaction_cursor() is called.
+
+        The rows of a cursor declared WITH HOLD on the autocommit connection
+        are all computed when its transaction ends, while the rows of this
+        cursor are computed only when they are fetched. """
+        connection = self._pool.take()
+        try:
+            if connection is None:
+                connection = self._connect(*self._credentials)
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+            name = str(name).encode('ascii', 'replace').decode('ascii').replace('?', "_")
+            cursor = connection.cursor(name)
+        except self.connection_error_types() as e:
+            raise ConnectionError(e)
+
+        self._transactionConnections.add(connection)
+        return cursor
+
+    def _close_transaction_cursor(self, c):
+        """ close a cursor returned by _get_transaction_cursor() and end
+        its transaction """
+        if c is None:
+            return
+
+        connection = c.connection
+        self._close_cursor(c)
+        self._transactionConnections.discard(connection)
+        try:
+            # keep the changes made by the query, as in autocommit mode
+            connection.commit()
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        except self.error_types():
+            connection.close()
+        self._pool.release(connection)
 
     def getInfo(self):
         c = self._execute(None, u"SELECT version()")
@@ -222,6 +397,10 @@ class PostGisDBConnector(DBConnector):
     def hasCustomQuerySupport(self):
         return Qgis.QGIS_VERSION[0:3] >= "1.5"
 
+    def hasBackgroundQuerySupport(self):
+        # psycopg2 connections can be shared by threads
+        return True
+
     def hasTableColumnEditingSupport(self):
         return True
 
@@ -237,6 +416,7 @@ class PostGisDBConnector(DBConnector):
             "date", "time", "timestamp"  # date/time
         ]
 
+    @cachedMetadata
     def getDatabasePrivileges(self):
         """ db privileges: (can create schemas, can create temp. tables) """
         sql = u"SELECT has_database_privilege(current_database(), 'CREATE'), has_database_privilege(current_database(), 'TEMP')"
@@ -245,6 +425,7 @@ class PostGisDBConnector(DBConnector):
         self._close_cursor(c)
         return res
 
+    @cachedMetadata
     def getSchemaPrivileges(self, schema):
         """ schema privileges: (can create new objects, can access objects in schema) """
         schema = 'current_schema()' if schema is None else self.quoteString(schema)
@@ -254,6 +435,7 @@ class PostGisDBConnector(DBConnector):
         self._close_cursor(c)
         return res
 
+    @cachedMetadata
     def getTablePrivileges(self, table):
         """ table privileges: (select, insert, update, delete) """
 
@@ -271,6 +453,7 @@ class PostGisDBConnector(DBConnector):
         self._close_cursor(c)
         return res
 
+    @cachedMetadata
     def getSchemas(self):
         """ get list of schemas in tuples: (oid, name, owner, perms) """
         sql = u"SELECT oid, nspname, pg_get_userbyid(nspowner), nspacl, pg_catalog.obj_description(oid) FROM pg_namespace WHERE nspname !~ '^pg_' AND nspname != 'information_schema' ORDER BY nspname"
@@ -280,9 +463,10 @@ class PostGisDBConnector(DBConnector):
         self._close_cursor(c)
         return res
 
+    @cachedMetadata
     def getTables(self, schema=None, add_sys_tables=False):
         """ get list of tables """
-        tablenames = []
+        tablenames = set()
         items = []
 
         sys_tables = ["spatial_ref_sys", "geography_columns", "geometry_columns",
@@ -293,7 +477,7 @@ class PostGisDBConnector(DBConnector):
             for tbl in vectors:
                 if not add_sys_tables and tbl[1] in sys_tables and tbl[2] in ['', 'public']:
                     continue
-                tablenames.append((tbl[2], tbl[1]))
+                tablenames.add((tbl[2], tbl[1]))
                 items.append(tbl)
         except DbError:
             pass
@@ -303,7 +487,7 @@ class PostGisDBConnector(DBConnector):
             for tbl in rasters:
                 if not add_sys_tables and tbl[1] in sys_tables and tbl[2] in ['', 'public']:
                     continue
-                tablenames.append((tbl[2], tbl[1]))
+                tablenames.add((tbl[2], tbl[1]))
                 items.append(tbl)
         except DbError:
             pass
@@ -328,14 +512,15 @@ class PostGisDBConnector(DBConnector):
 
         c = self._execute(None, sql)
         for tbl in self._fetchall(c):
-            if tablenames.count((tbl[1], tbl[0])) <= 0:
+            if (tbl[1], tbl[0]) not in tablenames:
                 item = list(tbl)
                 item.insert(0, Table.TableType)
                 items.append(item)
         self._close_cursor(c)
 
-        return sorted(items, key=cmp_to_key(lambda x, y: (x[1] > y[1]) - (x[1] < y[1])))
+        return sorted(items, key=itemgetter(1))
 
+    @cachedMetadata
     def getVectorTables(self, schema=None):
         """ get list of table with a geometry column
                 it returns:
@@ -404,6 +589,7 @@ class PostGisDBConnector(DBConnector):
 
         return items
 
+    @cachedMetadata
     def getRasterTables(self, schema=None):
         """ get list of table with a raster column
                 it returns:
@@ -482,6 +668,7 @@ class PostGisDBConnector(DBConnector):
         self._close_cursor(c)
         return res
 
+    @cachedMetadata
     def getTableFields(self, table):
         """ return list of columns in table """
 
@@ -980,13 +1167,18 @@ class PostGisDBConnector(DBConnector):
     def connection_error_types(self):
         return psycopg2.InterfaceError, psycopg2.OperationalError
 
-    # moved into the parent class: DbConnector._execute()
-    # def _execute(self, cursor, sql):
-    #       pass
+    def _execute(self, cursor, sql):
+        cursor = DBConnector._execute(self, cursor, sql)
+        if self.DDL_RE.search(sql):
+            self.invalidateMetadata()
+        return cursor
 
-    # moved into the parent class: DbConnector._execute_and_commit()
-    # def _execute_and_commit(self, sql):
-    #       pass
+    def _execute_and_commit(self, sql):
+        # the actions run this way change tables, columns, constraints...
+        try:
+            DBConnector._execute_and_commit(self, sql)
+        finally:
+            self.invalidateMetadata()
 
     # moved into the parent class: DbConnector._get_cursor()
     # def _get_cursor(self, name=None):
@@ -71,6 +71,32 @@ class TestDBManagerPostgisConnector(unittest.TestCase):
 
     # TODO: add service-only test (requires a ~/.pg_service.conf file)
 
+    def test_connectionPool(self):
+        c = PostGisDBConnector(QgsDataSourceUri())
+        connection = c.connection
+        del c
+
+        # the connection of the deleted connector is reused
+        c = PostGisDBConnector(QgsDataSourceUri())
+        self.assertIs(c.connection, connection)
+
+    def test_metadataCache(self):
+        c1 = PostGisDBConnector(QgsDataSourceUri())
+        c2 = PostGisDBConnector(QgsDataSourceUri())
+        self.assertIsNot(c1.connection, c2.connection)
+
+        schemas = [s[1] for s in c1.getSchemas()]
+        self.assertNotIn('qgis_test_metadata_cache', schemas)
+        self.assertEqual([s[1] for s in c2.getSchemas()], schemas)
+
+        # DDL statements invalidate the metadata shared by the connectors
+        c1._execute(None, "CREATE SCHEMA qgis_test_metadata_cache")
+        try:
+            self.assertIn('qgis_test_metadata_cache', [s[1] for s in c2.getSchemas()])
+        finally:
+            c1._execute(None, "DROP SCHEMA qgis_test_metadata_cache")
+        self.assertNotIn('qgis_test_metadata_cache', [s[1] for s in c2.getSchemas()])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -20,8 +20,12 @@ email                : brush.tyler@gmail.com
  ***************************************************************************/
 """
 
+import bisect
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 from qgis.core import QgsMessageLog
-from ..plugin import BaseError
+from ..plugin import BaseError, DbError, TableConstraint
 from ..data_model import (TableDataModel,
                           SqlResultModel,
                           SqlResultModelAsync,
@@ -30,8 +34,22 @@ from ..data_model import (TableDataModel,
 
 class PGTableDataModel(TableDataModel):
 
+    """ Browse the rows of a table window by window.
+
+    Tables with a primary key are paged by key (keyset pagination), the
+    other relations are read from a server side cursor. Only the shown
+    window is kept in memory and the next one is prefetched in a
+    background thread. """
+
     def __init__(self, table, parent=None):
         self.cursor = None
+        self.keyFields = []
+        self.keyTypes = []
+        # row number -> primary key of that row, used to start the next windows
+        self.bookmarks = {}
+        self.bookmarkRows = []
+        self.executor = None
+        self.prefetched = None
         TableDataModel.__init__(self, table, parent)
 
         if self.table.rowCount is None:
@@ -39,16 +57,53 @@ class PGTableDataModel(TableDataModel):
             if self.table.rowCount is None:
                 return
 
+        self.keyFields = self._primaryKeyFields()
+        self.keyTypes = self._keyTypes()
+        # a single thread runs the queries, so the cursor is never used concurrently
+        self.executor = ThreadPoolExecutor(max_workers=1)
         self.table.aboutToChange.connect(self._deleteCursor)
-        self._createCursor()
+
+    def _primaryKeyFields(self):
+        """ the primary key fields in the key order """
+        for con in self.table.constraints() or []:
+            if con.type == TableConstraint.TypePrimaryKey:
+                fields = con.fields()
+                if all(num in fields for num in con.columns):
+                    return [fields[num] for num in con.columns]
+        return []
+
+    def _keyTypes(self):
+        """ the schema qualified types of the primary key fields, so that
+        casts to them don't depend on the search_path """
+        if not self.keyFields:
+            return []
+        sql = u"""SELECT a.attnum, quote_ident(n.nspname) || '.' || quote_ident(t.typname)
+                        FROM pg_attribute a
+                        JOIN pg_type t ON t.oid = a.atttypid
+                        JOIN pg_namespace n ON n.oid = t.typnamespace
+                        WHERE a.attrelid = %s::regclass AND a.attnum IN (%s)""" % (
+            self.db.quoteString(self.db.quoteId((self.table.schemaName(), self.table.name))),
+            u", ".join(str(fld.num) for fld in self.keyFields))
+        c = self.db._execute(None, sql)
+        types = dict(self.db._fetchall(c))
+        self.db._close_cursor(c)
+        return [types[fld.num] for fld in self.keyFields]
 
     def _createCursor(self):
         fields_txt = u", ".join(self.fields)
         table_txt = self.db.quoteId((self.table.schemaName(), self.table.name))
 
-        self.cursor = self.db._get_cursor()
+        # the cursor is not held past its transaction, so that its rows are
+        # computed only when they are fetched
+        self.cursor = self.db._get_transaction_cursor('db_manager_table_data')
+        self.cursor.scrollable = True
         sql = u"SELECT %s FROM %s" % (fields_txt, table_txt)
-        self.db._execute(self.cursor, sql)
+        try:
+            self.db._execute(self.cursor, sql)
+        except BaseError:
+            self.db._close_transaction_cursor(self.cursor)
+            self.cursor = None
+            raise
 
     def _sanitizeTableField(self, field):
         # get fields, ignore geometry columns
@@ -61,27 +116,113 @@ class PGTableDataModel(TableDataModel):
         return u"%s::text" % self.db.quoteId(field.name)
 
     def _deleteCursor(self):
-        self.db._close_cursor(self.cursor)
+        if self.prefetched is not None:
+            self.prefetched[1].cancel()
+            self.prefetched = None
+        if self.executor is not None:
+            # wait for the running query before closing its cursor
+            self.executor.submit(lambda: None).result()
+        self.bookmarks = {}
+        self.bookmarkRows = []
+        self.db._close_transaction_cursor(self.cursor)
         self.cursor = None
 
     def __del__(self):
+        if self.executor is None:
+            return
         self.table.aboutToChange.disconnect(self._deleteCursor)
         self._deleteCursor()
-        pass  # print "PGTableModel.__del__"
+        self.executor.shutdown(wait=False)
 
-    def fetchMoreData(self, row_start):
+    def _keysetQuery(self, row_start):
+        """ query reading the window starting at row_start after the nearest known key """
+        keys_txt = u", ".join(self.db.quoteId(fld.name) for fld in self.keyFields)
+        table_txt = self.db.quoteId((self.table.schemaName(), self.table.name))
+        sql = u"SELECT %s, %s FROM %s" % (u", ".join(self.fields),
+                                          u", ".join(u"%s::text" % self.db.quoteId(fld.name) for fld in self.keyFields),
+                                          table_txt)
+
+        offset = row_start
+        pos = bisect.bisect_left(self.bookmarkRows, row_start) - 1
+        if pos >= 0:
+            row = self.bookmarkRows[pos]
+            values_txt = u", ".join(u"%s::%s" % (self.db.quoteString(value), keyType)
+                                    for keyType, value in zip(self.keyTypes, self.bookmarks[row]))
+            sql += u" WHERE (%s) > (%s)" % (keys_txt, values_txt)
+            offset = row_start - row - 1
+
+        sql += u" ORDER BY %s" % keys_txt
+        if offset > 0:
+            sql += u" OFFSET %d" % offset
+        sql += u" LIMIT %d" % self.fetchedCount
+        return sql
+
+    def _fetchKeysetWindow(self, sql):
+        c = self.db._execute(None, sql)
+        rows = self.db._fetchall(c)
+        self.db._close_cursor(c)
+        return rows
+
+    def _fetchCursorWindow(self, row_start, retry=True):
         if not self.cursor:
             self._createCursor()
 
         try:
             self.cursor.scroll(row_start, mode='absolute')
+            return self.cursor.fetchmany(self.fetchedCount)
         except self.db.error_types():
-            self._deleteCursor()
-            return self.fetchMoreData(row_start)
+            # the cursor is lost when it's closed on the server, declare it again
+            self.db._close_transaction_cursor(self.cursor)
+            self.cursor = None
+            if not retry:
+                raise
+            return self._fetchCursorWindow(row_start, False)
+
+    def _submitWindow(self, row_start):
+        if self.keyFields:
+            return self.executor.submit(self._fetchKeysetWindow, self._keysetQuery(row_start))
+        return self.executor.submit(self._fetchCursorWindow, row_start)
+
+    def getData(self, row, col):
+        if row < self.fetchedFrom or row >= self.fetchedFrom + self.fetchedCount:
+            # windows are aligned, so that scrolling down uses the prefetched one
+            self.fetchMoreData(row - row % self.fetchedCount)
+        offset = row - self.fetchedFrom
+        if offset < 0 or offset >= len(self.resdata):
+            # the table changed since its rows were counted
+            return None
+        return self.resdata[offset][col]
 
-        self.resdata = self.cursor.fetchmany(self.fetchedCount)
+    def fetchMoreData(self, row_start):
+        if self.executor is None:
+            return
+
+        if self.prefetched is not None and self.prefetched[0] == row_start:
+            future = self.prefetched[1]
+        else:
+            if self.prefetched is not None:
+                self.prefetched[1].cancel()
+            future = self._submitWindow(row_start)
+        self.prefetched = None
+
+        rows = future.result()
+        if self.keyFields:
+            keyCount = len(self.keyFields)
+            if rows:
+                last = row_start + len(rows) - 1
+                if last not in self.bookmarks:
+                    bisect.insort(self.bookmarkRows, last)
+                self.bookmarks[last] = rows[-1][-keyCount:]
+            rows = [row[:-keyCount] for row in rows]
+
+        self.resdata = rows
         self.fetchedFrom = row_start
 
+        # read the next window while the current one is shown
+        next_start = row_start + len(rows)
+        if len(rows) == self.fetchedCount and next_start < self.rowCount():
+            self.prefetched = (next_start, self._submitWindow(next_start))
+
 
 class PGSqlResultModelTask(SqlResultModelTask):
 
@@ -113,4 +254,42 @@ class PGSqlResultModelAsync(SqlResultModelAsync):
 
 
 class PGSqlResultModel(SqlResultModel):
-    pass
+
+    # statements which can be declared as a cursor
+    CURSOR_STATEMENT_RE = re.compile(r'^\s*(SELECT|WITH|VALUES|TABLE)\b', re.IGNORECASE)
+
+    def _executeSql(self, sql):
+        """ read the results of a single query from a server side cursor,
+        so that the rows are transferred only when the view shows them """
+        query = sql.strip().rstrip(';')
+        if not self.CURSOR_STATEMENT_RE.match(query) or ';' in query:
+            return super()._executeSql(sql)
+
+        # the cursor is not held past its transaction, so that its rows are
+        # computed only when they are fetched
+        c = self.db._get_transaction_cursor('db_manager_sql_result')
+        c.scrollable = True
+        try:
+            return self.db._execute(c, query)
+        except DbError:
+            # e.g. a data modifying WITH query can't be declared as cursor
+            self.db._close_transaction_cursor(c)
+            return super()._executeSql(sql)
+
+    def _isServerSideCursor(self, c):
+        return c.name is not None
+
+    def _closeCursor(self):
+        if self._cursor is None:
+            return
+
+        self.db._close_transaction_cursor(self._cursor)
+        self._cursor = None
+
+    def _readRows(self, start):
+        c = self._cursor
+        rows = super()._readRows(start)
+        if self._cursor is None:
+            # the cursor was lost, end its transaction
+            self.db._close_transaction_cursor(c)
+        return rows
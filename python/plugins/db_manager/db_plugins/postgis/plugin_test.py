@@ -40,6 +40,13 @@ from db_manager.db_plugins.plugin import Table
 from db_manager.db_plugins.postgis.connector import PostGisDBConnector
 
 
+class SmallPagesSqlResultModel(PGSqlResultModel):
+
+    PAGE_SIZE = 10
+    MAX_CACHED_PAGES = 2
+    ROW_LIMIT = 30
+
+
 class TestDBManagerPostgisPlugin(unittest.TestCase):
 
     @classmethod
@@ -143,6 +150,119 @@ class TestDBManagerPostgisPlugin(unittest.TestCase):
         dat = res.getData(0, 0)
         self.assertEqual(dat, u"é")
 
+    def test_sqlResultModelStreaming(self):
+        os.environ['PGDATABASE'] = self.testdb
+        obj = QObject() # needs to be kept alive
+        database = PGDatabase(obj, QgsDataSourceUri())
+
+        model = SmallPagesSqlResultModel(database, "SELECT generate_series(1, 45) AS num", obj)
+        self.assertEqual(model.columnNames(), ['num'])
+        # only the first page is read
+        self.assertEqual(model.rowCount(), 10)
+        self.assertEqual(model.affectedRows(), 10)
+        self.assertTrue(model.hasMoreRows())
+        self.assertTrue(model.canFetchMore())
+
+        # the next pages are read up to the row limit
+        fetched = []
+        model.rowsFetched.connect(lambda: fetched.append(model.rowCount()))
+        model.fetchMore()
+        model.fetchMore()
+        self.assertEqual(fetched, [20, 30])
+        self.assertEqual(model.rowCount(), 30)
+        self.assertFalse(model.canFetchMore())
+        self.assertTrue(model.hasMoreRows())
+        model.fetchMore()
+        self.assertEqual(model.rowCount(), 30)
+
+        # the oldest page was dropped from the cache, it's read again
+        self.assertNotIn(0, model._pages)
+        self.assertEqual([model.getData(row, 0) for row in (0, 9, 25, 10)], [1, 10, 26, 11])
+        self.assertLessEqual(len(model._pages), model.MAX_CACHED_PAGES)
+
+        # "Fetch more rows" raises the limit until the last rows
+        model.fetchMoreRows()
+        self.assertEqual(model.rowCount(), 40)
+        self.assertTrue(model.canFetchMore())
+        model.fetchMore()
+        self.assertEqual(model.rowCount(), 45)
+        self.assertFalse(model.hasMoreRows())
+        self.assertFalse(model.canFetchMore())
+        self.assertEqual([model.getData(row, 0) for row in (44, 5, 45)], [45, 6, None])
+
+        model.close()
+        self.assertIsNone(model._cursor)
+
+        # the results of other statements are read at once
+        model = SmallPagesSqlResultModel(database, "SELECT generate_series(1, 15); SELECT generate_series(1, 25)", obj)
+        self.assertEqual(model.rowCount(), 25)
+        self.assertFalse(model.hasMoreRows())
+        self.assertEqual(model.getData(24, 0), 25)
+
+    def _tableDataModel(self, database, schema, name, parent):
+        table = [t for t in database.tables() if t.schemaName() == schema and t.name == name][0]
+        model = table.tableDataModel(parent)
+        model.fetchedCount = 3
+        return model
+
+    def test_tableDataModel(self):
+        os.environ['PGDATABASE'] = self.testdb
+        obj = QObject() # needs to be kept alive
+        database = PGDatabase(obj, QgsDataSourceUri())
+        connector = database.connector
+        connector._execute_and_commit("""
+            DROP SCHEMA IF EXISTS qgis_test_dbmanager CASCADE;
+            CREATE SCHEMA qgis_test_dbmanager;
+            CREATE TYPE qgis_test_dbmanager.letter AS ENUM ('c', 'b', 'a');
+            CREATE TABLE qgis_test_dbmanager.keyed (
+                letter qgis_test_dbmanager.letter, num integer, PRIMARY KEY (letter, num));
+            INSERT INTO qgis_test_dbmanager.keyed
+                SELECT letter, num FROM unnest(enum_range(NULL::qgis_test_dbmanager.letter)) letter,
+                    generate_series(1, 4) num;
+            CREATE TABLE qgis_test_dbmanager.unkeyed (num integer);
+            INSERT INTO qgis_test_dbmanager.unkeyed SELECT generate_series(1, 10);
+        """)
+
+        try:
+            # paged by key, in the enum order, with a cast to an enum out
+            # of the search_path
+            model = self._tableDataModel(database, 'qgis_test_dbmanager', 'keyed', obj)
+            self.assertEqual(model.keyFields[0].name, 'letter')
+            self.assertEqual(model.keyTypes, ['qgis_test_dbmanager.letter', 'pg_catalog.int4'])
+            self.assertEqual(model.rowCount(), 12)
+            expected = [[letter, str(num)] for letter in 'cba' for num in range(1, 5)]
+            self.assertEqual([[model.getData(row, col) for col in range(2)] for row in range(12)], expected)
+            # the next window is read after the known keys
+            self.assertIn(5, model.bookmarks)
+            self.assertIn('WHERE', model._keysetQuery(6))
+            # and read backwards from the nearest key
+            self.assertEqual([model.getData(row, 1) for row in (4, 0, 11)], ['1', '1', '4'])
+
+            # the next window is prefetched
+            model.getData(3, 0)
+            self.assertIsNotNone(model.prefetched)
+            self.assertEqual(model.prefetched[0], 6)
+            self.assertEqual(model.prefetched[1].result(), [('b', '3', 'b', '3'), ('b', '4', 'b', '4'), ('a', '1', 'a', '1')])
+            self.assertEqual(model.getData(6, 0), 'b')
+            self.assertEqual(model.fetchedFrom, 6)
+            del model
+
+            # the relations without a primary key are read from a cursor
+            model = self._tableDataModel(database, 'qgis_test_dbmanager', 'unkeyed', obj)
+            self.assertEqual(model.keyFields, [])
+            self.assertEqual(model.rowCount(), 10)
+            self.assertEqual([model.getData(row, 0) for row in range(10)], [str(num) for num in range(1, 11)])
+            self.assertIsNotNone(model.cursor)
+            self.assertEqual([model.getData(row, 0) for row in (2, 9, 0)], ['3', '10', '1'])
+            # the cursor is declared again when it's lost
+            model.prefetched[1].result()
+            model.cursor.close()
+            self.assertEqual(model.getData(9, 0), '10')
+            self.assertFalse(model.cursor.closed)
+            del model
+        finally:
+            connector._execute_and_commit("DROP SCHEMA qgis_test_dbmanager CASCADE")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -37,6 +37,7 @@ from qgis.core import QgsProject, QgsApplication, QgsTask, QgsSettings
 from qgis.utils import OverrideCursor
 
 from .db_plugins.plugin import BaseError
+from .db_plugins.data_model import SqlResultModel
 from .db_plugins.postgis.plugin import PGDatabase
 from .dlg_db_error import DlgDbError
 from .dlg_query_builder import QueryBuilderDlg
@@ -89,6 +90,8 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
         self.history = settings.value('DB_Manager/queryHistory/' + self.dbType, {self.connectionName: []})
         if self.connectionName not in self.history:
             self.history[self.connectionName] = []
+        # history entry of the shown results, its rows are counted while they are read
+        self.historyEntry = None
 
         self.queryHistoryWidget.setVisible(False)
         self.queryHistoryTableWidget.verticalHeader().hide()
@@ -100,6 +103,9 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
         self.btnCancel.setEnabled(False)
         self.btnCancel.clicked.connect(self.executeSqlCanceled)
         self.btnCancel.setShortcut(QKeySequence.Cancel)
+
+        self.btnFetchMore.setVisible(False)
+        self.btnFetchMore.clicked.connect(self.fetchMoreRows)
         self.progressBar.setEnabled(False)
         self.progressBar.setRange(0, 100)
         self.progressBar.setValue(0)
@@ -179,25 +185,43 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
             queryItem = QTableWidgetItem(dictlist[i]['query'])
             rowsItem = QTableWidgetItem(str(dictlist[i]['rows']))
             durationItem = QTableWidgetItem(str(dictlist[i]['secs']))
+            firstRowItem = QTableWidgetItem(str(dictlist[i].get('firstRowSecs', '')))
             self.queryHistoryTableWidget.setItem(0, 0, queryItem)
             self.queryHistoryTableWidget.setItem(0, 1, rowsItem)
             self.queryHistoryTableWidget.setItem(0, 2, durationItem)
+            self.queryHistoryTableWidget.setItem(0, 3, firstRowItem)
 
         self.queryHistoryTableWidget.resizeColumnsToContents()
         self.queryHistoryTableWidget.resizeRowsToContents()
 
-    def writeQueryHistory(self, sql, affectedRows, secs):
+    def writeQueryHistory(self, sql, affectedRows, secs, firstRowSecs=None):
         if len(self.history[self.connectionName]) >= self.QUERY_HISTORY_LIMIT:
             self.history[self.connectionName].pop(0)
 
         settings = QgsSettings()
         self.history[self.connectionName].append({'query': sql,
                                                   'rows': affectedRows,
-                                                  'secs': secs})
+                                                  'secs': secs,
+                                                  'firstRowSecs': firstRowSecs if firstRowSecs is not None else secs})
         settings.setValue('DB_Manager/queryHistory/' + self.dbType, self.history)
 
         self.populateQueryHistory()
 
+    def queryHistoryRows(self, model):
+        """ the row count of the results, marked as partial while they are not all read """
+        if isinstance(model, SqlResultModel) and model.hasMoreRows():
+            return u"{0}+".format(model.affectedRows())
+        return model.affectedRows()
+
+    def updateQueryHistoryRows(self):
+        model = self.viewResult.model()
+        if self.historyEntry is None or model is None:
+            return
+
+        self.historyEntry['rows'] = self.queryHistoryRows(model)
+        QgsSettings().setValue('DB_Manager/queryHistory/' + self.dbType, self.history)
+        self.populateQueryHistory()
+
     def getQueryHash(self, name):
         return 'q%s' % md5(name.encode('utf8')).hexdigest()
 
@@ -338,14 +362,19 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
                 quotedCols = []
 
                 self.viewResult.setModel(model)
-                self.lblResult.setText(self.tr("{0} rows, {1:.3f} seconds").format(model.affectedRows(), model.secs()))
+                if isinstance(model, SqlResultModel):
+                    model.rowsFetched.connect(self.updateResultLabel)
+                    model.rowsFetched.connect(self.updateQueryHistoryRows)
+                self.updateResultLabel()
                 cols = self.viewResult.model().columnNames()
                 for col in cols:
                     quotedCols.append(self.db.connector.quoteId(col))
 
                 self.setColumnCombos(cols, quotedCols)
 
-                self.writeQueryHistory(self.modelAsync.task.sql, model.affectedRows(), model.secs())
+                firstRowSecs = model.firstRowSecs() if isinstance(model, SqlResultModel) else model.secs()
+                self.writeQueryHistory(self.modelAsync.task.sql, self.queryHistoryRows(model), model.secs(), firstRowSecs)
+                self.historyEntry = self.history[self.connectionName][-1]
                 self.update()
             elif not self.modelAsync.canceled:
                 DlgDbError.showError(self.modelAsync.error, self)
@@ -353,6 +382,27 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
                 self.geomCombo.clear()
                 pass
 
+    def updateResultLabel(self):
+        model = self.viewResult.model()
+        if not isinstance(model, SqlResultModel):
+            self.lblResult.setText(self.tr("{0} rows, {1:.3f} seconds").format(model.affectedRows(), model.secs()))
+            self.btnFetchMore.setVisible(False)
+            return
+
+        if model.hasMoreRows():
+            self.lblResult.setText(self.tr("{0}+ rows, {1:.3f} seconds to first row, {2:.3f} seconds").format(
+                model.affectedRows(), model.firstRowSecs(), model.secs()))
+        else:
+            self.lblResult.setText(self.tr("{0} rows, {1:.3f} seconds").format(model.affectedRows(), model.secs()))
+        # the view reads the next pages while scrolling until the row limit is reached
+        self.btnFetchMore.setVisible(model.hasMoreRows() and not model.canFetchMore())
+
+    def fetchMoreRows(self):
+        model = self.viewResult.model()
+        if isinstance(model, SqlResultModel):
+            with OverrideCursor(Qt.WaitCursor):
+                model.fetchMoreRows()
+
     def executeSql(self):
 
         sql = self._getSqlQuery()
@@ -362,7 +412,12 @@ class DlgSqlWindow(QWidget, Ui_Dialog):
         # delete the old model
         old_model = self.viewResult.model()
         self.viewResult.setModel(None)
+        self.btnFetchMore.setVisible(False)
+        self.historyEntry = None
         if old_model:
+            if isinstance(old_model, SqlResultModel):
+                # release the server side cursor before running the next query
+                old_model.close()
             old_model.deleteLater()
 
         try:
@@ -108,6 +108,11 @@ class GdalAlgorithmProvider(QgsProcessingProvider):
             GdalUtils.GDAL_HELP_PATH,
             self.tr('Location of GDAL docs'),
             GdalUtils.gdalHelpPath()))
+        ProcessingConfig.addSetting(Setting(
+            self.name(),
+            GdalUtils.GDAL_IN_PROCESS,
+            self.tr('Run gdal_translate, gdalwarp and ogr2ogr in-process when possible'),
+            False))
         ProcessingConfig.readSettings()
         self.refreshAlgorithms()
         return True
@@ -115,6 +120,7 @@ class GdalAlgorithmProvider(QgsProcessingProvider):
     def unload(self):
         ProcessingConfig.removeSetting('ACTIVATE_GDAL')
         ProcessingConfig.removeSetting(GdalUtils.GDAL_HELP_PATH)
+        ProcessingConfig.removeSetting(GdalUtils.GDAL_IN_PROCESS)
 
     def isActive(self):
         return ProcessingConfig.getSetting('ACTIVATE_GDAL')
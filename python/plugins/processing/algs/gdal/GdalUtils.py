@@ -61,6 +61,40 @@ except:
 
 class GdalUtils:
     GDAL_HELP_PATH = 'GDAL_HELP_PATH'
+    GDAL_IN_PROCESS = 'GDAL_IN_PROCESS'
+
+    # utilities which can be run in-process, with the names of the matching
+    # osgeo.gdal function and options function
+    IN_PROCESS_UTILITIES = {
+        'gdal_translate': ('Translate', 'TranslateOptions'),
+        'gdalwarp': ('Warp', 'WarpOptions'),
+        'ogr2ogr': ('VectorTranslate', 'VectorTranslateOptions'),
+    }
+
+    # double quoted argument, escaped as done by escapeAndJoin, or plain one
+    ARGUMENT_RE = re.compile(r'"((?:[^"\\]|\\.)*)"(?!\S)|(\S+)')
+
+    # number of values taken by each ogr2ogr option, used to find the
+    # destination, source and layer names among its arguments. None
+    # marks the options taking either 4 coordinates or a single value
+    OGR2OGR_OPTION_VALUES = {
+        '-append': 0, '-update': 0, '-overwrite': 0, '-progress': 0,
+        '-preserve_fid': 0, '-skipfailures': 0, '-wrapdateline': 0,
+        '-explodecollections': 0, '-forceNullable': 0, '-unsetDefault': 0,
+        '-unsetFid': 0, '-nomd': 0, '-noNativeData': 0, '-q': 0, '-quiet': 0,
+        '-splitlistfields': 0, '-addfields': 0, '-unsetFieldWidth': 0,
+        '-relaxedFieldNameMatch': 0, '-ds_transaction': 0, '-tps': 0,
+        '-f': 1, '-of': 1, '-dsco': 1, '-lco': 1, '-oo': 1, '-doo': 1,
+        '-a_srs': 1, '-t_srs': 1, '-s_srs': 1, '-ct': 1, '-sql': 1,
+        '-dialect': 1, '-where': 1, '-select': 1, '-spat_srs': 1,
+        '-geomfield': 1, '-nln': 1, '-nlt': 1, '-dim': 1, '-gt': 1,
+        '-segmentize': 1, '-simplify': 1, '-datelineoffset': 1,
+        '-clipsrcsql': 1, '-clipsrclayer': 1, '-clipsrcwhere': 1,
+        '-clipdstsql': 1, '-clipdstlayer': 1, '-clipdstwhere': 1,
+        '-fid': 1, '-zfield': 1, '-fieldmap': 1, '-fieldTypeToString': 1,
+        '-mapFieldType': 1, '-maxsubfields': 1, '-limit': 1, '-order': 1,
+        '-mo': 1, '-pg': 1, '-spat': 4, '-clipsrc': None, '-clipdst': None,
+    }
 
     supportedRasters = None
     supportedOutputRasters = None
@@ -69,6 +103,9 @@ class GdalUtils:
     def runGdal(commands, feedback=None):
         if feedback is None:
             feedback = QgsProcessingFeedback()
+        if ProcessingConfig.getSetting(GdalUtils.GDAL_IN_PROCESS) and GdalUtils.runGdalInProcess(commands, feedback):
+            return
+
         envval = os.getenv('PATH')
         # We need to give some extra hints to get things picked up on OS X
         isDarwin = False
@@ -122,6 +159,181 @@ class GdalUtils:
             QgsMessageLog.logMessage('\n'.join(loglines), 'Processing', Qgis.Info)
             GdalUtils.consoleOutput = loglines
 
+    @staticmethod
+    def runGdalInProcess(commands, feedback):
+        """
+        Runs a gdal_translate, gdalwarp or ogr2ogr command in the current
+        process, through the osgeo.gdal utility functions, which avoids
+        starting a new process and registering the drivers for each run.
+
+        Returns False without running anything if the command cannot be
+        run in-process, in which case it must be run with runGdal.
+        """
+
+        def progress(complete, message, data):
+            feedback.setProgress(100 * complete)
+            return 0 if feedback.isCanceled() else 1
+
+        call = GdalUtils.inProcessCall(commands, progress)
+        if call is None:
+            return False
+        function, destination, source, options = call
+
+        fused_command = ' '.join([str(c) for c in commands])
+        QgsMessageLog.logMessage(fused_command, 'Processing', Qgis.Info)
+        feedback.pushInfo('GDAL command (in-process):')
+        feedback.pushCommandInfo(fused_command)
+        feedback.pushInfo('GDAL command output:')
+
+        loglines = []
+        loglines.append('GDAL execution console output')
+
+        def log(error_class, error_number, message):
+            feedback.pushConsoleInfo(message)
+            loglines.append(message)
+
+        gdal.PushErrorHandler(log)
+        try:
+            dataset = function(destination, source, options=options)
+            if dataset is None and not feedback.isCanceled():
+                feedback.reportError('GDAL command failed')
+            # closing the dataset flushes it to disk
+            dataset = None
+        except RuntimeError as e:
+            feedback.reportError(str(e))
+            loglines.append(str(e))
+        finally:
+            gdal.PopErrorHandler()
+
+        QgsMessageLog.logMessage('\n'.join(loglines), 'Processing', Qgis.Info)
+        GdalUtils.consoleOutput = loglines
+        return True
+
+    @staticmethod
+    def inProcessCall(commands, callback=None):
+        """
+        Translates a GDAL command to a (function, destination, source,
+        options) tuple to run it with the osgeo.gdal utility functions,
+        or returns None if the command cannot be run in-process.
+        """
+        if not gdalAvailable or not commands:
+            return None
+
+        utility = os.path.basename(str(commands[0]))
+        if utility.lower().endswith('.exe'):
+            utility = utility[:-4]
+        if utility not in GdalUtils.IN_PROCESS_UTILITIES:
+            return None
+
+        function_name, options_name = GdalUtils.IN_PROCESS_UTILITIES[utility]
+        if not hasattr(gdal, function_name) or not hasattr(gdal, options_name):
+            return None
+        function = getattr(gdal, function_name)
+        options_function = getattr(gdal, options_name)
+
+        arguments = GdalUtils.splitArguments(' '.join([str(c) for c in commands[1:]]))
+        if arguments is None:
+            return None
+        # general options (--config...) and shell constructs are only
+        # supported by the command line utilities
+        if any(a.startswith('--') or a in ('|', '||', '&&', ';', '<', '>', '>>') for a in arguments):
+            return None
+
+        if utility == 'ogr2ogr':
+            # ogr2ogr [options] destination source [layer...]
+            split = GdalUtils.splitOgr2ogrArguments(arguments)
+            if split is None:
+                return None
+            options, positional = split
+            if len(positional) < 2:
+                return None
+            destination, source = positional[:2]
+            options = GdalUtils.inProcessOptions(options_function, options, callback, layers=positional[2:])
+            if options is None:
+                return None
+            return function, destination, source, options
+
+        # gdal_translate/gdalwarp [options] source destination
+        if len(arguments) < 2:
+            return None
+        source, destination = arguments[-2:]
+        if source.startswith('-') or destination.startswith('-'):
+            return None
+        options = GdalUtils.inProcessOptions(options_function, arguments[:-2], callback)
+        if options is None:
+            return None
+        return function, destination, source, options
+
+    @staticmethod
+    def splitArguments(command):
+        """
+        Splits a command joined by escapeAndJoin into its arguments, or
+        returns None if it has unbalanced quotes. Unlike shlex, backslashes
+        are only escapes in quoted arguments, so that Windows paths are kept.
+        """
+        arguments = []
+        for match in GdalUtils.ARGUMENT_RE.finditer(command):
+            quoted, plain = match.groups()
+            if plain is None:
+                arguments.append(re.sub(r'\\(.)', r'\1', quoted))
+            elif '"' in plain:
+                return None
+            else:
+                arguments.append(plain)
+        return arguments
+
+    @staticmethod
+    def splitOgr2ogrArguments(arguments):
+        """
+        Splits the arguments of ogr2ogr into its options and its positional
+        arguments, or returns None if an option is unknown or takes an
+        ambiguous number of values.
+        """
+        options = []
+        positional = []
+        i = 0
+        while i < len(arguments):
+            argument = arguments[i]
+            if not argument.startswith('-') or len(argument) == 1:
+                positional.append(argument)
+                i += 1
+                continue
+
+            if argument not in GdalUtils.OGR2OGR_OPTION_VALUES:
+                return None
+            count = GdalUtils.OGR2OGR_OPTION_VALUES[argument]
+            if count is None:
+                # -clipsrc/-clipdst take xmin ymin xmax ymax, or a single WKT,
+                # datasource or spat_extent value
+                try:
+                    float(arguments[i + 1])
+                    count = 4
+                except (IndexError, ValueError):
+                    count = 1
+            if i + count >= len(arguments):
+                return None
+            options.extend(arguments[i:i + count + 1])
+            i += count + 1
+        return options, positional
+
+    @staticmethod
+    def inProcessOptions(options_function, arguments, callback, **kwargs):
+        """
+        Parses the arguments of a GDAL utility with an osgeo.gdal options
+        function, returning None if they are not supported.
+        """
+        gdal.ErrorReset()
+        gdal.PushErrorHandler('CPLQuietErrorHandler')
+        try:
+            options = options_function(options=arguments, callback=callback, **kwargs)
+        except (RuntimeError, TypeError):
+            return None
+        finally:
+            gdal.PopErrorHandler()
+        if gdal.GetLastErrorType() >= gdal.CE_Failure:
+            return None
+        return options
+
     @staticmethod
     def getConsoleOutput():
         return GdalUtils.consoleOutput
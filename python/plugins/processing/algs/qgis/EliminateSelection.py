@@ -30,13 +30,11 @@ import os
 from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import (QgsApplication,
-                       QgsFeatureRequest,
-                       QgsFeature,
                        QgsFeatureSink,
                        QgsGeometry,
                        QgsProcessingAlgorithm,
                        QgsProcessingException,
-                       QgsProcessingUtils,
+                       QgsSpatialIndex,
                        QgsProcessingParameterVectorLayer,
                        QgsProcessingParameterEnum,
                        QgsProcessing,
@@ -110,6 +108,11 @@ class EliminateSelection(QgisAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
+        # Keep the features to merge the selected polygons with in memory,
+        # with a spatial index which is updated when their geometries grow
+        targetFeatures = {}
+        targetIndex = QgsSpatialIndex()
+
         for aFeat in inLayer.getFeatures():
             if feedback.isCanceled():
                 break
@@ -118,12 +121,9 @@ class EliminateSelection(QgisAlgorithm):
                 # Keep references to the features to eliminate
                 featToEliminate.append(aFeat)
             else:
-                # write the others to output
-                sink.addFeature(aFeat, QgsFeatureSink.FastInsert)
-
-        # Delete all features to eliminate in processLayer
-        processLayer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
-        processLayer.startEditing()
+                targetFeatures[aFeat.id()] = aFeat
+                if aFeat.hasGeometry():
+                    targetIndex.addFeature(aFeat.id(), aFeat.geometry().boundingBox())
 
         # ANALYZE
         if len(featToEliminate) > 0:  # Prevent zero division
@@ -150,23 +150,21 @@ class EliminateSelection(QgisAlgorithm):
                 feat = featToEliminate.pop()
                 geom2Eliminate = feat.geometry()
                 bbox = geom2Eliminate.boundingBox()
-                fit = processLayer.getFeatures(
-                    QgsFeatureRequest().setFilterRect(bbox).setSubsetOfAttributes([]))
                 mergeWithFid = None
                 mergeWithGeom = None
                 max = 0
                 min = -1
-                selFeat = QgsFeature()
 
                 # use prepared geometries for faster intersection tests
                 engine = QgsGeometry.createGeometryEngine(geom2Eliminate.constGet())
                 engine.prepareGeometry()
 
-                while fit.nextFeature(selFeat):
+                # candidates in feature id order, as returned by the providers
+                for selFid in sorted(targetIndex.intersects(bbox)):
                     if feedback.isCanceled():
                         break
 
-                    selGeom = selFeat.geometry()
+                    selGeom = targetFeatures[selFid].geometry()
 
                     if engine.intersects(selGeom.constGet()):
                         # We have a candidate
@@ -203,19 +201,21 @@ class EliminateSelection(QgisAlgorithm):
                                     useThis = False
 
                             if useThis:
-                                mergeWithFid = selFeat.id()
+                                mergeWithFid = selFid
                                 mergeWithGeom = QgsGeometry(selGeom)
-                # End while fit
+                # End for candidates
 
                 if mergeWithFid is not None:
                     # A successful candidate
                     newGeom = mergeWithGeom.combine(geom2Eliminate)
 
-                    if processLayer.changeGeometry(mergeWithFid, newGeom):
-                        madeProgress = True
-                    else:
+                    mergeWithFeat = targetFeatures[mergeWithFid]
+                    targetIndex.deleteFeature(mergeWithFeat)
+                    mergeWithFeat.setGeometry(newGeom)
+                    if not targetIndex.addFeature(mergeWithFid, newGeom.boundingBox()):
                         raise QgsProcessingException(
                             self.tr('Could not replace geometry of feature with id {0}').format(mergeWithFid))
+                    madeProgress = True
 
                     start = start + add
                     feedback.setProgress(start)
@@ -227,10 +227,15 @@ class EliminateSelection(QgisAlgorithm):
             featToEliminate = featNotEliminated
 
         # End while
-        if not processLayer.commitChanges():
-            raise QgsProcessingException(self.tr('Could not commit changes'))
 
-        for feature in featNotEliminated:
+        # write the merged polygons and the others to output
+        for feature in targetFeatures.values():
+            if feedback.isCanceled():
+                break
+
+            sink.addFeature(feature, QgsFeatureSink.FastInsert)
+
+        for feature in featToEliminate:
             if feedback.isCanceled():
                 break
 
@@ -25,8 +25,13 @@ __copyright__ = '(C) 2016, Hugo Mercier'
 
 __revision__ = '$Format:%H$'
 
+import os
+import re
+
 from qgis.core import (QgsVirtualLayerDefinition,
                        QgsVectorLayer,
+                       QgsDataSourceUri,
+                       QgsProviderRegistry,
                        QgsWkbTypes,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterMultipleLayers,
@@ -41,6 +46,55 @@ from qgis.core import (QgsVirtualLayerDefinition,
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 
+# string literals and comments, quoted identifiers (group 1) or inputN names
+# (group 2) of a query
+QUERY_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/"""
+                            r"""|("(?:[^"]|"")*"|\[[^\]]*\]|`(?:[^`]|``)*`)"""
+                            r"""|\binput(\d+)\b""", re.IGNORECASE | re.DOTALL)
+INPUT_NAME_RE = re.compile(r'\binput\d+\b', re.IGNORECASE)
+FUNCTION_CALL_RE = re.compile(r'\b(\w+)\s*\(')
+
+# SQLite functions, and keywords which may be followed by a parenthesis,
+# which run the same way on the SpatiaLite geometries of the virtual layer
+# tables and on the GeoPackage geometries of OGR
+SQLITE_NAMES = {'abs', 'all', 'and', 'as', 'avg', 'between', 'by', 'case', 'cast', 'char', 'coalesce',
+                'count', 'date', 'datetime', 'distinct', 'else', 'except', 'exists', 'filter', 'from',
+                'glob', 'group_concat', 'having', 'hex', 'ifnull', 'iif', 'in', 'instr', 'intersect',
+                'is', 'join', 'julianday', 'length', 'like', 'lower', 'ltrim', 'max', 'min', 'not',
+                'nullif', 'on', 'or', 'over', 'printf', 'quote', 'random', 'replace', 'round', 'rtrim',
+                'select', 'strftime', 'substr', 'sum', 'then', 'time', 'total', 'trim', 'typeof',
+                'unicode', 'union', 'upper', 'using', 'values', 'when', 'where', 'with'}
+
+
+def replaceInputNames(query, tables):
+    """ Returns the query with its inputN names replaced by the quoted names
+    of the tables, leaving string literals and comments as they are, or None
+    if an inputN name is quoted, as it may then name a column as well as a
+    table of the virtual layer
+    """
+    quoted = []
+
+    def replace(match):
+        if match.group(1) is not None:
+            if INPUT_NAME_RE.search(match.group(1)):
+                quoted.append(match.group(1))
+        elif match.group(2) is not None:
+            index = int(match.group(2)) - 1
+            if 0 <= index < len(tables):
+                return '"{}"'.format(tables[index].replace('"', '""'))
+        return match.group(0)
+
+    nativeQuery = QUERY_TOKEN_RE.sub(replace, query)
+    return None if quoted else nativeQuery
+
+
+def usesOnlySqliteFunctions(query):
+    """ Returns whether the query calls only SQLite functions, and no
+    SpatiaLite function working on the geometries of the virtual layer
+    """
+    code = QUERY_TOKEN_RE.sub(lambda match: match.group(0) if match.group(2) is not None else ' ', query)
+    return all(name.lower() in SQLITE_NAMES for name in FUNCTION_CALL_RE.findall(code))
+
 
 class ParameterExecuteSql(QgsProcessingParameterDefinition):
 
@@ -71,6 +125,9 @@ class ExecuteSQL(QgisAlgorithm):
     INPUT_GEOMETRY_CRS = 'INPUT_GEOMETRY_CRS'
     OUTPUT = 'OUTPUT'
 
+    # number of features added at once to the output
+    BATCH_SIZE = 1000
+
     def group(self):
         return self.tr('Vector general')
 
@@ -127,46 +184,133 @@ class ExecuteSQL(QgisAlgorithm):
         geometry_type = self.parameterAsEnum(parameters, self.INPUT_GEOMETRY_TYPE, context)
         geometry_crs = self.parameterAsCrs(parameters, self.INPUT_GEOMETRY_CRS, context)
 
-        df = QgsVirtualLayerDefinition()
-        for layerIdx, layer in enumerate(layers):
-            df.addSource('input{}'.format(layerIdx + 1), layer.id())
-
         if query == '':
             raise QgsProcessingException(
                 self.tr('Empty SQL. Please enter valid SQL expression and try again.'))
-        else:
-            localContext = self.createExpressionContext(parameters, context)
-            expandedQuery = QgsExpression.replaceExpressionText(query, localContext)
+
+        localContext = self.createExpressionContext(parameters, context)
+        expandedQuery = QgsExpression.replaceExpressionText(query, localContext)
+
+        vLayer = None
+        if geometry_type <= 1 and not geometry_crs.isValid():
+            vLayer = self.nativeQueryLayer(layers, expandedQuery, uid_field, geometry_field, geometry_type == 1)
+            if vLayer is not None:
+                feedback.pushInfo(self.tr('Executing the query in the database of the input layers'))
+
+        if vLayer is None:
+            df = QgsVirtualLayerDefinition()
+            for layerIdx, layer in enumerate(layers):
+                df.addSource('input{}'.format(layerIdx + 1), layer.id())
+
             df.setQuery(expandedQuery)
 
-        if uid_field:
-            df.setUid(uid_field)
+            if uid_field:
+                df.setUid(uid_field)
 
-        if geometry_type == 1:  # no geometry
-            df.setGeometryWkbType(QgsWkbTypes.NoGeometry)
-        else:
-            if geometry_field:
-                df.setGeometryField(geometry_field)
-            if geometry_type > 1:
-                df.setGeometryWkbType(geometry_type - 1)
-            if geometry_crs.isValid():
-                df.setGeometrySrid(geometry_crs.postgisSrid())
+            if geometry_type == 1:  # no geometry
+                df.setGeometryWkbType(QgsWkbTypes.NoGeometry)
+            else:
+                if geometry_field:
+                    df.setGeometryField(geometry_field)
+                if geometry_type > 1:
+                    df.setGeometryWkbType(geometry_type - 1)
+                if geometry_crs.isValid():
+                    df.setGeometrySrid(geometry_crs.postgisSrid())
 
-        vLayer = QgsVectorLayer(df.toString(), "temp_vlayer", "virtual")
-        if not vLayer.isValid():
-            raise QgsProcessingException(vLayer.dataProvider().error().message())
+            vLayer = QgsVectorLayer(df.toString(), "temp_vlayer", "virtual")
+            if not vLayer.isValid():
+                raise QgsProcessingException(vLayer.dataProvider().error().message())
 
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                vLayer.fields(), vLayer.wkbType() if geometry_type != 1 else 1, vLayer.crs())
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        features = vLayer.getFeatures()
-        total = 100.0 / vLayer.featureCount() if vLayer.featureCount() else 0
-        for current, inFeat in enumerate(features):
+        # counting the features of the query layer would execute the query twice,
+        # so progress is estimated from the number of input features
+        estimatedCount = sum(max(layer.featureCount(), 0) for layer in layers)
+        total = 100.0 / estimatedCount if estimatedCount else 0
+
+        batch = []
+        current = 0
+        for inFeat in vLayer.getFeatures():
             if feedback.isCanceled():
                 break
 
-            sink.addFeature(inFeat, QgsFeatureSink.FastInsert)
-            feedback.setProgress(int(current * total))
+            batch.append(inFeat)
+            if len(batch) == self.BATCH_SIZE:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                current += len(batch)
+                batch = []
+                feedback.setProgress(min(int(current * total), 99))
+
+        if batch and not feedback.isCanceled():
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+
         return {self.OUTPUT: dest_id}
+
+    def nativeQueryLayer(self, layers, query, uid_field, geometry_field, no_geometry):
+        """ Returns a layer executing the query directly in the SpatiaLite
+        or GeoPackage database of the input layers, with the inputN names
+        replaced by the table names, or None if the inputs are not unfiltered
+        tables of the same database or if the database cannot execute the query
+        """
+        if not layers or not query.strip().lower().startswith('select '):
+            return None
+
+        provider = layers[0].providerType()
+        database = None
+        tables = []
+        for layer in layers:
+            if layer.providerType() != provider or layer.subsetString() or layer.isModified():
+                return None
+
+            if provider == 'spatialite':
+                uri = QgsDataSourceUri(layer.source())
+                layerDatabase = uri.database()
+                table = uri.table()
+                if uri.sql() or table.startswith('('):
+                    return None
+            elif provider == 'ogr' and layer.dataProvider().storageType() in ('GPKG', 'SQLite'):
+                parts = QgsProviderRegistry.instance().decodeUri(provider, layer.source())
+                layerDatabase = parts.get('path')
+                table = parts.get('layerName')
+                if not table:
+                    return None
+            else:
+                return None
+
+            layerDatabase = os.path.normcase(os.path.abspath(layerDatabase))
+            if database is None:
+                database = layerDatabase
+            elif layerDatabase != database:
+                return None
+            tables.append(table)
+
+        nativeQuery = replaceInputNames(query.strip(), tables)
+        if nativeQuery is None:
+            return None
+
+        if provider == 'spatialite':
+            if not geometry_field and not no_geometry:
+                # the SpatiaLite provider cannot detect the geometry column of a query
+                return None
+            uri = QgsDataSourceUri()
+            uri.setDatabase(database)
+            uri.setDataSource('', '({}\n)'.format(nativeQuery), geometry_field if not no_geometry else None, '', uid_field)
+            layer = QgsVectorLayer(uri.uri(False), "temp_vlayer", provider)
+        else:
+            if uid_field or geometry_field:
+                # OGR detects the geometry column and generates the feature ids of query layers itself
+                return None
+            if not usesOnlySqliteFunctions(nativeQuery):
+                # the spatial functions of the query expect SpatiaLite geometries,
+                # they would fail or return NULL on the geometries of the database
+                return None
+            layer = QgsVectorLayer(database, "temp_vlayer", provider)
+            if layer.isValid() and not layer.setSubsetString(nativeQuery):
+                return None
+
+        if not layer.isValid():
+            return None
+        return layer
@@ -25,14 +25,21 @@ __copyright__ = '(C) 2012, Victor Olaya & NextGIS'
 
 __revision__ = '$Format:%H$'
 
+import ast
+import re
 import sys
+from itertools import islice
+
+import numpy
 
 from qgis.PyQt.QtCore import QVariant
-from qgis.core import (QgsProcessingException,
+from qgis.core import (NULL,
+                       QgsProcessingException,
                        QgsField,
                        QgsFeatureSink,
                        QgsProcessing,
                        QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterString,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterNumber,
@@ -48,10 +55,15 @@ class FieldsPyculator(QgisAlgorithm):
     FIELD_PRECISION = 'FIELD_PRECISION'
     GLOBAL = 'GLOBAL'
     FORMULA = 'FORMULA'
+    METHOD = 'METHOD'
     OUTPUT = 'OUTPUT'
     RESULT_VAR_NAME = 'value'
 
     TYPES = [QVariant.LongLong, QVariant.Double, QVariant.String]
+    INTEGER_TYPES = (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong)
+
+    # number of features evaluated and written together by batch methods
+    BATCH_SIZE = 10000
 
     def group(self):
         return self.tr('Vector table')
@@ -83,6 +95,16 @@ class FieldsPyculator(QgisAlgorithm):
                                                        self.tr('Global expression'), multiLine=True, optional=True))
         self.addParameter(QgsProcessingParameterString(self.FORMULA,
                                                        self.tr('Formula'), defaultValue='value = ', multiLine=True))
+
+        self.methods = [self.tr('Run the formula for each feature'),
+                        self.tr('Compile the formula and run it for batches of features'),
+                        self.tr('Run the formula on NumPy arrays of field values (vectorized)')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Evaluation method'),
+                                                  options=self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
                                                             self.tr('Calculated')))
 
@@ -148,6 +170,17 @@ class FieldsPyculator(QgisAlgorithm):
                 self.tr("FieldPyculator code execute error. Field code block can't be executed!\n{0}\n{1}").format(
                     str(sys.exc_info()[0].__name__), str(sys.exc_info()[1])))
 
+        method = self.parameterAsEnum(parameters, self.METHOD, context)
+        if method != 0:
+            if method == 2:
+                new_ns.setdefault('numpy', numpy)
+            formula = self.compileFormula(code, new_ns)
+            if method == 1:
+                self.runCompiled(formula, source, sink, need_id, need_geom, feedback)
+            else:
+                self.runVectorized(formula, code, source, sink, need_id, need_geom, feedback)
+            return {self.OUTPUT: dest_id}
+
         # Run
         features = source.getFeatures()
         total = 100.0 / source.featureCount() if source.featureCount() else 0
@@ -193,6 +226,135 @@ class FieldsPyculator(QgisAlgorithm):
 
         return {self.OUTPUT: dest_id}
 
+    def compileFormula(self, code, namespace):
+        """
+        Compiles the formula code into a function of the feature id, geometry
+        and attributes, returning the value. Names assigned by the formula,
+        except the value, are global as when the formula code is executed.
+        """
+        module = ast.parse(code)
+        assigned = set()
+        for node in ast.walk(module):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                assigned.add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                assigned.add(node.name)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                assigned.add(node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    if alias.name == '*':
+                        raise QgsProcessingException(
+                            self.tr("FieldPyculator code execute error\n"
+                                    "'import *' can only be used in the global expression with this method"))
+                    assigned.add((alias.asname or alias.name).split('.')[0])
+
+        if self.RESULT_VAR_NAME not in assigned:
+            raise QgsProcessingException(
+                self.tr("FieldPyculator code execute error\n"
+                        "Field code block does not return '{0}' variable! "
+                        "Please declare this variable in your code!").format(self.RESULT_VAR_NAME))
+        assigned -= {self.RESULT_VAR_NAME, '__id', '__geom', '__attr'}
+
+        function = ast.parse('def __formula(__id, __geom, __attr):\n'
+                             '    return {}\n'.format(self.RESULT_VAR_NAME))
+        body = module.body + function.body[0].body
+        if assigned:
+            body.insert(0, ast.Global(names=sorted(assigned)))
+        function.body[0].body = body
+        ast.fix_missing_locations(function)
+
+        exec(compile(function, '<string>', 'exec'), namespace)
+        return namespace.pop('__formula')
+
+    def evaluate(self, formula, feat_id, geom, attrs):
+        try:
+            return formula(feat_id, geom, attrs)
+        except UnboundLocalError as e:
+            if "'{}'".format(self.RESULT_VAR_NAME) not in str(e):
+                raise
+            raise QgsProcessingException(
+                self.tr("FieldPyculator code execute error\n"
+                        "Field code block does not return '{0}' variable! "
+                        "Please declare this variable in your code!").format(self.RESULT_VAR_NAME))
+
+    def runCompiled(self, formula, source, sink, need_id, need_geom, feedback):
+        features = source.getFeatures()
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+        current = 0
+        while not feedback.isCanceled():
+            batch = list(islice(features, self.BATCH_SIZE))
+            if not batch:
+                break
+
+            for feat in batch:
+                attrs = feat.attributes()
+                attrs.append(self.evaluate(formula,
+                                           feat.id() if need_id else None,
+                                           feat.geometry() if need_geom else None,
+                                           list(attrs)))
+                feat.setAttributes(attrs)
+
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+            current += len(batch)
+            feedback.setProgress(int(current * total))
+
+    def runVectorized(self, formula, code, source, sink, need_id, need_geom, feedback):
+        """
+        Runs the formula once for each batch of features, with NumPy arrays
+        of the ids and of the values of each field. NULL values of numeric
+        fields are NaN in the arrays, and NaN results are written as NULL.
+        """
+        fields = source.fields()
+        # only the arrays of fields referenced by their index are needed
+        indexes = [int(i) for i in re.findall(r'__attr\[(\d+)\]', code)]
+        if len(indexes) != code.count('__attr') or any(i >= len(fields) for i in indexes):
+            indexes = range(len(fields))
+        indexes = sorted(set(indexes))
+
+        features = source.getFeatures()
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+        current = 0
+        while not feedback.isCanceled():
+            batch = list(islice(features, self.BATCH_SIZE))
+            if not batch:
+                break
+
+            attributes = [feat.attributes() for feat in batch]
+            columns = {i: self.column([attrs[i] for attrs in attributes], fields.at(i)) for i in indexes}
+            values = self.evaluate(formula,
+                                   numpy.array([feat.id() for feat in batch]) if need_id else None,
+                                   [feat.geometry() for feat in batch] if need_geom else None,
+                                   columns)
+            try:
+                values = numpy.broadcast_to(numpy.asarray(values), (len(batch),)).tolist()
+            except ValueError:
+                raise QgsProcessingException(
+                    self.tr("FieldPyculator code execute error\n"
+                            "'{0}' must be a single value or an array with a value for each feature").format(self.RESULT_VAR_NAME))
+
+            for feat, attrs, value in zip(batch, attributes, values):
+                attrs.append(NULL if isinstance(value, float) and value != value else value)
+                feat.setAttributes(attrs)
+
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+            current += len(batch)
+            feedback.setProgress(int(current * total))
+
+    def column(self, values, field):
+        """
+        Returns a NumPy array of field values.
+        """
+        if not field.isNumeric():
+            column = numpy.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+
+        values = [None if v == NULL else v for v in values]
+        if field.type() in self.INTEGER_TYPES and None not in values:
+            return numpy.array(values, dtype=numpy.int64)
+        return numpy.array(values, dtype=numpy.float64)
+
     def checkParameterValues(self, parameters, context):
         # TODO check that formula is correct and fields exist
         return super(FieldsPyculator, self).checkParameterValues(parameters, context)
@@ -42,7 +42,10 @@ from qgis.core import (QgsField,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingException,
                        QgsSpatialIndex)
+from itertools import islice
+
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
+from processing.tools import vector
 
 from math import sqrt
 
@@ -56,6 +59,9 @@ class HubDistanceLines(QgisAlgorithm):
 
     LAYER_UNITS = 'LAYER_UNITS'
 
+    # number of source features processed at once
+    BATCH_SIZE = 10000
+
     UNITS = [QgsUnitTypes.DistanceMeters,
              QgsUnitTypes.DistanceFeet,
              QgsUnitTypes.DistanceMiles,
@@ -122,44 +128,62 @@ class HubDistanceLines(QgisAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        index = QgsSpatialIndex(hub_source.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([]).setDestinationCrs(point_source.sourceCrs(), context.transformContext())))
+        # load hub locations and names once, so that spokes never need to query
+        # the hub source
+        index = QgsSpatialIndex()
+        hubs = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes([fieldName], hub_source.fields()) \
+            .setDestinationCrs(point_source.sourceCrs(), context.transformContext())
+        for hub in hub_source.getFeatures(request):
+            if feedback.isCanceled():
+                break
+            if hub.hasGeometry():
+                index.addFeature(hub)
+                hubs[hub.id()] = (hub.geometry().boundingBox().center(), hub[fieldName])
 
         distance = QgsDistanceArea()
         distance.setSourceCrs(point_source.sourceCrs(), context.transformContext())
         distance.setEllipsoid(context.project().ellipsoid())
 
-        # Scan source points, find nearest hub, and write to output file
+        # Scan source points in batches, find nearest hub, and write to output file
         features = point_source.getFeatures()
         total = 100.0 / point_source.featureCount() if point_source.featureCount() else 0
-        for current, f in enumerate(features):
-            if feedback.isCanceled():
+        current = 0
+        while not feedback.isCanceled():
+            batch = list(islice(features, self.BATCH_SIZE))
+            if not batch:
                 break
 
-            if not f.hasGeometry():
-                sink.addFeature(f, QgsFeatureSink.FastInsert)
-                continue
-            src = f.geometry().boundingBox().center()
+            centers = [f.geometry().boundingBox().center() if f.hasGeometry() else None for f in batch]
+            nearest = vector.nearestHubs(index, centers)
+
+            output_features = []
+            for f, src, hub_id in zip(batch, centers, nearest):
+                if src is None or hub_id is None:
+                    output_features.append(f)
+                    continue
+
+                closest, hub_name = hubs[hub_id]
+                hubDist = distance.measureLine(src, closest)
 
-            neighbors = index.nearestNeighbor(src, 1)
-            ft = next(hub_source.getFeatures(QgsFeatureRequest().setFilterFid(neighbors[0]).setSubsetOfAttributes([fieldName], hub_source.fields()).setDestinationCrs(point_source.sourceCrs(), context.transformContext())))
-            closest = ft.geometry().boundingBox().center()
-            hubDist = distance.measureLine(src, closest)
+                if units != self.LAYER_UNITS:
+                    hub_dist_in_desired_units = distance.convertLengthMeasurement(hubDist, units)
+                else:
+                    hub_dist_in_desired_units = hubDist
 
-            if units != self.LAYER_UNITS:
-                hub_dist_in_desired_units = distance.convertLengthMeasurement(hubDist, units)
-            else:
-                hub_dist_in_desired_units = hubDist
+                attributes = f.attributes()
+                attributes.append(hub_name)
+                attributes.append(hub_dist_in_desired_units)
 
-            attributes = f.attributes()
-            attributes.append(ft[fieldName])
-            attributes.append(hub_dist_in_desired_units)
+                feat = QgsFeature()
+                feat.setAttributes(attributes)
 
-            feat = QgsFeature()
-            feat.setAttributes(attributes)
+                feat.setGeometry(QgsGeometry.fromPolylineXY([src, closest]))
 
-            feat.setGeometry(QgsGeometry.fromPolylineXY([src, closest]))
+                output_features.append(feat)
 
-            sink.addFeature(feat, QgsFeatureSink.FastInsert)
+            sink.addFeatures(output_features, QgsFeatureSink.FastInsert)
+            current += len(batch)
             feedback.setProgress(int(current * total))
 
         return {self.OUTPUT: dest_id}
@@ -25,15 +25,24 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import (QgsVectorLayerExporter,
+import struct
+import uuid
+from itertools import islice
+
+from qgis.PyQt.QtCore import Qt, QByteArray, QDate, QDateTime, QTime
+from qgis.core import (NULL,
+                       QgsVectorLayerExporter,
                        QgsSettings,
                        QgsFeatureSink,
                        QgsProcessing,
                        QgsProcessingException,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterString,
                        QgsProcessingParameterField,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterNumber,
                        QgsWkbTypes)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
@@ -53,6 +62,9 @@ class ImportIntoPostGIS(QgisAlgorithm):
     FORCE_SINGLEPART = 'FORCE_SINGLEPART'
     PRIMARY_KEY = 'PRIMARY_KEY'
     ENCODING = 'ENCODING'
+    METHOD = 'METHOD'
+    BATCH_SIZE = 'BATCH_SIZE'
+    UNLOGGED_STAGING = 'UNLOGGED_STAGING'
 
     def group(self):
         return self.tr('Database')
@@ -114,6 +126,28 @@ class ImportIntoPostGIS(QgisAlgorithm):
                                                         self.tr('Create single-part geometries instead of multi-part'),
                                                         False))
 
+        self.methods = [self.tr('Add features one by one'),
+                        self.tr('Bulk load with COPY')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Loading method'),
+                                                  options=self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
+
+        batch_param = QgsProcessingParameterNumber(self.BATCH_SIZE,
+                                                   self.tr('Number of features per COPY batch'),
+                                                   QgsProcessingParameterNumber.Integer,
+                                                   10000, False, 1)
+        batch_param.setFlags(batch_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(batch_param)
+
+        staging_param = QgsProcessingParameterBoolean(self.UNLOGGED_STAGING,
+                                                      self.tr('Bulk load into an unlogged staging table, then replace the table'),
+                                                      False)
+        staging_param.setFlags(staging_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(staging_param)
+
     def name(self):
         return 'importintopostgis'
 
@@ -171,34 +205,63 @@ class ImportIntoPostGIS(QgisAlgorithm):
         if source.wkbType() == QgsWkbTypes.NoGeometry:
             geomColumn = None
 
+        bulkLoad = self.parameterAsEnum(parameters, self.METHOD, context) == 1
+        staging = bulkLoad and self.parameterAsBool(parameters, self.UNLOGGED_STAGING, context)
+
+        loadTable = table
+        if staging:
+            if not overwrite and db.table_exists(table, schema):
+                raise QgsProcessingException(
+                    self.tr('Error importing to PostGIS\nTable {0} already exists').format(table))
+            # the staging table replaces the table once loaded, its unique
+            # name can't be the one of an existing table
+            loadTable = '{0}_staging_{1}'.format(table[0:40], uuid.uuid4().hex[0:12])
+
         uri = db.uri
-        uri.setDataSource(schema, table, geomColumn, '', primaryKeyField)
+        uri.setDataSource(schema, loadTable, geomColumn, '', primaryKeyField)
 
         if encoding:
             options['fileEncoding'] = encoding
 
         exporter = QgsVectorLayerExporter(uri.uri(), providerName, source.fields(),
-                                          source.wkbType(), source.sourceCrs(), overwrite, options)
+                                          source.wkbType(), source.sourceCrs(), overwrite and not staging, options)
 
         if exporter.errorCode() != QgsVectorLayerExporter.NoError:
             raise QgsProcessingException(
                 self.tr('Error importing to PostGIS\n{0}').format(exporter.errorMessage()))
 
-        features = source.getFeatures()
-        total = 100.0 / source.featureCount() if source.featureCount() else 0
-        for current, f in enumerate(features):
-            if feedback.isCanceled():
-                break
-
-            if not exporter.addFeature(f, QgsFeatureSink.FastInsert):
-                feedback.reportError(exporter.errorMessage())
-
-            feedback.setProgress(int(current * total))
-
-        exporter.flushBuffer()
-        if exporter.errorCode() != QgsVectorLayerExporter.NoError:
-            raise QgsProcessingException(
-                self.tr('Error importing to PostGIS\n{0}').format(exporter.errorMessage()))
+        if bulkLoad:
+            # the exporter is only used to create the table
+            del exporter
+            try:
+                self.copyFeatures(db, source, loadTable, schema, geomColumn, convertLowerCase, forceSinglePart,
+                                  staging, parameters, context, feedback)
+                if staging and not feedback.isCanceled():
+                    db.replace_table(table, loadTable, schema)
+            except QgsProcessingException:
+                if staging:
+                    db.delete_table(loadTable, schema)
+                raise
+            if staging and feedback.isCanceled():
+                # the table is not replaced by a partly loaded one
+                db.delete_table(loadTable, schema)
+                return {}
+        else:
+            features = source.getFeatures()
+            total = 100.0 / source.featureCount() if source.featureCount() else 0
+            for current, f in enumerate(features):
+                if feedback.isCanceled():
+                    break
+
+                if not exporter.addFeature(f, QgsFeatureSink.FastInsert):
+                    feedback.reportError(exporter.errorMessage())
+
+                feedback.setProgress(int(current * total))
+
+            exporter.flushBuffer()
+            if exporter.errorCode() != QgsVectorLayerExporter.NoError:
+                raise QgsProcessingException(
+                    self.tr('Error importing to PostGIS\n{0}').format(exporter.errorMessage()))
 
         if geomColumn and createIndex:
             db.create_spatial_index(table, schema, geomColumn)
@@ -207,6 +270,100 @@ class ImportIntoPostGIS(QgisAlgorithm):
 
         return {}
 
+    def copyFeatures(self, db, source, table, schema, geomColumn, convertLowerCase, forceSinglePart, staging,
+                     parameters, context, feedback):
+        """
+        Loads the features of the source into the table with COPY.
+        """
+        if staging:
+            db.set_table_logged(table, False, schema)
+
+        # the exporter may have created other columns than the source
+        # fields, e.g. a primary key column, in another order
+        tableColumns = [c.name for c in db.get_table_fields(table, schema)]
+        columns = []
+        for f in source.fields():
+            name = f.name().lower() if convertLowerCase else f.name()
+            if name not in tableColumns:
+                matches = [c for c in tableColumns if c.lower() == name.lower()]
+                if len(matches) != 1:
+                    raise QgsProcessingException(
+                        self.tr('Error importing to PostGIS\nNo column of table {0} for field {1}').format(table, f.name()))
+                name = matches[0]
+            columns.append(name)
+        if geomColumn:
+            columns.append(geomColumn)
+
+        geometryType = source.wkbType()
+        if forceSinglePart:
+            geometryType = QgsWkbTypes.singleType(geometryType)
+        srid = source.sourceCrs().postgisSrid()
+        batchSize = self.parameterAsInt(parameters, self.BATCH_SIZE, context)
+
+        features = source.getFeatures()
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+        current = 0
+        while not feedback.isCanceled():
+            rows = (self.copyRow(f, geomColumn is not None, geometryType, srid)
+                    for f in islice(features, batchSize))
+            count = db.copy_rows(table, columns, rows, schema)
+            if count == 0:
+                break
+            current += count
+            feedback.setProgress(int(current * total))
+
+        if staging and not feedback.isCanceled():
+            # this writes the whole table to the write-ahead log, unless
+            # wal_level is minimal: the staging table mostly spares the
+            # logging of the rows of a load which fails or is canceled
+            db.set_table_logged(table, True, schema)
+
+    def copyRow(self, feature, hasGeometry, geometryType, srid):
+        """
+        Returns the values of a feature to load with COPY, with the
+        geometry as hex encoded EWKB.
+        """
+        row = [self.copyValue(v) for v in feature.attributes()]
+        if hasGeometry:
+            geometry = feature.geometry()
+            if geometry.isNull() or geometry.isEmpty():
+                row.append(None)
+            else:
+                if QgsWkbTypes.isMultiType(geometryType) and not geometry.isMultipart():
+                    geometry.convertToMultiType()
+                elif not QgsWkbTypes.isMultiType(geometryType) and geometry.isMultipart():
+                    geometry.convertToSingleType()
+                row.append(self.ewkb(bytes(geometry.asWkb()), srid).hex())
+        return row
+
+    def copyValue(self, value):
+        if value == NULL:
+            return None
+        elif isinstance(value, (QDate, QTime, QDateTime)):
+            return value.toString(Qt.ISODate)
+        elif isinstance(value, QByteArray):
+            return '\\x' + bytes(value).hex()
+        elif isinstance(value, list):
+            return '{' + ','.join('"{}"'.format(str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                  for v in value) + '}'
+        return value
+
+    def ewkb(self, wkb, srid):
+        """
+        Converts a WKB geometry to EWKB with a SRID, as expected by
+        PostGIS when loading geometries from text.
+        """
+        byteOrder = '<' if wkb[0] == 1 else '>'
+        wkbType = struct.unpack(byteOrder + 'I', wkb[1:5])[0]
+        hasZ = wkbType & 0x80000000 or (wkbType % 0x10000000) // 1000 in (1, 3)
+        hasM = wkbType & 0x40000000 or (wkbType % 0x10000000) // 1000 in (2, 3)
+        ewkbType = (wkbType % 0x10000000) % 1000 | 0x20000000
+        if hasZ:
+            ewkbType |= 0x80000000
+        if hasM:
+            ewkbType |= 0x40000000
+        return wkb[0:1] + struct.pack(byteOrder + 'II', ewkbType, srid) + wkb[5:]
+
     def dbConnectionNames(self):
         settings = QgsSettings()
         settings.beginGroup('/PostgreSQL/connections/')
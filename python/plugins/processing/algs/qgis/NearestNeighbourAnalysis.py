@@ -27,8 +27,11 @@ __revision__ = '$Format:%H$'
 
 import os
 import math
+import array
 import codecs
 
+import numpy
+
 from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import (QgsApplication,
@@ -40,7 +43,7 @@ from qgis.core import (QgsApplication,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFileDestination,
                        QgsProcessingOutputNumber,
-                       QgsSpatialIndex)
+                       QgsPointXY)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 
@@ -57,6 +60,16 @@ class NearestNeighbourAnalysis(QgisAlgorithm):
     POINT_COUNT = 'POINT_COUNT'
     Z_SCORE = 'Z_SCORE'
 
+    # number of points searched for nearest neighbours at once
+    SEARCH_CHUNK_SIZE = 100000
+    # grid cell size adjustments for clustered points
+    MAX_GRID_REFINEMENTS = 4
+    # rings of cells searched around points before switching to a coarser grid
+    RINGS_PER_GRID = 2
+    GRID_COARSENING = 4
+    # maximum number of candidate pairs compared at once
+    MAX_CANDIDATES = 4000000
+
     def icon(self):
         return QgsApplication.getThemeIcon("/algorithms/mAlgorithmNearestNeighbour.svg")
 
@@ -101,31 +114,40 @@ class NearestNeighbourAnalysis(QgisAlgorithm):
 
         output_file = self.parameterAsFileOutput(parameters, self.OUTPUT_HTML_FILE, context)
 
-        spatialIndex = QgsSpatialIndex(source, feedback)
-
         distance = QgsDistanceArea()
         distance.setSourceCrs(source.sourceCrs(), context.transformContext())
         distance.setEllipsoid(context.project().ellipsoid())
 
-        sumDist = 0.00
         A = source.sourceExtent()
         A = float(A.width() * A.height())
 
-        features = source.getFeatures()
+        # keep point coordinates only, nearest neighbours are then searched
+        # in memory without querying the source again
+        coordinates = array.array('d')
         count = source.featureCount()
-        total = 100.0 / count if count else 1
-        for current, feat in enumerate(features):
+        total = 50.0 / count if count > 0 else 1
+        for current, feat in enumerate(source.getFeatures(QgsFeatureRequest().setNoAttributes())):
             if feedback.isCanceled():
                 break
-
-            neighbourID = spatialIndex.nearestNeighbor(
-                feat.geometry().asPoint(), 2)[1]
-            request = QgsFeatureRequest().setFilterFid(neighbourID).setSubsetOfAttributes([])
-            neighbour = next(source.getFeatures(request))
-            sumDist += distance.measureLine(neighbour.geometry().asPoint(),
-                                            feat.geometry().asPoint())
-
+            point = feat.geometry().asPoint()
+            coordinates.extend((point.x(), point.y()))
             feedback.setProgress(int(current * total))
+        points = numpy.frombuffer(coordinates, dtype=numpy.float64).reshape(-1, 2)
+        count = len(points)
+        if count < 2:
+            raise QgsProcessingException(self.tr('At least two points are required'))
+
+        neighbours = self.nearestNeighbours(points, feedback)
+        if feedback.isCanceled():
+            return {}
+
+        if distance.willUseEllipsoid():
+            sumDist = 0.00
+            for current, neighbour in enumerate(neighbours):
+                sumDist += distance.measureLine(QgsPointXY(*points[neighbour]),
+                                                QgsPointXY(*points[current]))
+        else:
+            sumDist = float(numpy.sqrt(((points[neighbours] - points) ** 2).sum(axis=1)).sum())
 
         do = float(sumDist) / count
         de = float(0.5 / math.sqrt(count / A))
@@ -152,6 +174,148 @@ class NearestNeighbourAnalysis(QgisAlgorithm):
 
         return results
 
+    def nearestNeighbours(self, points, feedback):
+        """
+        Returns the index of the nearest other point for each point of a (n, 2)
+        array of coordinates.
+
+        Points are bucketed in regular grids, and the few rings of cells around
+        each point are searched. Points whose nearest neighbour may lie further
+        away (e.g. in sparse areas) are searched again in a coarser grid, so
+        clustered data does not require searching many empty cells.
+        """
+        count = len(points)
+        minimum = points.min(axis=0)
+        extent = points.max(axis=0) - minimum
+        # about two points per cell, also for points lying along a line
+        cell_size = max(math.sqrt(2.0 * extent[0] * extent[1] / count),
+                        2.0 * extent.max() / count,
+                        1e-12)
+        for _ in range(self.MAX_GRID_REFINEMENTS):
+            grid = self.pointGrid(points, minimum, cell_size)
+            # average number of points sharing the cell of a point, refine the grid
+            # if points are clustered
+            occupancy = numpy.unique(grid[3], return_counts=True)[1]
+            crowding = float((occupancy.astype(numpy.float64) ** 2).sum()) / count
+            if crowding <= 8 or cell_size <= 1e-12:
+                break
+            cell_size = max(cell_size / math.sqrt(crowding / 2.0), 1e-12)
+
+        neighbours = numpy.full(count, -1, dtype=numpy.int64)
+        best = numpy.full(count, numpy.inf)
+        remaining = numpy.arange(count)
+        while len(remaining) and not feedback.isCanceled():
+            grid = self.pointGrid(points, minimum, cell_size)
+            cells, columns, rows = grid[:3]
+            last_ring = min(self.RINGS_PER_GRID, max(columns, rows) - 1)
+            still_active = []
+            for chunk in range(0, len(remaining), self.SEARCH_CHUNK_SIZE):
+                if feedback.isCanceled():
+                    break
+                active = remaining[chunk:chunk + self.SEARCH_CHUNK_SIZE]
+                for ring in range(last_ring + 1):
+                    self.searchRing(points, grid, ring, active, neighbours, best)
+                    # points out of this ring are at least ring * cell_size away
+                    active = active[best[active] > (ring * cell_size) ** 2]
+                    if not len(active):
+                        break
+                if last_ring < max(columns, rows) - 1:
+                    still_active.append(active)
+
+                feedback.setProgress(50 + int(50.0 * (count - len(remaining) + chunk) / count))
+
+            remaining = numpy.concatenate(still_active) if still_active else remaining[:0]
+            cell_size *= self.GRID_COARSENING
+
+        return neighbours
+
+    def pointGrid(self, points, minimum, cell_size):
+        """
+        Buckets points in a regular grid.
+
+        Returns the (column, row) cell of each point, the grid size, and the
+        point indices sorted by cell with their matching sorted cell keys.
+        """
+        cells = numpy.floor((points - minimum) / cell_size).astype(numpy.int64)
+        columns, rows = cells.max(axis=0) + 1
+        keys = cells[:, 1] * columns + cells[:, 0]
+        order = numpy.argsort(keys, kind='stable')
+        return cells, columns, rows, keys[order], order
+
+    def searchRing(self, points, grid, ring, active, neighbours, best):
+        """
+        Updates the nearest neighbours of active points with the points found in
+        the given ring of cells around them.
+        """
+        cells, columns, rows, sorted_keys, order = grid
+
+        # pair every active point with every cell of the ring around it
+        dx, dy = self.ringOffsets(ring, columns, rows)
+        cx = (cells[active, 0][:, None] + dx).ravel()
+        cy = (cells[active, 1][:, None] + dy).ravel()
+        owners = numpy.repeat(active, len(dx))
+        inside = (cx >= 0) & (cx < columns) & (cy >= 0) & (cy < rows)
+        owners = owners[inside]
+        cell_keys = cy[inside] * columns + cx[inside]
+        starts = numpy.searchsorted(sorted_keys, cell_keys, side='left')
+        sizes = numpy.searchsorted(sorted_keys, cell_keys, side='right') - starts
+        filled = sizes > 0
+        owners = owners[filled]
+        starts = starts[filled]
+        sizes = sizes[filled]
+
+        # expand (point, cell) pairs into (point, candidate) pairs, by slices to
+        # bound memory use when cells are crowded
+        ends = numpy.cumsum(sizes)
+        first_pair = 0
+        while first_pair < len(sizes):
+            last_pair = max(first_pair + 1, int(numpy.searchsorted(ends, ends[first_pair] - sizes[first_pair] + self.MAX_CANDIDATES, side='right')))
+            slice_owners = owners[first_pair:last_pair]
+            slice_starts = starts[first_pair:last_pair]
+            slice_sizes = sizes[first_pair:last_pair]
+            first_pair = last_pair
+
+            pair_owners = numpy.repeat(slice_owners, slice_sizes)
+            offsets = numpy.arange(slice_sizes.sum()) - numpy.repeat(numpy.cumsum(slice_sizes) - slice_sizes, slice_sizes)
+            candidates = order[numpy.repeat(slice_starts, slice_sizes) + offsets]
+            valid = candidates != pair_owners
+            pair_owners = pair_owners[valid]
+            candidates = candidates[valid]
+            distances = ((points[pair_owners] - points[candidates]) ** 2).sum(axis=1)
+
+            if not len(pair_owners):
+                continue
+
+            # keep the closest candidate for each point, pairs of a point are contiguous
+            starts_of_owner = numpy.flatnonzero(numpy.diff(pair_owners, prepend=-1))
+            minimums = numpy.minimum.reduceat(distances, starts_of_owner)
+            run_lengths = numpy.diff(numpy.append(starts_of_owner, len(pair_owners)))
+            closest = numpy.flatnonzero(distances == numpy.repeat(minimums, run_lengths))
+            first = numpy.ones(len(closest), dtype=bool)
+            first[1:] = pair_owners[closest[1:]] != pair_owners[closest[:-1]]
+            closest = closest[first]
+            pair_owners = pair_owners[closest]
+            candidates = candidates[closest]
+            distances = distances[closest]
+            better = distances < best[pair_owners]
+            best[pair_owners[better]] = distances[better]
+            neighbours[pair_owners[better]] = candidates[better]
+
+    @staticmethod
+    def ringOffsets(ring, columns, rows):
+        """
+        Returns the dx and dy offset arrays of the cells in a square ring around
+        a cell, skipping offsets which cannot fall inside a grid of the given size.
+        """
+        if ring == 0:
+            return numpy.zeros(1, dtype=numpy.int64), numpy.zeros(1, dtype=numpy.int64)
+        side = numpy.arange(-ring, ring + 1)
+        inner = numpy.arange(-ring + 1, ring)
+        dx = numpy.concatenate((side, side, numpy.full(len(inner), -ring), numpy.full(len(inner), ring)))
+        dy = numpy.concatenate((numpy.full(len(side), -ring), numpy.full(len(side), ring), inner, inner))
+        possible = (numpy.abs(dx) < columns) & (numpy.abs(dy) < rows)
+        return dx[possible], dy[possible]
+
     def createHTML(self, outputFile, algData):
         with codecs.open(outputFile, 'w', encoding='utf-8') as f:
             f.write('<html><head>')
@@ -38,10 +38,14 @@ from qgis.core import (QgsApplication,
                        QgsField,
                        QgsProcessing,
                        QgsProcessingException,
+                       QgsProcessingMultiStepFeedback,
+                       QgsProcessingParameterDefinition,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterString,
                        QgsProcessingParameterField,
+                       QgsRectangle,
                        QgsSpatialIndex)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
@@ -56,6 +60,7 @@ class PointsInPolygon(QgisAlgorithm):
     FIELD = 'FIELD'
     WEIGHT = 'WEIGHT'
     CLASSFIELD = 'CLASSFIELD'
+    METHOD = 'METHOD'
 
     def icon(self):
         return QgsApplication.getThemeIcon("/algorithms/mAlgorithmSumPoints.svg")
@@ -85,6 +90,14 @@ class PointsInPolygon(QgisAlgorithm):
                                                       optional=True))
         self.addParameter(QgsProcessingParameterString(self.FIELD,
                                                        self.tr('Count field name'), defaultValue='NUMPOINTS'))
+        self.methods = [self.tr('Query points for each polygon'),
+                        self.tr('Read points once (polygons loaded in memory)')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Method'),
+                                                  self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Count'), QgsProcessing.TypeVectorPolygon))
 
@@ -114,6 +127,7 @@ class PointsInPolygon(QgisAlgorithm):
             class_field_index = point_source.fields().lookupField(class_field)
 
         field_name = self.parameterAsString(parameters, self.FIELD, context)
+        method = self.parameterAsEnum(parameters, self.METHOD, context)
 
         fields = poly_source.fields()
         if fields.lookupField(field_name) < 0:
@@ -131,6 +145,17 @@ class PointsInPolygon(QgisAlgorithm):
         if class_field_index >= 0:
             point_attribute_indices.append(class_field_index)
 
+        scores = None
+        if method == 1:
+            # read the points once, and the polygons twice (to build the index
+            # and to write them)
+            multi_feedback = QgsProcessingMultiStepFeedback(2, feedback)
+            scores = self.scoresFromPointStream(poly_source, point_source, point_attribute_indices,
+                                                weight_field_index, class_field_index,
+                                                context, multi_feedback)
+            multi_feedback.setCurrentStep(1)
+            feedback = multi_feedback
+
         features = poly_source.getFeatures()
         total = 100.0 / poly_source.featureCount() if poly_source.featureCount() else 0
         for current, polygon_feature in enumerate(features):
@@ -138,15 +163,19 @@ class PointsInPolygon(QgisAlgorithm):
                 break
 
             count = 0
+            classes = set()
             output_feature = QgsFeature()
-            if polygon_feature.hasGeometry():
+            if polygon_feature.hasGeometry() and scores is not None:
+                if class_field_index >= 0 and weight_field_index < 0:
+                    classes = scores.get(polygon_feature.id(), classes)
+                else:
+                    count = scores.get(polygon_feature.id(), count)
+                output_feature.setGeometry(polygon_feature.geometry())
+            elif polygon_feature.hasGeometry():
                 geom = polygon_feature.geometry()
                 engine = QgsGeometry.createGeometryEngine(geom.constGet())
                 engine.prepareGeometry()
 
-                count = 0
-                classes = set()
-
                 request = QgsFeatureRequest().setFilterRect(geom.boundingBox()).setDestinationCrs(poly_source.sourceCrs(), context.transformContext())
                 request.setSubsetOfAttributes(point_attribute_indices)
                 for point_feature in point_source.getFeatures(request):
@@ -186,3 +215,62 @@ class PointsInPolygon(QgisAlgorithm):
             feedback.setProgress(int(current * total))
 
         return {self.OUTPUT: dest_id}
+
+    def scoresFromPointStream(self, poly_source, point_source, point_attribute_indices,
+                              weight_field_index, class_field_index, context, feedback):
+        """
+        Reads the point source once and looks up the polygons containing each point
+        in an in-memory index of prepared polygon geometries.
+
+        Returns a dictionary of polygon id to count (or sum of weights), or to the
+        set of classes if a class field is used.
+        """
+        index = QgsSpatialIndex()
+        polygons = {}
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for polygon_feature in poly_source.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            if feedback.isCanceled():
+                return {}
+            if not polygon_feature.hasGeometry():
+                continue
+            geom = polygon_feature.geometry()
+            engine = QgsGeometry.createGeometryEngine(geom.constGet())
+            engine.prepareGeometry()
+            # keep the geometry alive as long as its engine
+            polygons[polygon_feature.id()] = (geom, engine)
+            index.addFeature(polygon_feature)
+            extent.combineExtentWith(geom.boundingBox())
+
+        scores = {}
+        if not polygons:
+            return scores
+
+        request = QgsFeatureRequest().setFilterRect(extent).setDestinationCrs(poly_source.sourceCrs(), context.transformContext())
+        request.setSubsetOfAttributes(point_attribute_indices)
+        total = 100.0 / point_source.featureCount() if point_source.featureCount() else 0
+        for current, point_feature in enumerate(point_source.getFeatures(request)):
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int(current * total))
+
+            if not point_feature.hasGeometry():
+                continue
+            point = point_feature.geometry()
+            for polygon_id in index.intersects(point.boundingBox()):
+                if not polygons[polygon_id][1].contains(point.constGet()):
+                    continue
+
+                if weight_field_index >= 0:
+                    weight = point_feature[weight_field_index]
+                    try:
+                        scores[polygon_id] = scores.get(polygon_id, 0) + float(weight)
+                    except (TypeError, ValueError):
+                        # Ignore fields with non-numeric values
+                        pass
+                elif class_field_index >= 0:
+                    scores.setdefault(polygon_id, set()).add(point_feature[class_field_index])
+                else:
+                    scores[polygon_id] = scores.get(polygon_id, 0) + 1
+
+        return scores
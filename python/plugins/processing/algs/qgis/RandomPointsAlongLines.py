@@ -35,7 +35,6 @@ from qgis.core import (QgsField,
                        QgsGeometry,
                        QgsPointXY,
                        QgsWkbTypes,
-                       QgsSpatialIndex,
                        QgsFeatureRequest,
                        QgsDistanceArea,
                        QgsProject,
@@ -110,8 +109,7 @@ class RandomPointsAlongLines(QgisAlgorithm):
         featureCount = source.featureCount()
         total = 100.0 / pointCount if pointCount else 1
 
-        index = QgsSpatialIndex()
-        points = dict()
+        grid = vector.PointDistanceGrid(minDistance)
 
         da = QgsDistanceArea()
         da.setSourceCrs(source.sourceCrs(), context.transformContext())
@@ -156,15 +154,14 @@ class RandomPointsAlongLines(QgisAlgorithm):
                 # generate random point
                 p = QgsPointXY(rx, ry)
                 geom = QgsGeometry.fromPointXY(p)
-                if vector.checkMinDistance(p, index, minDistance, points):
+                if grid.checkMinDistance(p):
                     f = QgsFeature(nPoints)
                     f.initAttributes(1)
                     f.setFields(fields)
                     f.setAttribute('id', nPoints)
                     f.setGeometry(geom)
                     sink.addFeature(f, QgsFeatureSink.FastInsert)
-                    index.addFeature(f)
-                    points[nPoints] = p
+                    grid.addPoint(p)
                     nPoints += 1
                     feedback.setProgress(int(nPoints * total))
             nIterations += 1
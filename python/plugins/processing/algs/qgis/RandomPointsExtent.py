@@ -38,13 +38,13 @@ from qgis.core import (QgsApplication,
                        QgsGeometry,
                        QgsPointXY,
                        QgsWkbTypes,
-                       QgsSpatialIndex,
                        QgsProcessing,
                        QgsProcessingException,
                        QgsProcessingParameterDistance,
                        QgsProcessingParameterExtent,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterCrs,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterDefinition)
 
@@ -59,6 +59,7 @@ class RandomPointsExtent(QgisAlgorithm):
     EXTENT = 'EXTENT'
     POINTS_NUMBER = 'POINTS_NUMBER'
     MIN_DISTANCE = 'MIN_DISTANCE'
+    METHOD = 'METHOD'
     TARGET_CRS = 'TARGET_CRS'
     OUTPUT = 'OUTPUT'
 
@@ -89,6 +90,16 @@ class RandomPointsExtent(QgisAlgorithm):
         self.addParameter(QgsProcessingParameterCrs(self.TARGET_CRS,
                                                     self.tr('Target CRS'),
                                                     'ProjectCrs'))
+
+        self.methods = [self.tr('Random points checked against the minimum distance'),
+                        self.tr('Poisson disk sampling')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Generation method'),
+                                                  options=self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
+
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
                                                             self.tr('Random points'),
                                                             type=QgsProcessing.TypeVectorPoint))
@@ -102,6 +113,10 @@ class RandomPointsExtent(QgisAlgorithm):
     def processAlgorithm(self, parameters, context, feedback):
         pointCount = self.parameterAsDouble(parameters, self.POINTS_NUMBER, context)
         minDistance = self.parameterAsDouble(parameters, self.MIN_DISTANCE, context)
+        method = self.parameterAsEnum(parameters, self.METHOD, context)
+        if method == 1 and minDistance <= 0:
+            raise QgsProcessingException(
+                self.tr('Poisson disk sampling requires a minimum distance between points greater than 0.'))
         crs = self.parameterAsCrs(parameters, self.TARGET_CRS, context)
         bbox = self.parameterAsExtent(parameters, self.EXTENT, context, crs)
 
@@ -115,13 +130,16 @@ class RandomPointsExtent(QgisAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
+        if method == 1:
+            self.poissonDiskSampling(bbox, pointCount, minDistance, fields, sink, feedback)
+            return {self.OUTPUT: dest_id}
+
         nPoints = 0
         nIterations = 0
         maxIterations = pointCount * 200
         total = 100.0 / pointCount if pointCount else 1
 
-        index = QgsSpatialIndex()
-        points = dict()
+        grid = vector.PointDistanceGrid(minDistance)
 
         random.seed()
 
@@ -134,16 +152,15 @@ class RandomPointsExtent(QgisAlgorithm):
 
             p = QgsPointXY(rx, ry)
             geom = QgsGeometry.fromPointXY(p)
-            if geom.within(extent) and \
-                    vector.checkMinDistance(p, index, minDistance, points):
+            if grid.checkMinDistance(p) and \
+                    geom.within(extent):
                 f = QgsFeature(nPoints)
                 f.initAttributes(1)
                 f.setFields(fields)
                 f.setAttribute('id', nPoints)
                 f.setGeometry(geom)
                 sink.addFeature(f, QgsFeatureSink.FastInsert)
-                index.addFeature(f)
-                points[nPoints] = p
+                grid.addPoint(p)
                 nPoints += 1
                 feedback.setProgress(int(nPoints * total))
             nIterations += 1
@@ -153,3 +170,31 @@ class RandomPointsExtent(QgisAlgorithm):
                                       'Maximum number of attempts exceeded.'))
 
         return {self.OUTPUT: dest_id}
+
+    def poissonDiskSampling(self, bbox, pointCount, minDistance, fields, sink, feedback):
+        random.seed()
+
+        feedback.setProgressText(self.tr('Generating points…'))
+        points = vector.poissonDiskPoints(bbox, minDistance, feedback=feedback)
+        if feedback.isCanceled():
+            return
+
+        if len(points) > pointCount:
+            # the sampling fills the whole extent, keep a random subset
+            points = random.sample(points, int(pointCount))
+        elif len(points) < pointCount:
+            feedback.pushInfo(self.tr('Could not generate requested number of random points. '
+                                      'Only {} points fit in the extent.').format(len(points)))
+
+        total = 100.0 / len(points) if points else 0
+        for nPoints, p in enumerate(points):
+            if feedback.isCanceled():
+                break
+
+            f = QgsFeature(nPoints)
+            f.initAttributes(1)
+            f.setFields(fields)
+            f.setAttribute('id', nPoints)
+            f.setGeometry(QgsGeometry.fromPointXY(p))
+            sink.addFeature(f, QgsFeatureSink.FastInsert)
+            feedback.setProgress(int(nPoints * total))
@@ -121,8 +121,7 @@ class RandomPointsLayer(QgisAlgorithm):
         maxIterations = pointCount * 200
         total = 100.0 / pointCount if pointCount else 1
 
-        index = QgsSpatialIndex()
-        points = dict()
+        grid = vector.PointDistanceGrid(minDistance)
 
         random.seed()
 
@@ -137,7 +136,7 @@ class RandomPointsLayer(QgisAlgorithm):
             geom = QgsGeometry.fromPointXY(p)
             ids = sourceIndex.intersects(geom.buffer(5, 5).boundingBox())
             if len(ids) > 0 and \
-                    vector.checkMinDistance(p, index, minDistance, points):
+                    grid.checkMinDistance(p):
                 request = QgsFeatureRequest().setFilterFids(ids).setSubsetOfAttributes([])
                 for f in source.getFeatures(request):
                     if feedback.isCanceled():
@@ -151,8 +150,7 @@ class RandomPointsLayer(QgisAlgorithm):
                         f.setAttribute('id', nPoints)
                         f.setGeometry(geom)
                         sink.addFeature(f, QgsFeatureSink.FastInsert)
-                        index.addFeature(f)
-                        points[nPoints] = p
+                        grid.addPoint(p)
                         nPoints += 1
                         feedback.setProgress(int(nPoints * total))
             nIterations += 1
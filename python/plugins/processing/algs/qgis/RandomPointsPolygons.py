@@ -36,9 +36,9 @@ from qgis.core import (QgsApplication,
                        QgsFeature,
                        QgsFields,
                        QgsGeometry,
+                       QgsPoint,
                        QgsPointXY,
                        QgsWkbTypes,
-                       QgsSpatialIndex,
                        QgsFeatureRequest,
                        QgsExpression,
                        QgsDistanceArea,
@@ -65,6 +65,7 @@ class RandomPointsPolygons(QgisAlgorithm):
     EXPRESSION = 'EXPRESSION'
     MIN_DISTANCE = 'MIN_DISTANCE'
     STRATEGY = 'STRATEGY'
+    METHOD = 'METHOD'
     OUTPUT = 'OUTPUT'
 
     def icon(self):
@@ -100,6 +101,16 @@ class RandomPointsPolygons(QgisAlgorithm):
         self.addParameter(QgsProcessingParameterDistance(self.MIN_DISTANCE,
                                                          self.tr('Minimum distance between points'),
                                                          0, self.INPUT, False, 0, 1000000000))
+
+        self.methods = [self.tr('Random points checked against the minimum distance'),
+                        self.tr('Poisson disk sampling')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Generation method'),
+                                                  options=self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
+
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
                                                             self.tr('Random points'),
                                                             type=QgsProcessing.TypeVectorPoint))
@@ -117,6 +128,10 @@ class RandomPointsPolygons(QgisAlgorithm):
 
         strategy = self.parameterAsEnum(parameters, self.STRATEGY, context)
         minDistance = self.parameterAsDouble(parameters, self.MIN_DISTANCE, context)
+        method = self.parameterAsEnum(parameters, self.METHOD, context)
+        if method == 1 and minDistance <= 0:
+            raise QgsProcessingException(
+                self.tr('Poisson disk sampling requires a minimum distance between points greater than 0.'))
 
         expression = QgsExpression(self.parameterAsString(parameters, self.EXPRESSION, context))
         if expression.hasParserError():
@@ -170,8 +185,11 @@ class RandomPointsPolygons(QgisAlgorithm):
                 feedback.pushInfo("Skip feature {} as number of points for it is 0.".format(f.id()))
                 continue
 
-            index = QgsSpatialIndex()
-            points = dict()
+            if method == 1:
+                self.poissonDiskSampling(engine, bbox, pointCount, minDistance, fields, sink, feedback)
+                continue
+
+            grid = vector.PointDistanceGrid(minDistance)
 
             nPoints = 0
             nIterations = 0
@@ -189,16 +207,15 @@ class RandomPointsPolygons(QgisAlgorithm):
 
                 p = QgsPointXY(rx, ry)
                 geom = QgsGeometry.fromPointXY(p)
-                if engine.contains(geom.constGet()) and \
-                        vector.checkMinDistance(p, index, minDistance, points):
+                if grid.checkMinDistance(p) and \
+                        engine.contains(geom.constGet()):
                     f = QgsFeature(nPoints)
                     f.initAttributes(1)
                     f.setFields(fields)
                     f.setAttribute('id', nPoints)
                     f.setGeometry(geom)
                     sink.addFeature(f, QgsFeatureSink.FastInsert)
-                    index.addFeature(f)
-                    points[nPoints] = p
+                    grid.addPoint(p)
                     nPoints += 1
                     feedback.setProgress(current_progress + int(nPoints * feature_total))
                 nIterations += 1
@@ -210,3 +227,27 @@ class RandomPointsPolygons(QgisAlgorithm):
         feedback.setProgress(100)
 
         return {self.OUTPUT: dest_id}
+
+    def poissonDiskSampling(self, engine, bbox, pointCount, minDistance, fields, sink, feedback):
+        random.seed()
+
+        points = vector.poissonDiskPoints(bbox, minDistance,
+                                          lambda point: engine.contains(QgsPoint(point)),
+                                          feedback)
+        if feedback.isCanceled():
+            return
+
+        if len(points) > pointCount:
+            # the sampling fills the whole polygon, keep a random subset
+            points = random.sample(points, pointCount)
+        elif len(points) < pointCount:
+            feedback.pushInfo(self.tr('Could not generate requested number of random points. '
+                                      'Only {} points fit in the polygon.').format(len(points)))
+
+        for nPoints, p in enumerate(points):
+            f = QgsFeature(nPoints)
+            f.initAttributes(1)
+            f.setFields(fields)
+            f.setAttribute('id', nPoints)
+            f.setGeometry(QgsGeometry.fromPointXY(p))
+            sink.addFeature(f, QgsFeatureSink.FastInsert)
@@ -77,16 +77,16 @@ class RasterLayerHistogram(QgisAlgorithm):
 
         output = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
 
-        # ALERT: this is potentially blocking if the layer is too big
-        values = raster.scanraster(layer, feedback, band)
-
-        valueslist = []
-        for v in values:
-            if v is not None:
-                valueslist.append(v)
-
-        data = [go.Histogram(x=valueslist,
-                             nbinsx=nbins)]
+        # bins are computed block by block, so only the bin counts are
+        # kept in memory whatever the raster size is
+        counts, edges = raster.rasterHistogram(layer, nbins, feedback, band)
+        if feedback.isCanceled():
+            return {}
+
+        centers = (edges[:-1] + edges[1:]) / 2
+        data = [go.Bar(x=centers.tolist(),
+                       y=counts.tolist(),
+                       width=(edges[1:] - edges[:-1]).tolist())]
         plt.offline.plot(data, filename=output, auto_open=False)
 
         return {self.OUTPUT: output}
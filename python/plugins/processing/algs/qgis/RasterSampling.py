@@ -27,9 +27,10 @@ __revision__ = '$Format:%H$'
 
 
 import os
+from itertools import islice
 
-from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtGui import QIcon, QPolygonF
+from qgis.PyQt.QtCore import QVariant, QPointF
 
 from qgis.core import (NULL,
                        QgsApplication,
@@ -42,6 +43,7 @@ from qgis.core import (NULL,
                        QgsProcessingParameterString,
                        QgsProcessingParameterDefinition,
                        QgsCoordinateTransform,
+                       QgsCsException,
                        QgsFields,
                        QgsProcessingUtils,
                        QgsProcessingException,
@@ -49,6 +51,7 @@ from qgis.core import (NULL,
                        QgsProcessingParameterFeatureSink)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
+from processing.tools import raster
 
 
 class RasterSampling(QgisAlgorithm):
@@ -58,6 +61,9 @@ class RasterSampling(QgisAlgorithm):
     COLUMN_PREFIX = 'COLUMN_PREFIX'
     OUTPUT = 'OUTPUT'
 
+    # number of features sampled and written at once
+    CHUNK_SIZE = 10000
+
     def name(self):
         return 'rastersampling'
 
@@ -152,50 +158,86 @@ class RasterSampling(QgisAlgorithm):
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
         total = 100.0 / source.featureCount() if source.featureCount() else 0
-        features = source.getFeatures()
 
         # create the coordinates transformation context
         ct = QgsCoordinateTransform(source.sourceCrs(), sampled_raster.crs(), context.transformContext())
 
-        for n, i in enumerate(source.getFeatures()):
-
-            attrs = i.attributes()
-
-            if i.geometry().isMultipart() and i.geometry().constGet().partCount() > 1:
-                sink.addFeature(i, QgsFeatureSink.FastInsert)
-                feedback.setProgress(int(n * total))
-                feedback.reportError(self.tr('Impossible to sample data of multipart feature {}.').format(i.id()))
-                continue
+        provider = sampled_raster.dataProvider()
+        band_count = sampled_raster.bandCount()
+        sampler = None
+        if raster.RasterBlockSampler.canSample(provider):
+            sampler = raster.RasterBlockSampler(provider)
 
-            # get the feature geometry as point
-            point = QgsPointXY()
-            if i.geometry().isMultipart():
-                point = i.geometry().asMultiPoint()[0]
-            else:
-                point = i.geometry().asPoint()
+        features = source.getFeatures()
+        current = 0
+        while not feedback.isCanceled():
+            chunk = list(islice(features, self.CHUNK_SIZE))
+            if not chunk:
+                break
+
+            # get the features geometries as points
+            points = {}
+            for n, i in enumerate(chunk):
+                if i.geometry().isMultipart() and i.geometry().constGet().partCount() > 1:
+                    feedback.reportError(self.tr('Impossible to sample data of multipart feature {}.').format(i.id()))
+                elif i.geometry().isMultipart():
+                    points[n] = i.geometry().asMultiPoint()[0]
+                else:
+                    points[n] = i.geometry().asPoint()
 
             # reproject to raster crs
-            try:
-                point = ct.transform(point)
-            except QgsCsException:
-                for b in range(sampled_raster.bandCount()):
-                    attrs.append(None)
-                i.setAttributes(attrs)
-                sink.addFeature(i, QgsFeatureSink.FastInsert)
-                feedback.setProgress(int(n * total))
-                feedback.reportError(self.tr('Could not reproject feature {} to raster CRS').format(i.id()))
-                continue
-
-            for b in range(sampled_raster.bandCount()):
-                value, ok = sampled_raster.dataProvider().sample(point, b + 1)
-                if ok:
-                    attrs.append(value)
+            located = []
+            for n, point in zip(points.keys(), self.transformPoints(ct, list(points.values()))):
+                if point is None:
+                    feedback.reportError(self.tr('Could not reproject feature {} to raster CRS').format(chunk[n].id()))
                 else:
-                    attrs.append(NULL)
+                    located.append(n)
+                points[n] = point
+
+            values = {n: [None] * band_count for n in points}
+            if sampler is not None:
+                # sample points sorted by raster block, so that each block is read only once
+                cells = {n: sampler.cell(points[n]) for n in located}
+                for n in sorted(located, key=lambda n: sampler.block(cells[n]) if cells[n] is not None else (-1, -1)):
+                    values[n] = sampler.sample(cells[n])
+            else:
+                for n in located:
+                    for b in range(band_count):
+                        value, ok = provider.sample(points[n], b + 1)
+                        if ok:
+                            values[n][b] = value
 
-            i.setAttributes(attrs)
+            for n, sampled in values.items():
+                attrs = chunk[n].attributes()
+                attrs.extend(NULL if value is None else value for value in sampled)
+                chunk[n].setAttributes(attrs)
 
-            sink.addFeature(i, QgsFeatureSink.FastInsert)
-            feedback.setProgress(int(n * total))
+            sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+            current += len(chunk)
+            feedback.setProgress(int(current * total))
 
         return {self.OUTPUT: dest_id}
+
+    def transformPoints(self, ct, points):
+        """
+        Transforms a list of points at once, with None for points which
+        cannot be transformed.
+        """
+        if ct.isShortCircuited():
+            return list(points)
+
+        polygon = QPolygonF([QPointF(p.x(), p.y()) for p in points])
+        try:
+            ct.transformPolygon(polygon)
+            return [QgsPointXY(p) for p in polygon]
+        except QgsCsException:
+            pass
+
+        # at least one point failed, transform them one by one
+        transformed = []
+        for p in points:
+            try:
+                transformed.append(ct.transform(p))
+            except QgsCsException:
+                transformed.append(None)
+        return transformed
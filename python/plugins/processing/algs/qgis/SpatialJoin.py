@@ -25,18 +25,27 @@ __copyright__ = '(C) 2013, Joshua Arnott'
 
 __revision__ = '$Format:%H$'
 
+import heapq
 import os
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from qgis.PyQt.QtCore import QThread
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import (QgsFields,
+from qgis.core import (QgsApplication,
+                       QgsFields,
+                       QgsFeature,
                        QgsFeatureSink,
                        QgsFeatureRequest,
                        QgsGeometry,
+                       QgsRectangle,
+                       QgsSpatialIndex,
                        QgsProcessing,
                        QgsProcessingUtils,
                        QgsProcessingException,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterField,
@@ -58,10 +67,14 @@ class SpatialJoin(QgisAlgorithm):
     METHOD = "METHOD"
     DISCARD_NONMATCHING = "DISCARD_NONMATCHING"
     PREFIX = "PREFIX"
+    PARTITIONED = "PARTITIONED"
     OUTPUT = "OUTPUT"
     NON_MATCHING = "NON_MATCHING"
     JOINED_COUNT = "JOINED_COUNT"
 
+    # maximum number of join features of the spatial partitions processed by each thread
+    PARTITION_SIZE = 5000
+
     def group(self):
         return self.tr('Vector general')
 
@@ -122,6 +135,11 @@ class SpatialJoin(QgisAlgorithm):
                                                         defaultValue=False))
         self.addParameter(QgsProcessingParameterString(self.PREFIX,
                                                        self.tr('Joined field prefix'), optional=True))
+        partitioned = QgsProcessingParameterBoolean(self.PARTITIONED,
+                                                    self.tr('Load layers in memory and join spatial partitions in parallel'),
+                                                    defaultValue=False)
+        partitioned.setFlags(partitioned.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(partitioned)
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
                                                             self.tr('Joined layer'),
                                                             QgsProcessing.TypeVectorAnyGeometry,
@@ -159,6 +177,7 @@ class SpatialJoin(QgisAlgorithm):
         method = self.parameterAsEnum(parameters, self.METHOD, context)
         discard_nomatch = self.parameterAsBool(parameters, self.DISCARD_NONMATCHING, context)
         prefix = self.parameterAsString(parameters, self.PREFIX, context)
+        partitioned = self.parameterAsBool(parameters, self.PARTITIONED, context)
 
         source_fields = source.fields()
         fields_to_join = QgsFields()
@@ -201,13 +220,35 @@ class SpatialJoin(QgisAlgorithm):
         predicates = [self.reversed_predicates[self.predicates[i][0]] for i in
                       self.parameterAsEnums(parameters, self.PREDICATE, context)]
 
+        request = QgsFeatureRequest().setSubsetOfAttributes(join_field_indexes).setDestinationCrs(source.sourceCrs(), context.transformContext())
+        if partitioned:
+            joined_count = self.partitioned_join(source, join_source, request, join_field_indexes, predicates, method,
+                                                 discard_nomatch, sink, non_matching_sink, feedback)
+        else:
+            joined_count = self.join(source, join_source, request, join_field_indexes, predicates, method,
+                                     discard_nomatch, sink, non_matching_sink, feedback)
+
+        result = {}
+        if sink is not None:
+            result[self.OUTPUT] = dest_id
+        if non_matching_sink is not None:
+            result[self.NON_MATCHING] = non_matching_dest_id
+
+        result[self.JOINED_COUNT] = joined_count
+
+        return result
+
+    def join(self, source, join_source, request, join_field_indexes, predicates, method,
+             discard_nomatch, sink, non_matching_sink, feedback):
+        """
+        Joins features by querying the input source around each join feature
+        """
         remaining = set()
         if not discard_nomatch or non_matching_sink is not None:
             remaining = set(source.allFeatureIds())
 
         added_set = set()
 
-        request = QgsFeatureRequest().setSubsetOfAttributes(join_field_indexes).setDestinationCrs(source.sourceCrs(), context.transformContext())
         features = join_source.getFeatures(request)
         total = 100.0 / join_source.featureCount() if join_source.featureCount() else 0
 
@@ -224,8 +265,7 @@ class SpatialJoin(QgisAlgorithm):
             bbox = f.geometry().boundingBox()
             engine = None
 
-            request = QgsFeatureRequest().setFilterRect(bbox)
-            for test_feat in source.getFeatures(request):
+            for test_feat in source.getFeatures(QgsFeatureRequest().setFilterRect(bbox)):
                 if feedback.isCanceled():
                     break
                 if method == 1 and test_feat.id() in added_set:
@@ -265,12 +305,127 @@ class SpatialJoin(QgisAlgorithm):
                 if non_matching_sink is not None:
                     non_matching_sink.addFeature(f, QgsFeatureSink.FastInsert)
 
-        result = {}
-        if sink is not None:
-            result[self.OUTPUT] = dest_id
-        if non_matching_sink is not None:
-            result[self.NON_MATCHING] = non_matching_dest_id
+        return len(added_set)
+
+    def partitioned_join(self, source, join_source, request, join_field_indexes, predicates, method,
+                         discard_nomatch, sink, non_matching_sink, feedback):
+        """
+        Joins features after loading both sources in memory, matching
+        spatial partitions of the join features in a pool of threads
+        """
+        feedback.setProgressText(self.tr('Loading features…'))
+        input_features = []
+        input_bounds = []
+        index = QgsSpatialIndex()
+        for f in source.getFeatures():
+            if feedback.isCanceled():
+                return 0
+
+            if f.hasGeometry():
+                bounds = f.geometry().boundingBox()
+                index.addFeature(len(input_features), bounds)
+            else:
+                bounds = None
+            input_features.append(f)
+            input_bounds.append(bounds)
+
+        join_geometries = []
+        join_attributes = []
+        for f in join_source.getFeatures(request):
+            if feedback.isCanceled():
+                return 0
+
+            if f.hasGeometry():
+                join_geometries.append(f.geometry())
+                join_attributes.append([f[a] for a in join_field_indexes])
+        join_bounds = [g.boundingBox() for g in join_geometries]
+
+        feedback.setProgressText(self.tr('Joining features…'))
+        partitions = vector.spatialPartitions(join_bounds, self.PARTITION_SIZE)
+
+        max_threads = QgsApplication.maxThreads()
+        if max_threads < 1:
+            max_threads = QThread.idealThreadCount()
+
+        partition_matches = [None] * len(partitions)
+        total = 80.0 / len(partitions) if partitions else 0
+        with ThreadPoolExecutor(max_workers=max(1, max_threads)) as executor:
+            futures = {}
+            for i, partition in enumerate(partitions):
+                partition_bounds = QgsRectangle(join_bounds[partition[0]])
+                for position in partition:
+                    partition_bounds.combineExtentWith(join_bounds[position])
+                candidates = index.intersects(partition_bounds)
+                futures[executor.submit(self.partition_matches, partition, candidates, join_geometries, join_bounds,
+                                        input_features, input_bounds, predicates, feedback)] = i
+
+            for current, future in enumerate(as_completed(futures)):
+                partition_matches[futures[future]] = future.result()
+                feedback.setProgress(int((current + 1) * total))
+
+        if feedback.isCanceled():
+            return 0
+
+        # output matches in the join features order, as when querying the input source
+        added_set = set()
+        for join_position, position in heapq.merge(*partition_matches):
+            if feedback.isCanceled():
+                break
+            if method == 1 and position in added_set:
+                # already added this feature, and user has opted to only output first match
+                continue
 
-        result[self.JOINED_COUNT] = len(added_set)
+            added_set.add(position)
+            if sink is not None:
+                output_feature = QgsFeature(input_features[position])
+                attributes = output_feature.attributes()
+                attributes.extend(join_attributes[join_position])
+                output_feature.setAttributes(attributes)
+                sink.addFeature(output_feature, QgsFeatureSink.FastInsert)
 
-        return result
+        feedback.setProgress(90)
+
+        if not discard_nomatch or non_matching_sink is not None:
+            for position, f in enumerate(input_features):
+                if feedback.isCanceled():
+                    break
+                if position in added_set:
+                    continue
+                if sink is not None:
+                    sink.addFeature(f, QgsFeatureSink.FastInsert)
+                if non_matching_sink is not None:
+                    non_matching_sink.addFeature(f, QgsFeatureSink.FastInsert)
+
+        return len(added_set)
+
+    @staticmethod
+    def partition_matches(partition, candidates, join_geometries, join_bounds, input_features, input_bounds,
+                          predicates, feedback):
+        """
+        Returns the sorted (join feature position, input feature position)
+        pairs of the join features of a partition and the input features
+        matching any of the predicates.
+
+        Runs in a worker thread: candidates are the positions of all the
+        input features which may match join features of the partition.
+        """
+        index = QgsSpatialIndex()
+        for position in candidates:
+            index.addFeature(position, input_bounds[position])
+
+        matches = []
+        for join_position in partition:
+            if feedback.isCanceled():
+                break
+
+            engine = QgsGeometry.createGeometryEngine(join_geometries[join_position].constGet())
+            engine.prepareGeometry()
+
+            for position in sorted(index.intersects(join_bounds[join_position])):
+                geometry = input_features[position].geometry().constGet()
+                for predicate in predicates:
+                    if getattr(engine, predicate)(geometry):
+                        matches.append((join_position, position))
+                        break
+
+        return matches
@@ -26,7 +26,6 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 from qgis.core import (QgsProcessingParameterFeatureSource,
-                       QgsStatisticalSummary,
                        QgsDateTimeStatisticalSummary,
                        QgsStringStatisticalSummary,
                        QgsFeatureRequest,
@@ -46,8 +45,12 @@ from qgis.core import (QgsProcessingParameterFeatureSource,
 from qgis.PyQt.QtCore import QVariant
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 
+import array
+import math
 from collections import defaultdict
 
+import numpy
+
 
 class StatisticsByCategories(QgisAlgorithm):
     INPUT = 'INPUT'
@@ -55,6 +58,10 @@ class StatisticsByCategories(QgisAlgorithm):
     CATEGORIES_FIELD_NAME = 'CATEGORIES_FIELD_NAME'
     OUTPUT = 'OUTPUT'
 
+    # groups with up to this number of values have their sums computed
+    # together, larger groups are summed one at a time
+    SUM_RANKS = 64
+
     def group(self):
         return self.tr('Vector analysis')
 
@@ -175,6 +182,12 @@ class StatisticsByCategories(QgisAlgorithm):
         total = 50.0 / source.featureCount() if source.featureCount() else 0
         if field_type == 'none':
             values = defaultdict(lambda: 0)
+        elif field_type == 'numeric':
+            # numeric values are stored in arrays, along with the index of
+            # their category in categories (in order of first appearance)
+            categories = {}
+            codes = array.array('q')
+            values = array.array('d')
         else:
             values = defaultdict(list)
         for current, feat in enumerate(features):
@@ -190,8 +203,9 @@ class StatisticsByCategories(QgisAlgorithm):
             if field_type == 'numeric':
                 if attrs[value_field_index] == NULL:
                     continue
-                else:
-                    value = float(attrs[value_field_index])
+                codes.append(categories.setdefault(cat, len(categories)))
+                values.append(float(attrs[value_field_index]))
+                continue
             elif field_type == 'string':
                 if attrs[value_field_index] == NULL:
                     value = ''
@@ -211,7 +225,7 @@ class StatisticsByCategories(QgisAlgorithm):
         if field_type == 'none':
             self.saveCounts(values, sink, feedback)
         elif field_type == 'numeric':
-            self.calcNumericStats(values, sink, feedback)
+            self.calcNumericStats(categories, codes, values, sink, feedback)
         elif field_type == 'datetime':
             self.calcDateTimeStats(values, sink, feedback)
         else:
@@ -232,36 +246,115 @@ class StatisticsByCategories(QgisAlgorithm):
             sink.addFeature(f, QgsFeatureSink.FastInsert)
             current += 1
 
-    def calcNumericStats(self, values, sink, feedback):
-        stat = QgsStatisticalSummary()
-
-        total = 50.0 / len(values) if values else 0
-        current = 0
-        for cat, v in values.items():
+    def calcNumericStats(self, categories, codes, values, sink, feedback):
+        """
+        Calculates the statistics of all categories at once with numpy,
+        giving the same results as QgsStatisticalSummary.
+        """
+        if not categories:
+            return
+        codes = numpy.frombuffer(codes, dtype=numpy.int64)
+        values = numpy.frombuffer(values, dtype=numpy.float64)
+        counts = numpy.bincount(codes, minlength=len(categories))
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        ends = starts + counts
+
+        # values grouped by category, in their original order
+        grouped = values[numpy.argsort(codes, kind='stable')]
+        sums = self.sequentialSums(grouped, starts, counts)
+        means = sums / counts
+        deviations = grouped - numpy.repeat(means, counts)
+        variances = self.sequentialSums(deviations * deviations, starts, counts) / counts
+        del grouped, deviations
+        if feedback.isCanceled():
+            return
+
+        # values grouped by category and sorted
+        order = numpy.lexsort((values, codes))
+        sorted_values = values[order]
+        sorted_codes = codes[order]
+        del order
+
+        def at(offsets):
+            # offsets are only valid for some categories, others are discarded
+            return sorted_values[numpy.clip(starts + offsets, 0, len(sorted_values) - 1)]
+
+        def middle(count, offset=0):
+            # median of count sorted values, from offset in each category
+            return numpy.where(count % 2 == 0,
+                               (at(offset + count // 2 - 1) + at(offset + count // 2)) / 2.0,
+                               at(offset + (count + 1) // 2 - 1))
+
+        mins = sorted_values[starts]
+        maxs = sorted_values[ends - 1]
+        medians = middle(counts)
+        even = counts % 2 == 0
+        half_counts = numpy.where(even, counts // 2, counts // 2 + 1)
+        first_quartiles = middle(half_counts)
+        third_quartiles = numpy.where(even,
+                                      middle(half_counts, half_counts),
+                                      middle(half_counts, half_counts - 1))
+
+        # runs of equal values in each category
+        run_starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_values[1:] != sorted_values[:-1]))))
+        run_counts = numpy.diff(numpy.append(run_starts, len(sorted_values)))
+        run_codes = sorted_codes[run_starts]
+        run_values = sorted_values[run_starts]
+        varieties = numpy.bincount(run_codes, minlength=len(categories))
+        first_runs = numpy.concatenate(([0], numpy.cumsum(varieties)[:-1]))
+        # ties are resolved with the smallest value, as QgsStatisticalSummary does
+        run_indexes = numpy.arange(len(run_starts))
+        minorities = run_values[numpy.lexsort((run_indexes, run_counts, run_codes))[first_runs]]
+        majorities = run_values[numpy.lexsort((run_indexes, -run_counts, run_codes))[first_runs]]
+
+        total = 50.0 / len(categories)
+        for current, cat in enumerate(categories):
             if feedback.isCanceled():
                 break
 
             feedback.setProgress(int(current * total) + 50)
 
-            stat.calculate(v)
             f = QgsFeature()
-            f.setAttributes(list(cat) + [stat.count(),
-                                         stat.variety(),
-                                         stat.min(),
-                                         stat.max(),
-                                         stat.range(),
-                                         stat.sum(),
-                                         stat.mean(),
-                                         stat.median(),
-                                         stat.stDev(),
-                                         stat.minority(),
-                                         stat.majority(),
-                                         stat.firstQuartile(),
-                                         stat.thirdQuartile(),
-                                         stat.interQuartileRange()])
+            f.setAttributes(list(cat) + [int(counts[current]),
+                                         int(varieties[current]),
+                                         float(mins[current]),
+                                         float(maxs[current]),
+                                         float(maxs[current] - mins[current]),
+                                         float(sums[current]),
+                                         float(means[current]),
+                                         float(medians[current]),
+                                         # same as std::pow, numpy.power and sqrt may differ
+                                         math.pow(variances[current], 0.5),
+                                         float(minorities[current]),
+                                         float(majorities[current]),
+                                         float(first_quartiles[current]),
+                                         float(third_quartiles[current]),
+                                         float(third_quartiles[current] - first_quartiles[current])])
 
             sink.addFeature(f, QgsFeatureSink.FastInsert)
-            current += 1
+
+    def sequentialSums(self, values, starts, counts):
+        """
+        Returns the sums of groups of consecutive values, adding values one
+        after the other as QgsStatisticalSummary does (numpy.sum uses
+        pairwise summation, which may differ in the last digits).
+        """
+        sums = numpy.zeros(len(counts))
+
+        # add the n-th value of all small groups at once
+        groups = numpy.flatnonzero(counts <= self.SUM_RANKS)
+        for rank in range(self.SUM_RANKS):
+            groups = groups[counts[groups] > rank]
+            if not len(groups):
+                break
+            sums[groups] += values[starts[groups] + rank]
+
+        # cumulative sums are computed one value after the other
+        for group in numpy.flatnonzero(counts > self.SUM_RANKS):
+            sums[group] = numpy.cumsum(values[starts[group]:starts[group] + counts[group]])[-1]
+
+        return sums
 
     def calcDateTimeStats(self, values, sink, feedback):
         stat = QgsDateTimeStatisticalSummary()
@@ -25,15 +25,21 @@ __copyright__ = '(C) 2017, Nyall Dawson'
 
 __revision__ = '$Format:%H$'
 
+import heapq
+import math
 import os
 import operator
 import sys
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from qgis.core import (QgsField,
+from qgis.core import (QgsApplication,
+                       QgsField,
+                       QgsFeatureRequest,
                        QgsFeatureSink,
                        QgsGeometry,
+                       QgsRectangle,
                        QgsSpatialIndex,
                        QgsPointXY,
                        NULL,
@@ -45,7 +51,8 @@ from qgis.core import (QgsField,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterFeatureSink)
 
-from qgis.PyQt.QtCore import (QVariant)
+from qgis.PyQt.QtCore import (QVariant,
+                              QThread)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 
@@ -59,6 +66,9 @@ class TopoColor(QgisAlgorithm):
     BALANCE = 'BALANCE'
     OUTPUT = 'OUTPUT'
 
+    # maximum number of features of the spatial partitions processed by each thread
+    PARTITION_SIZE = 5000
+
     def tags(self):
         return self.tr('topocolor,colors,graph,adjacent,assign').split(',')
 
@@ -117,10 +127,16 @@ class TopoColor(QgisAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        features = {f.id(): f for f in source.getFeatures()}
+        # only keep geometries in memory, attributes are read again when writing the output
+        geometries = {}
+        for f in source.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            if feedback.isCanceled():
+                break
+            if f.hasGeometry():
+                geometries[f.id()] = f.geometry()
 
-        topology, id_graph = self.compute_graph(features, feedback, min_distance=min_distance)
-        feature_colors = ColoringAlgorithm.balanced(features,
+        topology, id_graph = self.compute_graph(geometries, feedback, min_distance=min_distance)
+        feature_colors = ColoringAlgorithm.balanced(geometries,
                                                     balance=balance_by,
                                                     graph=topology,
                                                     feedback=feedback,
@@ -132,82 +148,165 @@ class TopoColor(QgisAlgorithm):
         max_colors = max(feature_colors.values())
         feedback.pushInfo(self.tr('{} colors required').format(max_colors))
 
-        total = 20.0 / len(features)
-        current = 0
-        for feature_id, input_feature in features.items():
+        total = 20.0 / source.featureCount() if source.featureCount() else 0
+        for current, output_feature in enumerate(source.getFeatures()):
             if feedback.isCanceled():
                 break
 
-            output_feature = input_feature
-            attributes = input_feature.attributes()
-            if feature_id in feature_colors:
-                attributes.append(feature_colors[feature_id])
+            attributes = output_feature.attributes()
+            if output_feature.id() in feature_colors:
+                attributes.append(feature_colors[output_feature.id()])
             else:
                 attributes.append(NULL)
             output_feature.setAttributes(attributes)
 
             sink.addFeature(output_feature, QgsFeatureSink.FastInsert)
-            current += 1
             feedback.setProgress(80 + int(current * total))
 
         return {self.OUTPUT: dest_id}
 
     @staticmethod
-    def compute_graph(features, feedback, create_id_graph=False, min_distance=0):
-        """ compute topology from a layer/field """
+    def compute_graph(geometries, feedback, create_id_graph=False, min_distance=0):
+        """ compute topology from a {feature id: geometry} dict
+
+        Features are split into spatial partitions, and the neighbours of the
+        features of each partition are searched in a pool of threads.
+        """
         s = Graph(sort_graph=False)
         id_graph = None
         if create_id_graph:
             id_graph = Graph(sort_graph=True)
 
-        # skip features without geometry
-        features_with_geometry = {f_id: f for (f_id, f) in features.items() if f.hasGeometry()}
+        # features are referred to by their position in the input
+        ids = list(geometries.keys())
+        geometry_list = list(geometries.values())
 
-        total = 70.0 / len(features_with_geometry) if features_with_geometry else 1
         index = QgsSpatialIndex()
+        bounds = []
+        for position, g in enumerate(geometry_list):
+            if feedback.isCanceled():
+                return s, id_graph
+
+            g_bounds = g.boundingBox()
+            index.addFeature(position, g_bounds)
+            bounds.append(g_bounds)
+
+        partitions = TopoColor.spatial_partitions(bounds, TopoColor.PARTITION_SIZE)
+
+        max_threads = QgsApplication.maxThreads()
+        if max_threads < 1:
+            max_threads = QThread.idealThreadCount()
+
+        partition_edges = [None] * len(partitions)
+        total = 70.0 / len(partitions) if partitions else 1
+        with ThreadPoolExecutor(max_workers=max(1, max_threads)) as executor:
+            futures = {}
+            for i, partition in enumerate(partitions):
+                partition_bounds = TopoColor.query_bounds(bounds[partition[0]], min_distance)
+                for position in partition:
+                    partition_bounds.combineExtentWith(TopoColor.query_bounds(bounds[position], min_distance))
+                candidates = index.intersects(partition_bounds)
+                futures[executor.submit(TopoColor.partition_edges, partition, candidates,
+                                        geometry_list, bounds, min_distance, feedback)] = i
+
+            for current, future in enumerate(as_completed(futures)):
+                partition_edges[futures[future]] = future.result()
+                feedback.setProgress(int((current + 1) * total))
+
+        if feedback.isCanceled():
+            return s, id_graph
+
+        # add edges in input order, so that the coloring does not depend on the partitioning
+        for position, neighbour in heapq.merge(*partition_edges):
+            s.add_edge(ids[position], ids[neighbour])
+            s.add_edge(ids[neighbour], ids[position])
+            if id_graph:
+                id_graph.add_edge(ids[position], ids[neighbour])
+
+        for feature_id in ids:
+            if feedback.isCanceled():
+                break
 
-        i = 0
-        for feature_id, f in features_with_geometry.items():
+            if feature_id not in s.node_edge:
+                s.add_edge(feature_id, None)
+
+        return s, id_graph
+
+    @staticmethod
+    def spatial_partitions(bounds, partition_size):
+        """
+        Splits positions of the bounding boxes into partitions of at most
+        partition_size neighbouring boxes, by sorting boxes into vertical
+        strips by their center x and then into tiles by their center y.
+        Positions are sorted in each partition.
+        """
+        count = len(bounds)
+        if count == 0:
+            return []
+
+        tile_count = int(math.ceil(count / partition_size))
+        strip_size = int(math.ceil(count / math.ceil(math.sqrt(tile_count)))) if tile_count > 1 else count
+
+        by_x = sorted(range(count), key=lambda p: bounds[p].center().x())
+        partitions = []
+        for strip_start in range(0, count, strip_size):
+            strip = sorted(by_x[strip_start:strip_start + strip_size], key=lambda p: bounds[p].center().y())
+            for tile_start in range(0, len(strip), partition_size):
+                partitions.append(sorted(strip[tile_start:tile_start + partition_size]))
+        return partitions
+
+    @staticmethod
+    def query_bounds(bounds, min_distance):
+        """
+        Returns the rectangle in which features touching (or closer than
+        min_distance to) a feature with the given bounds are searched.
+        """
+        query_bounds = QgsRectangle(bounds)
+        if min_distance > 0:
+            query_bounds.grow(min_distance)
+        # grow bounds a little so we get touching features
+        query_bounds.grow(query_bounds.width() * 0.01)
+        return query_bounds
+
+    @staticmethod
+    def partition_edges(partition, candidates, geometries, bounds, min_distance, feedback):
+        """
+        Returns the (position, neighbour position) pairs, sorted, of the
+        features of a partition touching (or closer than min_distance to)
+        features preceding them in the input.
+
+        Runs in a worker thread: candidates are the positions of all the
+        features which may touch features of the partition.
+        """
+        index = QgsSpatialIndex()
+        for position in candidates:
+            index.addFeature(position, bounds[position])
+
+        edges = []
+        for position in partition:
             if feedback.isCanceled():
                 break
 
-            g = f.geometry()
+            g = geometries[position]
             if min_distance > 0:
                 g = g.buffer(min_distance, 5)
 
             engine = QgsGeometry.createGeometryEngine(g.constGet())
             engine.prepareGeometry()
 
-            feature_bounds = g.boundingBox()
-            # grow bounds a little so we get touching features
-            feature_bounds.grow(feature_bounds.width() * 0.01)
-            intersections = index.intersects(feature_bounds)
-            for l2 in intersections:
-                f2 = features_with_geometry[l2]
-                if engine.intersects(f2.geometry().constGet()):
-                    s.add_edge(f.id(), f2.id())
-                    s.add_edge(f2.id(), f.id())
-                    if id_graph:
-                        id_graph.add_edge(f.id(), f2.id())
-
-            index.addFeature(f)
-            i += 1
-            feedback.setProgress(int(i * total))
-
-        for feature_id, f in features_with_geometry.items():
-            if feedback.isCanceled():
-                break
+            # only test features preceding this one, so that each pair is tested once
+            neighbours = sorted(p for p in index.intersects(TopoColor.query_bounds(bounds[position], min_distance)) if p < position)
+            for neighbour in neighbours:
+                if engine.intersects(geometries[neighbour].constGet()):
+                    edges.append((position, neighbour))
 
-            if feature_id not in s.node_edge:
-                s.add_edge(feature_id, None)
-
-        return s, id_graph
+        return edges
 
 
 class ColoringAlgorithm:
 
     @staticmethod
-    def balanced(features, graph, feedback, balance=0, min_colors=4):
+    def balanced(geometries, graph, feedback, balance=0, min_colors=4):
         feature_colors = {}
         # start with minimum number of colors in pool
         color_pool = set(range(1, min_colors + 1))
@@ -248,7 +347,7 @@ class ColoringAlgorithm:
             if len(available_colors) == 0:
                 # no existing colors available for this feature, so add new color to pool and repeat
                 min_colors += 1
-                return ColoringAlgorithm.balanced(features, graph, feedback, balance, min_colors)
+                return ColoringAlgorithm.balanced(geometries, graph, feedback, balance, min_colors)
             else:
                 if balance == 0:
                     # choose least used available color
@@ -258,10 +357,10 @@ class ColoringAlgorithm:
                 elif balance == 1:
                     areas = [(c, v) for c, v in color_areas.items() if c in available_colors]
                     feature_color = sorted(areas, key=operator.itemgetter(1))[0][0]
-                    color_areas[feature_color] += features[feature_id].geometry().area()
+                    color_areas[feature_color] += geometries[feature_id].area()
                 elif balance == 2:
                     min_distances = {c: sys.float_info.max for c in available_colors}
-                    this_feature_centroid = features[feature_id].geometry().centroid().constGet()
+                    this_feature_centroid = geometries[feature_id].centroid().constGet()
 
                     # find features for all available colors
                     other_features = {f_id: c for (f_id, c) in feature_colors.items() if c in available_colors}
@@ -272,7 +371,7 @@ class ColoringAlgorithm:
                         if feedback.isCanceled():
                             break
 
-                        other_geometry = features[other_feature_id].geometry()
+                        other_geometry = geometries[other_feature_id]
                         other_centroid = other_geometry.centroid().constGet()
 
                         distance = this_feature_centroid.distanceSquared(other_centroid)
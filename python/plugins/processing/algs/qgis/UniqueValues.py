@@ -27,11 +27,18 @@ __revision__ = '$Format:%H$'
 
 import os
 import codecs
+import pickle
+import shutil
+import sqlite3
 
+from qgis.PyQt.QtCore import QVariant
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import (QgsApplication,
+from qgis.core import (NULL,
+                       QgsApplication,
                        QgsCoordinateReferenceSystem,
+                       QgsDataSourceUri,
+                       QgsProviderRegistry,
                        QgsWkbTypes,
                        QgsFeature,
                        QgsFeatureSink,
@@ -39,15 +46,20 @@ from qgis.core import (QgsApplication,
                        QgsFields,
                        QgsProcessing,
                        QgsProcessingException,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterField,
+                       QgsProcessingParameterNumber,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingOutputNumber,
                        QgsProcessingOutputString,
                        QgsProcessingFeatureSource,
+                       QgsProcessingFeatureSourceDefinition,
                        QgsProcessingParameterFileDestination)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
+from processing.tools import postgis
+from processing.tools.system import getTempDirInTempFolder
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -56,6 +68,7 @@ class UniqueValues(QgisAlgorithm):
 
     INPUT = 'INPUT'
     FIELDS = 'FIELDS'
+    MAX_VALUES_IN_MEMORY = 'MAX_VALUES_IN_MEMORY'
     TOTAL_VALUES = 'TOTAL_VALUES'
     UNIQUE_VALUES = 'UNIQUE_VALUES'
     OUTPUT = 'OUTPUT'
@@ -82,6 +95,12 @@ class UniqueValues(QgisAlgorithm):
         self.addParameter(QgsProcessingParameterField(self.FIELDS,
                                                       self.tr('Target field(s)'),
                                                       parentLayerParameterName=self.INPUT, type=QgsProcessingParameterField.Any, allowMultiple=True))
+        max_values = QgsProcessingParameterNumber(self.MAX_VALUES_IN_MEMORY,
+                                                  self.tr('Maximum number of values kept in memory, spilling to disk beyond (0 for no limit)'),
+                                                  QgsProcessingParameterNumber.Integer,
+                                                  defaultValue=0, minValue=0, optional=True)
+        max_values.setFlags(max_values.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(max_values)
 
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Unique values'), optional=True, defaultValue=''))
 
@@ -115,25 +134,37 @@ class UniqueValues(QgisAlgorithm):
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                fields, QgsWkbTypes.NoGeometry, QgsCoordinateReferenceSystem())
 
+        max_values = self.parameterAsInt(parameters, self.MAX_VALUES_IN_MEMORY, context)
+
         results = {}
-        values = set()
         if len(field_indices) == 1:
             # one field, can use provider optimised method
             values = tuple([v] for v in source.uniqueValues(field_indices[0]))
         else:
-            # have to scan whole table
-            # TODO - add this support to QgsVectorDataProvider so we can run it on
-            # the backend
-            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
-            request.setSubsetOfAttributes(field_indices)
-            total = 100.0 / source.featureCount() if source.featureCount() else 0
-            for current, f in enumerate(source.getFeatures(request, QgsProcessingFeatureSource.FlagSkipGeometryValidityChecks)):
+            rows = self.databaseUniqueRows(parameters, context, [f.name() for f in fields], feedback)
+            if rows is None:
+                # have to scan whole table
+                rows = self.featureRows(source, field_indices, feedback)
+            if max_values > 0:
+                values = SpillingValueSet(max_values, getTempDirInTempFolder())
+            else:
+                values = set()
+            for value in rows:
                 if feedback.isCanceled():
                     break
-
-                value = tuple(f.attribute(i) for i in field_indices)
                 values.add(value)
-                feedback.setProgress(int(current * total))
+
+        if isinstance(values, SpillingValueSet):
+            if values.spilled():
+                try:
+                    return self.spilledResults(values, sink, dest_id, parameters, context, feedback)
+                finally:
+                    values.close()
+
+            # the values fit in memory
+            spilling_values = values
+            values = set(spilling_values)
+            spilling_values.close()
 
         if sink:
             for value in values:
@@ -155,14 +186,262 @@ class UniqueValues(QgisAlgorithm):
                                                 values])
         return results
 
+    def featureRows(self, source, field_indices, feedback):
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(field_indices)
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+        for current, f in enumerate(source.getFeatures(request, QgsProcessingFeatureSource.FlagSkipGeometryValidityChecks)):
+            yield tuple(f.attribute(i) for i in field_indices)
+            feedback.setProgress(int(current * total))
+
+    def databaseUniqueRows(self, parameters, context, field_names, feedback):
+        """
+        Returns an iterator over the unique combinations of values of the fields
+        computed with a DISTINCT query by the database of the input layer, or None
+        if the input is not a PostgreSQL, SpatiaLite or GeoPackage table
+        """
+        definition = parameters.get(self.INPUT)
+        if isinstance(definition, QgsProcessingFeatureSourceDefinition) and definition.selectedFeaturesOnly:
+            return None
+
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if layer is None or layer.isModified() or not field_names:
+            return None
+
+        provider = layer.providerType()
+        if provider == 'postgres':
+            uri = QgsDataSourceUri(layer.source())
+            if uri.table().startswith('('):
+                return None
+            db = postgis.GeoDB(uri=uri)
+            rows = db.distinct_rows(uri.table(), field_names, uri.schema(), uri.sql())
+        elif provider == 'spatialite':
+            uri = QgsDataSourceUri(layer.source())
+            if uri.table().startswith('('):
+                return None
+            rows = self.sqliteDistinctRows(uri.database(), uri.table(), field_names, uri.sql())
+        elif provider == 'ogr' and layer.dataProvider().storageType() in ('GPKG', 'SQLite'):
+            parts = QgsProviderRegistry.instance().decodeUri(provider, layer.source())
+            if not parts.get('layerName') or (parts.get('subset') or '').lower().startswith('select '):
+                return None
+            rows = self.sqliteDistinctRows(parts['path'], parts['layerName'], field_names, parts.get('subset'))
+        else:
+            return None
+
+        feedback.pushInfo(self.tr('Computing unique values in the database of the input layer'))
+        return (tuple(NULL if v is None else v for v in row) for row in rows)
+
+    def sqliteDistinctRows(self, database, table, columns, where=None):
+        def quote(identifier):
+            return '"{}"'.format(identifier.replace('"', '""'))
+
+        sql = 'SELECT DISTINCT {} FROM {}'.format(', '.join(quote(c) for c in columns), quote(table))
+        if where:
+            sql += ' WHERE {}'.format(where)
+
+        con = sqlite3.connect(database)
+        try:
+            for row in con.execute(sql):
+                yield row
+        finally:
+            con.close()
+
+    def spilledResults(self, values, sink, dest_id, parameters, context, feedback):
+        """
+        Writes the outputs from the unique values of each bucket in turn,
+        as the unique values may not fit in memory
+        """
+        values.deduplicate(feedback)
+
+        results = {}
+        output_file = self.parameterAsFileOutput(parameters, self.OUTPUT_HTML_FILE, context)
+        html = None
+        if output_file:
+            html = codecs.open(output_file, 'w', encoding='utf-8')
+            self.writeHTMLHeader(html, len(values))
+
+        for value in values:
+            if feedback.isCanceled():
+                break
+
+            if sink:
+                f = QgsFeature()
+                f.setAttributes([attr for attr in value])
+                sink.addFeature(f, QgsFeatureSink.FastInsert)
+            if html:
+                self.writeHTMLValue(html, value)
+
+        if sink:
+            results[self.OUTPUT] = dest_id
+        if html:
+            self.writeHTMLFooter(html)
+            html.close()
+            results[self.OUTPUT_HTML_FILE] = output_file
+
+        results[self.TOTAL_VALUES] = len(values)
+        # a string with all values would not fit in memory
+        feedback.pushInfo(self.tr('Unique values were spilled to disk, the unique values string output is left empty'))
+        results[self.UNIQUE_VALUES] = ''
+        return results
+
     def createHTML(self, outputFile, algData):
         with codecs.open(outputFile, 'w', encoding='utf-8') as f:
-            f.write('<html><head>')
-            f.write('<meta http-equiv="Content-Type" content="text/html; \
-                     charset=utf-8" /></head><body>')
-            f.write(self.tr('<p>Total unique values: ') + str(len(algData)) + '</p>')
-            f.write(self.tr('<p>Unique values:</p>'))
-            f.write('<ul>')
+            self.writeHTMLHeader(f, len(algData))
             for s in algData:
-                f.write('<li>' + ','.join([str(attr) for attr in s]) + '</li>')
-            f.write('</ul></body></html>')
+                self.writeHTMLValue(f, s)
+            self.writeHTMLFooter(f)
+
+    def writeHTMLHeader(self, f, count):
+        f.write('<html><head>')
+        f.write('<meta http-equiv="Content-Type" content="text/html; \
+                 charset=utf-8" /></head><body>')
+        f.write(self.tr('<p>Total unique values: ') + str(count) + '</p>')
+        f.write(self.tr('<p>Unique values:</p>'))
+        f.write('<ul>')
+
+    def writeHTMLValue(self, f, value):
+        f.write('<li>' + ','.join([str(attr) for attr in value]) + '</li>')
+
+    def writeHTMLFooter(self, f):
+        f.write('</ul></body></html>')
+
+
+class SpillingValueSet:
+    """
+    Set of value tuples holding at most max_values values in memory.
+
+    When full, values are appended to bucket files chosen by the hash of
+    the values, so that equal values always go to the same bucket. Buckets
+    are then deduplicated one at a time, and split again on the next bits
+    of the hash when their unique values don't fit in memory.
+    """
+
+    BUCKET_COUNT = 64
+    # buckets still too large after this many splits (48 bits of the hash)
+    # only hold values with colliding hashes, they are deduplicated in memory
+    MAX_SPLIT_DEPTH = 8
+
+    def __init__(self, max_values, folder):
+        self.max_values = max_values
+        self.folder = folder
+        self.values = set()
+        self.bucket_files = None
+        self.file_count = 0
+        self.count = None
+        # largest number of values held in a set at once
+        self.peak_size = 0
+
+    def add(self, value):
+        # NULL values can not be pickled
+        self.values.add(tuple(None if isinstance(v, QVariant) and v.isNull() else v for v in value))
+        self.peak_size = max(self.peak_size, len(self.values))
+        if len(self.values) >= self.max_values:
+            self.spill()
+
+    def spilled(self):
+        return self.bucket_files is not None
+
+    def newFile(self):
+        bucket_file = open(os.path.join(self.folder, 'bucket_{}'.format(self.file_count)), 'w+b')
+        self.file_count += 1
+        return bucket_file
+
+    def partition(self, values, files, depth):
+        """
+        Appends the values to the files chosen by their hash, using the
+        next bits of the hash at each split depth
+        """
+        buckets = [[] for f in files]
+        for value in values:
+            buckets[hash(value) // self.BUCKET_COUNT ** depth % self.BUCKET_COUNT].append(value)
+        for bucket_file, bucket in zip(files, buckets):
+            if bucket:
+                pickle.dump(bucket, bucket_file, pickle.HIGHEST_PROTOCOL)
+
+    def spill(self):
+        if self.bucket_files is None:
+            self.bucket_files = [self.newFile() for i in range(self.BUCKET_COUNT)]
+
+        self.partition(self.values, self.bucket_files, 0)
+        self.values = set()
+
+    def bucket(self, bucket_file):
+        bucket_file.seek(0)
+        while True:
+            try:
+                yield from pickle.load(bucket_file)
+            except EOFError:
+                break
+
+    def deduplicate(self, feedback):
+        """
+        Rewrites each bucket with its unique values and counts them
+        """
+        if self.bucket_files is None:
+            self.count = len(self.values)
+            return
+
+        self.spill()
+        self.count = 0
+        unique_files = []
+        for current, bucket_file in enumerate(self.bucket_files):
+            if feedback.isCanceled():
+                break
+
+            unique_files.extend(self.deduplicateFile(bucket_file, 0))
+            feedback.setProgress(int((current + 1) * 100.0 / self.BUCKET_COUNT))
+        self.bucket_files = unique_files
+
+    def deduplicateFile(self, bucket_file, depth):
+        """
+        Returns the files holding the unique values of a bucket file
+        """
+        if bucket_file.seek(0, os.SEEK_END) == 0:
+            bucket_file.close()
+            return []
+
+        values = set()
+        for value in self.bucket(bucket_file):
+            if value not in values and len(values) >= self.max_values and depth < self.MAX_SPLIT_DEPTH:
+                break
+            values.add(value)
+            self.peak_size = max(self.peak_size, len(values))
+        else:
+            bucket_file.seek(0)
+            bucket_file.truncate()
+            pickle.dump(list(values), bucket_file, pickle.HIGHEST_PROTOCOL)
+            self.count += len(values)
+            return [bucket_file]
+
+        # the unique values don't fit in memory, split the bucket again
+        values = None
+        files = [self.newFile() for i in range(self.BUCKET_COUNT)]
+        chunk = []
+        for value in self.bucket(bucket_file):
+            chunk.append(value)
+            if len(chunk) >= self.max_values:
+                self.partition(chunk, files, depth + 1)
+                chunk = []
+        self.partition(chunk, files, depth + 1)
+        bucket_file.close()
+        os.remove(bucket_file.name)
+
+        unique_files = []
+        for split_file in files:
+            unique_files.extend(self.deduplicateFile(split_file, depth + 1))
+        return unique_files
+
+    def __len__(self):
+        return self.count if self.count is not None else len(self.values)
+
+    def __iter__(self):
+        buckets = [self.values] if self.bucket_files is None else (self.bucket(f) for f in self.bucket_files)
+        for bucket in buckets:
+            for value in bucket:
+                yield tuple(NULL if v is None else v for v in value)
+
+    def close(self):
+        if self.bucket_files is not None:
+            for bucket_file in self.bucket_files:
+                bucket_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
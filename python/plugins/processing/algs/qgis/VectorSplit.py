@@ -26,18 +26,26 @@ __copyright__ = '(C) 2014, Alexander Bruy'
 __revision__ = '$Format:%H$'
 
 import os
+from collections import OrderedDict
 
-from qgis.core import (QgsApplication,
+from qgis.core import (NULL,
+                       QgsApplication,
+                       QgsFeature,
                        QgsProcessingUtils,
                        QgsFeatureSink,
+                       QgsProcessingParameterDefinition,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterField,
                        QgsProcessingParameterFolderDestination,
+                       QgsProcessingParameterString,
                        QgsProcessingOutputFolder,
                        QgsProcessingException,
                        QgsProcessingOutputMultipleLayers,
                        QgsExpression,
-                       QgsFeatureRequest)
+                       QgsFeatureRequest,
+                       QgsVectorFileWriter,
+                       QgsVectorLayer)
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 from processing.tools.system import mkdir
@@ -49,9 +57,15 @@ class VectorSplit(QgisAlgorithm):
 
     INPUT = 'INPUT'
     FIELD = 'FIELD'
+    FILE_TYPE = 'FILE_TYPE'
+    METHOD = 'METHOD'
     OUTPUT = 'OUTPUT'
     OUTPUT_LAYERS = 'OUTPUT_LAYERS'
 
+    # maximum number of output files kept open at the same time when
+    # reading the input layer once
+    MAX_OPEN_OUTPUTS = 256
+
     def group(self):
         return self.tr('Vector general')
 
@@ -68,6 +82,21 @@ class VectorSplit(QgisAlgorithm):
         self.addParameter(QgsProcessingParameterField(self.FIELD,
                                                       self.tr('Unique ID field'), None, self.INPUT))
 
+        # the formats depend on the GDAL build, so the file type is given
+        # by its extension rather than by its position in the list
+        self.addParameter(QgsProcessingParameterString(self.FILE_TYPE,
+                                                       self.tr('Output file type (extension)'),
+                                                       defaultValue='shp'))
+
+        self.methods = [self.tr('Read the input layer once for each unique value'),
+                        self.tr('Read the input layer once')]
+        method_param = QgsProcessingParameterEnum(self.METHOD,
+                                                  self.tr('Method'),
+                                                  options=self.methods,
+                                                  defaultValue=0)
+        method_param.setFlags(method_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(method_param)
+
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT,
                                                                   self.tr('Output directory')))
         self.addOutput(QgsProcessingOutputMultipleLayers(self.OUTPUT_LAYERS, self.tr('Output layers')))
@@ -95,8 +124,19 @@ class VectorSplit(QgisAlgorithm):
         mkdir(directory)
 
         fieldIndex = source.fields().lookupField(fieldName)
-        uniqueValues = source.uniqueValues(fieldIndex)
         baseName = os.path.join(directory, '{0}'.format(fieldName))
+        extension = self.parameterAsString(parameters, self.FILE_TYPE, context).strip().lstrip('.').lower()
+        if extension not in [e.lower() for e in QgsVectorFileWriter.supportedFormatExtensions()]:
+            raise QgsProcessingException(self.tr('Unsupported output file type: {}').format(extension))
+
+        def fileName(value):
+            return u'{0}_{1}.{2}'.format(baseName, str(value).strip(), extension)
+
+        if self.parameterAsEnum(parameters, self.METHOD, context) == 1:
+            output_layers = self.splitSinglePass(source, fieldIndex, fileName, context, feedback)
+            return {self.OUTPUT: directory, self.OUTPUT_LAYERS: output_layers}
+
+        uniqueValues = source.uniqueValues(fieldIndex)
 
         fields = source.fields()
         crs = source.sourceCrs()
@@ -108,7 +148,7 @@ class VectorSplit(QgisAlgorithm):
         for current, i in enumerate(uniqueValues):
             if feedback.isCanceled():
                 break
-            fName = u'{0}_{1}.shp'.format(baseName, str(i).strip())
+            fName = fileName(i)
             feedback.pushInfo(self.tr('Creating layer: {}').format(fName))
 
             sink, dest = QgsProcessingUtils.createFeatureSink(fName, context, fields, geomType, crs)
@@ -129,3 +169,82 @@ class VectorSplit(QgisAlgorithm):
             feedback.setProgress(int(current * total))
 
         return {self.OUTPUT: directory, self.OUTPUT_LAYERS: output_layers}
+
+    def splitSinglePass(self, source, fieldIndex, fileName, context, feedback):
+        """
+        Writes each feature of the source to the output file of its value,
+        reading the source only once. At most MAX_OPEN_OUTPUTS files are
+        kept open: the least recently used one is closed when another file
+        is needed, and reopened to append features if required.
+        """
+        fields = source.fields()
+        crs = source.sourceCrs()
+        geomType = source.wkbType()
+
+        # output file name -> (open sink, layer owning the sink, index of the
+        # attributes of the source in the sink or None), in least recently
+        # used order
+        sinks = OrderedDict()
+        # output file name -> number of written features
+        counts = OrderedDict()
+
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+        for current, f in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+
+            fName = fileName(f.attributes()[fieldIndex])
+            if fName in sinks:
+                sinks.move_to_end(fName)
+            else:
+                if len(sinks) >= self.MAX_OPEN_OUTPUTS:
+                    # deleting the sink closes its file
+                    sinks.popitem(last=False)
+
+                if fName in counts:
+                    layer = QgsVectorLayer(fName, os.path.basename(fName), 'ogr')
+                    if not layer.isValid():
+                        raise QgsProcessingException(self.tr('Could not reopen layer: {}').format(fName))
+                    sinks[fName] = (layer.dataProvider(), layer, self.attributeIndexes(fields, layer.dataProvider()))
+                else:
+                    feedback.pushInfo(self.tr('Creating layer: {}').format(fName))
+                    sink, dest = QgsProcessingUtils.createFeatureSink(fName, context, fields, geomType, crs)
+                    sinks[fName] = (sink, None, None)
+                    counts[fName] = 0
+
+            sink, layer, indexes = sinks[fName]
+            if indexes is not None:
+                # the reopened file may have other columns, e.g. a fid one
+                out = QgsFeature(layer.fields())
+                out.setGeometry(f.geometry())
+                attributes = [NULL] * layer.fields().count()
+                for index, value in zip(indexes, f.attributes()):
+                    if index >= 0:
+                        attributes[index] = value
+                out.setAttributes(attributes)
+            else:
+                out = f
+            if not sink.addFeature(out, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(self.tr('Could not write feature to layer: {}').format(fName))
+            counts[fName] += 1
+
+            feedback.setProgress(int(current * total))
+
+        sinks.clear()
+
+        for fName, count in counts.items():
+            feedback.pushInfo(self.tr('Added {} features to layer {}').format(count, fName))
+
+        return list(counts.keys())
+
+    def attributeIndexes(self, fields, provider):
+        """
+        Returns the index in the fields of a reopened output of each source
+        field, found by name, or in order among the remaining fields when
+        the format shortened the name.
+        """
+        providerFields = provider.fields()
+        indexes = [providerFields.lookupField(field.name()) for field in fields]
+        remaining = iter([i for i in range(providerFields.count())
+                          if i not in indexes and i not in provider.pkAttributeIndexes()])
+        return [index if index >= 0 else next(remaining, -1) for index in indexes]
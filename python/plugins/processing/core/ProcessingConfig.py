@@ -61,6 +61,7 @@ class ProcessingConfig:
     DEFAULT_OUTPUT_RASTER_LAYER_EXT = 'DEFAULT_OUTPUT_RASTER_LAYER_EXT'
     DEFAULT_OUTPUT_VECTOR_LAYER_EXT = 'DEFAULT_OUTPUT_VECTOR_LAYER_EXT'
     SHOW_PROVIDERS_TOOLTIP = 'SHOW_PROVIDERS_TOOLTIP'
+    MAX_PARALLEL_EXECUTIONS = 'MAX_PARALLEL_EXECUTIONS'
 
     settings = {}
     settingIcons = {}
@@ -124,6 +125,11 @@ class ProcessingConfig:
             ProcessingConfig.POST_EXECUTION_SCRIPT,
             ProcessingConfig.tr('Post-execution script'), '',
             valuetype=Setting.FILE))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.MAX_PARALLEL_EXECUTIONS,
+            ProcessingConfig.tr('Maximum number of parallel executions in batch and iterating runs'), 1,
+            valuetype=Setting.INT))
 
         invalidFeaturesOptions = [ProcessingConfig.tr('Do not filter (better performance)'),
                                   ProcessingConfig.tr('Ignore features with invalid geometries'),
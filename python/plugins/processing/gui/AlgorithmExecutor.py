@@ -26,9 +26,14 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import sys
-from qgis.PyQt.QtCore import QCoreApplication
+from functools import partial
+from itertools import islice
+from qgis.PyQt.QtCore import QCoreApplication, QEventLoop
 from qgis.core import (Qgis,
+                       QgsApplication,
                        QgsFeatureSink,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingAlgRunnerTask,
                        QgsProcessingFeedback,
                        QgsProcessingUtils,
                        QgsMessageLog,
@@ -38,15 +43,19 @@ from qgis.core import (Qgis,
                        QgsProject,
                        QgsFeatureRequest,
                        QgsFeature,
-                       QgsExpression,
                        QgsWkbTypes,
                        QgsGeometry,
                        QgsVectorLayerUtils,
                        QgsVectorLayer)
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.gui.Postprocessing import handleAlgorithmResults
 from processing.tools import dataobjects
 from qgis.utils import iface
 
+# Number of features processed before their edits are sent to the layer
+# edit buffer, when editing features in-place
+IN_PLACE_BATCH_SIZE = 1000
+
 
 def execute(alg, parameters, context=None, feedback=None):
     """Executes a given algorithm, showing its progress in the
@@ -132,9 +141,10 @@ def execute_in_place_run(alg, parameters, context=None, feedback=None, raise_exc
     parameters['INPUT'] = QgsProcessingFeatureSourceDefinition(active_layer.id(), True)
     parameters['OUTPUT'] = 'memory:'
 
-    req = QgsFeatureRequest(QgsExpression(r"$id < 0"))
-    req.setFlags(QgsFeatureRequest.NoGeometry)
-    req.setSubsetOfAttributes([])
+    # Ids of the features added to the layer are collected as they are
+    # added to the edit buffer, instead of scanning the layer for new ids
+    added_feature_ids = []
+    active_layer.featureAdded.connect(added_feature_ids.append)
 
     # Start the execution
     # If anything goes wrong and raise_exceptions is True an exception
@@ -156,38 +166,50 @@ def execute_in_place_run(alg, parameters, context=None, feedback=None, raise_exc
             if not alg.supportInPlaceEdit(active_layer):
                 raise QgsProcessingException(tr("Selected algorithm and parameter configuration are not compatible with in-place modifications."))
             field_idxs = range(len(active_layer.fields()))
-            iterator_req = QgsFeatureRequest(active_layer.selectedFeatureIds())
+            selected_ids = active_layer.selectedFeatureIds()
+            iterator_req = QgsFeatureRequest(selected_ids)
             iterator_req.setInvalidGeometryCheck(context.invalidGeometryCheck())
             feature_iterator = active_layer.getFeatures(iterator_req)
-            step = 100 / len(active_layer.selectedFeatureIds()) if active_layer.selectedFeatureIds() else 1
-            for current, f in enumerate(feature_iterator):
-                feedback.setProgress(current * step)
-                if feedback.isCanceled():
+            step = 100 / len(selected_ids) if selected_ids else 1
+            current = 0
+            while not feedback.isCanceled():
+                batch = list(islice(feature_iterator, IN_PLACE_BATCH_SIZE))
+                if not batch:
                     break
 
-                # need a deep copy, because python processFeature implementations may return
-                # a shallow copy from processFeature
-                input_feature = QgsFeature(f)
-                new_features = alg.processFeature(input_feature, context, feedback)
-                new_features = QgsVectorLayerUtils.makeFeaturesCompatible(new_features, active_layer)
-
-                if len(new_features) == 0:
-                    active_layer.deleteFeature(f.id())
-                elif len(new_features) == 1:
-                    new_f = new_features[0]
-                    if not f.geometry().equals(new_f.geometry()):
-                        active_layer.changeGeometry(f.id(), new_f.geometry())
-                    if f.attributes() != new_f.attributes():
-                        active_layer.changeAttributeValues(f.id(), dict(zip(field_idxs, new_f.attributes())), dict(zip(field_idxs, f.attributes())))
-                    new_feature_ids.append(f.id())
-                else:
-                    active_layer.deleteFeature(f.id())
-                    # Get the new ids
-                    old_ids = set([f.id() for f in active_layer.getFeatures(req)])
-                    if not active_layer.addFeatures(new_features):
-                        raise QgsProcessingException(tr("Error adding processed features back into the layer."))
-                    new_ids = set([f.id() for f in active_layer.getFeatures(req)])
-                    new_feature_ids += list(new_ids - old_ids)
+                # Deleted and added features are collected for the whole batch
+                # and sent to the edit buffer at once
+                deleted_ids = []
+                added_features = []
+                for f in batch:
+                    feedback.setProgress(current * step)
+                    if feedback.isCanceled():
+                        break
+                    current += 1
+
+                    # need a deep copy, because python processFeature implementations may return
+                    # a shallow copy from processFeature
+                    input_feature = QgsFeature(f)
+                    new_features = alg.processFeature(input_feature, context, feedback)
+                    new_features = QgsVectorLayerUtils.makeFeaturesCompatible(new_features, active_layer)
+
+                    if len(new_features) == 0:
+                        deleted_ids.append(f.id())
+                    elif len(new_features) == 1:
+                        new_f = new_features[0]
+                        if not f.geometry().equals(new_f.geometry()):
+                            active_layer.changeGeometry(f.id(), new_f.geometry())
+                        if f.attributes() != new_f.attributes():
+                            active_layer.changeAttributeValues(f.id(), dict(zip(field_idxs, new_f.attributes())), dict(zip(field_idxs, f.attributes())))
+                        new_feature_ids.append(f.id())
+                    else:
+                        deleted_ids.append(f.id())
+                        added_features.extend(new_features)
+
+                if deleted_ids:
+                    active_layer.deleteFeatures(deleted_ids)
+                if added_features and not active_layer.addFeatures(added_features):
+                    raise QgsProcessingException(tr("Error adding processed features back into the layer."))
 
             results, ok = {}, True
 
@@ -222,12 +244,11 @@ def execute_in_place_run(alg, parameters, context=None, feedback=None, raise_exc
                     new_features.extend(QgsVectorLayerUtils.
                                         makeFeaturesCompatible([f], active_layer))
 
-                # Get the new ids
-                old_ids = set([f.id() for f in active_layer.getFeatures(req)])
                 if not active_layer.addFeatures(new_features):
                     raise QgsProcessingException(tr("Error adding processed features back into the layer."))
-                new_ids = set([f.id() for f in active_layer.getFeatures(req)])
-                new_feature_ids += list(new_ids - old_ids)
+
+        active_layer.featureAdded.disconnect(added_feature_ids.append)
+        new_feature_ids += added_feature_ids
 
         active_layer.endEditCommand()
 
@@ -239,6 +260,7 @@ def execute_in_place_run(alg, parameters, context=None, feedback=None, raise_exc
         return ok, results
 
     except QgsProcessingException as e:
+        active_layer.featureAdded.disconnect(added_feature_ids.append)
         active_layer.endEditCommand()
         active_layer.rollBack()
         if raise_exceptions:
@@ -286,52 +308,191 @@ def execute_in_place(alg, parameters, context=None, feedback=None):
     return ok, results
 
 
+class PrefixedFeedback(QgsProcessingFeedback):
+
+    """Feedback for one of several concurrent executions, forwarding
+    messages to a shared feedback prefixed with a label.
+    """
+
+    def __init__(self, label, feedback):
+        super().__init__()
+        self.label = label
+        self.feedback = feedback
+
+    def prefixed(self, text):
+        return '[{}] {}'.format(self.label, text)
+
+    def setProgressText(self, text):
+        self.feedback.setProgressText(self.prefixed(text))
+
+    def reportError(self, error, fatalError=False):
+        self.feedback.reportError(self.prefixed(error), fatalError)
+
+    def pushInfo(self, info):
+        self.feedback.pushInfo(self.prefixed(info))
+
+    def pushCommandInfo(self, info):
+        self.feedback.pushCommandInfo(self.prefixed(info))
+
+    def pushDebugInfo(self, info):
+        self.feedback.pushDebugInfo(self.prefixed(info))
+
+    def pushConsoleInfo(self, info):
+        self.feedback.pushConsoleInfo(self.prefixed(info))
+
+
+def maxParallelExecutions(alg):
+    """Returns the number of executions of an algorithm which can run at
+    the same time. Algorithms which are not thread safe are always run
+    one at a time.
+    """
+    if alg.flags() & QgsProcessingAlgorithm.FlagNoThreading:
+        return 1
+    try:
+        return max(1, int(ProcessingConfig.getSetting(ProcessingConfig.MAX_PARALLEL_EXECUTIONS)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def executeConcurrently(alg, count, prepare, executed, max_executions, feedback):
+    """Executes an algorithm count times in background tasks, running at
+    most max_executions of them at the same time.
+
+    prepare(i) is called just before starting execution i and must return
+    a (parameters, context, feedback) tuple for it, or None when there is
+    no more work, e.g. when count was only an estimate. executed(i, ok, results,
+    context, feedback) is called when it is completed, and no other
+    execution is started once it returns False.
+
+    Blocks until all started executions are completed, and returns True if
+    all executions were successful.
+    """
+    pending = list(range(count))
+    running = {}
+    progress = [0.0] * count
+    failed = []
+    loop = QEventLoop()
+
+    def update_progress(i, value):
+        progress[i] = value
+        feedback.setProgress(sum(progress) / count)
+
+    def start_next():
+        while pending and len(running) < max_executions and not failed and not feedback.isCanceled():
+            i = pending.pop(0)
+            prepared = prepare(i)
+            if prepared is None:
+                # fewer executions than expected, don't schedule the others
+                pending.clear()
+                break
+            parameters, context, execution_feedback = prepared
+            execution_feedback.progressChanged.connect(partial(update_progress, i))
+            task = QgsProcessingAlgRunnerTask(alg, parameters, context, execution_feedback)
+            task.executed.connect(partial(on_executed, i))
+            running[i] = (task, context, execution_feedback)
+            QgsApplication.taskManager().addTask(task)
+
+        if not running:
+            loop.quit()
+
+    def on_executed(i, ok, results):
+        task, context, execution_feedback = running.pop(i)
+        update_progress(i, 100)
+        if not executed(i, ok, results, context, execution_feedback):
+            failed.append(i)
+        start_next()
+
+    def cancel():
+        for task, _, _ in list(running.values()):
+            task.cancel()
+
+    feedback.canceled.connect(cancel)
+    start_next()
+    if running:
+        loop.exec_()
+    feedback.canceled.disconnect(cancel)
+
+    return not failed and not pending
+
+
 def executeIterating(alg, parameters, paramToIter, context, feedback):
-    # Generate all single-feature layers
     parameter_definition = alg.parameterDefinition(paramToIter)
     if not parameter_definition:
         return False
 
     iter_source = QgsProcessingParameters.parameterAsSource(parameter_definition, parameters, context)
-    sink_list = []
     if iter_source.featureCount() == 0:
         return False
 
-    total = 100.0 / iter_source.featureCount()
-    for current, feat in enumerate(iter_source.getFeatures()):
-        if feedback.isCanceled():
-            return False
-
-        sink, sink_id = QgsProcessingUtils.createFeatureSink('memory:', context, iter_source.fields(), iter_source.wkbType(), iter_source.sourceCrs())
-        sink_list.append(sink_id)
-        sink.addFeature(feat, QgsFeatureSink.FastInsert)
-        del sink
-
-        feedback.setProgress(int(current * total))
-
     # store output values to use them later as basenames for all outputs
     outputs = {}
     for out in alg.destinationParameterDefinitions():
         if out.name() in parameters:
             outputs[out.name()] = parameters[out.name()]
 
-    # now run all the algorithms
-    for i, f in enumerate(sink_list):
-        if feedback.isCanceled():
-            return False
+    def prepare_iteration(i, feat, iteration_context):
+        # single-feature layers are only generated when their iteration is
+        # started, so that only the layers of running iterations are kept
+        sink, sink_id = QgsProcessingUtils.createFeatureSink('memory:', iteration_context, iter_source.fields(), iter_source.wkbType(), iter_source.sourceCrs())
+        sink.addFeature(feat, QgsFeatureSink.FastInsert)
+        del sink
 
-        parameters[paramToIter] = f
+        iteration_parameters = dict(parameters)
+        iteration_parameters[paramToIter] = sink_id
         for out in alg.destinationParameterDefinitions():
             if out.name() not in outputs:
                 continue
 
             o = outputs[out.name()]
-            parameters[out.name()] = QgsProcessingUtils.generateIteratingDestination(o, i, context)
-        feedback.setProgressText(QCoreApplication.translate('AlgorithmExecutor', 'Executing iteration {0}/{1}…').format(i, len(sink_list)))
-        feedback.setProgress(i * 100 / len(sink_list))
-        ret, results = execute(alg, parameters, context, feedback)
-        if not ret:
+            iteration_parameters[out.name()] = QgsProcessingUtils.generateIteratingDestination(o, i, context)
+        return iteration_parameters, sink_id
+
+    features = iter_source.getFeatures()
+    count = iter_source.featureCount()
+    max_executions = maxParallelExecutions(alg)
+
+    if max_executions > 1 and count > 1:
+        input_layers = {}
+
+        def prepare(i):
+            # the source may return fewer features than its count, e.g.
+            # when invalid geometries are skipped
+            try:
+                feat = next(features)
+            except StopIteration:
+                return None
+
+            iteration_feedback = PrefixedFeedback(i + 1, feedback)
+            iteration_context = dataobjects.createContext(iteration_feedback)
+            iteration_context.copyThreadSafeSettings(context)
+            iteration_parameters, input_layers[i] = prepare_iteration(i, feat, iteration_context)
+            # the algorithm runs with a copy of the context which has no
+            # temporary layers, so it gets the layer itself instead of its id
+            iteration_parameters[paramToIter] = iteration_context.getMapLayer(input_layers[i])
+            return iteration_parameters, iteration_context, iteration_feedback
+
+        def executed(i, ok, results, iteration_context, iteration_feedback):
+            iteration_context.temporaryLayerStore().removeMapLayer(input_layers.pop(i))
+            if ok:
+                context.takeResultsFrom(iteration_context)
+            return ok
+
+        feedback.setProgressText(QCoreApplication.translate('AlgorithmExecutor', 'Executing {0} iterations, up to {1} at the same time…').format(count, max_executions))
+        if not executeConcurrently(alg, count, prepare, executed, max_executions, feedback):
             return False
+    else:
+        # now run all the algorithms
+        for i, feat in enumerate(features):
+            if feedback.isCanceled():
+                return False
+
+            iteration_parameters, sink_id = prepare_iteration(i, feat, context)
+            feedback.setProgressText(QCoreApplication.translate('AlgorithmExecutor', 'Executing iteration {0}/{1}…').format(i, count))
+            feedback.setProgress(i * 100 / count)
+            ret, results = execute(alg, iteration_parameters, context, feedback)
+            context.temporaryLayerStore().removeMapLayer(sink_id)
+            if not ret:
+                return False
 
     handleAlgorithmResults(alg, context, feedback, False)
     return True
@@ -48,7 +48,10 @@ from qgis.gui import QgsProcessingAlgorithmDialogBase
 from qgis.utils import OverrideCursor, iface
 
 from processing.gui.BatchPanel import BatchPanel
-from processing.gui.AlgorithmExecutor import execute
+from processing.gui.AlgorithmExecutor import (execute,
+                                              executeConcurrently,
+                                              maxParallelExecutions,
+                                              PrefixedFeedback)
 from processing.gui.Postprocessing import handleAlgorithmResults
 
 from processing.core.ProcessingResults import resultsList
@@ -135,40 +138,10 @@ class BatchAlgorithmDialog(QgsProcessingAlgorithmDialogBase):
 
             start_time = time.time()
 
-            algorithm_results = []
-            for count, parameters in enumerate(alg_parameters):
-                if feedback.isCanceled():
-                    break
-                self.setProgressText(QCoreApplication.translate('BatchAlgorithmDialog', '\nProcessing algorithm {0}/{1}…').format(count + 1, len(alg_parameters)))
-                self.setInfo(self.tr('<b>Algorithm {0} starting&hellip;</b>').format(self.algorithm().displayName()), escapeHtml=False)
-                multi_feedback.setCurrentStep(count)
-
-                parameters = self.algorithm().preprocessParameters(parameters)
-
-                feedback.pushInfo(self.tr('Input parameters:'))
-                feedback.pushCommandInfo(pformat(parameters))
-                feedback.pushInfo('')
-
-                # important - we create a new context for each iteration
-                # this avoids holding onto resources and layers from earlier iterations,
-                # and allows batch processing of many more items then is possible
-                # if we hold on to these layers
-                context = dataobjects.createContext(feedback)
-
-                alg_start_time = time.time()
-                ret, results = execute(self.algorithm(), parameters, context, multi_feedback)
-                if ret:
-                    self.setInfo(QCoreApplication.translate('BatchAlgorithmDialog', 'Algorithm {0} correctly executed…').format(self.algorithm().displayName()), escapeHtml=False)
-                    feedback.pushInfo(
-                        self.tr('Execution completed in {0:0.2f} seconds'.format(time.time() - alg_start_time)))
-                    feedback.pushInfo(self.tr('Results:'))
-                    feedback.pushCommandInfo(pformat(results))
-                    feedback.pushInfo('')
-                    algorithm_results.append(results)
-                else:
-                    break
-
-                handleAlgorithmResults(self.algorithm(), context, multi_feedback, False)
+            if maxParallelExecutions(self.algorithm()) > 1 and len(alg_parameters) > 1:
+                algorithm_results = self.runParallel(alg_parameters, feedback)
+            else:
+                algorithm_results = self.runSequential(alg_parameters, feedback, multi_feedback)
 
         feedback.pushInfo(self.tr('Batch execution completed in {0:0.2f} seconds'.format(time.time() - start_time)))
         task = None
@@ -176,6 +149,88 @@ class BatchAlgorithmDialog(QgsProcessingAlgorithmDialogBase):
         self.finish(algorithm_results)
         self.cancelButton().setEnabled(False)
 
+    def runSequential(self, alg_parameters, feedback, multi_feedback):
+        algorithm_results = []
+        for count, parameters in enumerate(alg_parameters):
+            if feedback.isCanceled():
+                break
+            self.setProgressText(QCoreApplication.translate('BatchAlgorithmDialog', '\nProcessing algorithm {0}/{1}…').format(count + 1, len(alg_parameters)))
+            self.setInfo(self.tr('<b>Algorithm {0} starting&hellip;</b>').format(self.algorithm().displayName()), escapeHtml=False)
+            multi_feedback.setCurrentStep(count)
+
+            parameters = self.algorithm().preprocessParameters(parameters)
+
+            feedback.pushInfo(self.tr('Input parameters:'))
+            feedback.pushCommandInfo(pformat(parameters))
+            feedback.pushInfo('')
+
+            # important - we create a new context for each iteration
+            # this avoids holding onto resources and layers from earlier iterations,
+            # and allows batch processing of many more items then is possible
+            # if we hold on to these layers
+            context = dataobjects.createContext(feedback)
+
+            alg_start_time = time.time()
+            ret, results = execute(self.algorithm(), parameters, context, multi_feedback)
+            if ret:
+                self.setInfo(QCoreApplication.translate('BatchAlgorithmDialog', 'Algorithm {0} correctly executed…').format(self.algorithm().displayName()), escapeHtml=False)
+                feedback.pushInfo(
+                    self.tr('Execution completed in {0:0.2f} seconds'.format(time.time() - alg_start_time)))
+                feedback.pushInfo(self.tr('Results:'))
+                feedback.pushCommandInfo(pformat(results))
+                feedback.pushInfo('')
+                algorithm_results.append(results)
+            else:
+                break
+
+            handleAlgorithmResults(self.algorithm(), context, multi_feedback, False)
+
+        return algorithm_results
+
+    def runParallel(self, alg_parameters, feedback):
+        """
+        Executes the batch rows in background tasks, running at most
+        maxParallelExecutions() rows at the same time.
+
+        Returns the results of the successful rows, in row order.
+        """
+        max_executions = maxParallelExecutions(self.algorithm())
+        row_results = [None] * len(alg_parameters)
+        start_times = {}
+
+        self.setInfo(self.tr('<b>Algorithm {0} starting&hellip;</b>').format(self.algorithm().displayName()), escapeHtml=False)
+        feedback.pushInfo(self.tr('Running up to {0} rows in parallel').format(max_executions))
+
+        def prepare(row):
+            parameters = self.algorithm().preprocessParameters(alg_parameters[row])
+            row_feedback = PrefixedFeedback(row + 1, feedback)
+            row_feedback.pushInfo(self.tr('Input parameters:'))
+            row_feedback.pushCommandInfo(pformat(parameters))
+
+            # each row gets its own context, released when the row is completed
+            context = dataobjects.createContext(row_feedback)
+            start_times[row] = time.time()
+            return parameters, context, row_feedback
+
+        def executed(row, ok, results, context, row_feedback):
+            if ok:
+                row_feedback.pushInfo(
+                    self.tr('Execution completed in {0:0.2f} seconds'.format(time.time() - start_times[row])))
+                row_feedback.pushInfo(self.tr('Results:'))
+                row_feedback.pushCommandInfo(pformat(results))
+                row_results[row] = results
+                handleAlgorithmResults(self.algorithm(), context, row_feedback, False)
+            else:
+                row_feedback.reportError(
+                    self.tr('Execution failed after {0:0.2f} seconds').format(time.time() - start_times[row]))
+            self.setProgressText(QCoreApplication.translate('BatchAlgorithmDialog', '\nProcessing algorithm {0}/{1}…').format(
+                len(start_times), len(alg_parameters)))
+            return ok
+
+        executeConcurrently(self.algorithm(), len(alg_parameters), prepare, executed, max_executions, feedback)
+
+        return [results for results in row_results if results is not None]
+
     def finish(self, algorithm_results):
         for count, results in enumerate(algorithm_results):
             self.loadHTMLResults(results, count)
@@ -74,6 +74,7 @@ from qgis.core import (QgsProcessingContext,
                        QgsProcessingException,
                        QgsProcessingFeatureSourceDefinition)
 import nose2
+from osgeo import gdal
 import os
 import shutil
 import tempfile
@@ -300,6 +301,56 @@ class TestGdalAlgorithms(unittest.TestCase, AlgorithmsTestBase.AlgorithmsTest):
         self.assertEqual(output, 'd:/test/test.mif')
         self.assertEqual(outputFormat, '"MapInfo File"')
 
+    def testInProcessCall(self):
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['gdal_translate', '-a_nodata 0 -of GTiff "/tmp/my source.tif" /tmp/out.tif'])
+        self.assertEqual(function, gdal.Translate)
+        self.assertEqual(source, '/tmp/my source.tif')
+        self.assertEqual(destination, '/tmp/out.tif')
+
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['gdalwarp', '-t_srs EPSG:4326 -r near -of GTiff /tmp/source.tif /tmp/out.tif'])
+        self.assertEqual(function, gdal.Warp)
+        self.assertEqual(source, '/tmp/source.tif')
+        self.assertEqual(destination, '/tmp/out.tif')
+
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['ogr2ogr', '-f "ESRI Shapefile" /tmp/out.shp /tmp/source.gpkg my_layer'])
+        self.assertEqual(function, gdal.VectorTranslate)
+        self.assertEqual(source, '/tmp/source.gpkg')
+        self.assertEqual(destination, '/tmp/out.shp')
+
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['ogr2ogr', '-f GPKG -nln other /tmp/out.gpkg /tmp/source.gpkg'])
+        self.assertEqual(source, '/tmp/source.gpkg')
+        self.assertEqual(destination, '/tmp/out.gpkg')
+
+        # options after the positional arguments, and option values which
+        # look like positional arguments
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['ogr2ogr', '/tmp/out.shp /tmp/source.gpkg my_layer -spat 1 2 3 4 -nln "my layer" -f "ESRI Shapefile"'])
+        self.assertEqual(source, '/tmp/source.gpkg')
+        self.assertEqual(destination, '/tmp/out.shp')
+
+        # backslashes of Windows paths are kept
+        function, destination, source, options = GdalUtils.inProcessCall(
+            ['gdal_translate', GdalUtils.escapeAndJoin(['-of', 'GTiff', 'C:\\data\\in.tif', 'C:\\my data\\out.tif'])])
+        self.assertEqual(source, 'C:\\data\\in.tif')
+        self.assertEqual(destination, 'C:\\my data\\out.tif')
+        self.assertEqual(GdalUtils.splitArguments('-nln "my \\"quoted\\" layer" C:\\out.shp'),
+                         ['-nln', 'my "quoted" layer', 'C:\\out.shp'])
+        self.assertIsNone(GdalUtils.splitArguments('-nln "unbalanced /tmp/out.shp'))
+
+        # unknown options and ambiguous arguments run on the command line
+        self.assertIsNone(GdalUtils.inProcessCall(['ogr2ogr', '-gcp 1 2 3 4 /tmp/out.shp /tmp/source.gpkg']))
+        self.assertIsNone(GdalUtils.inProcessCall(['ogr2ogr', '-f GPKG /tmp/out.gpkg']))
+
+        # unsupported commands and options
+        self.assertIsNone(GdalUtils.inProcessCall(['gdal_contour', '-a ELEV /tmp/source.tif /tmp/out.shp']))
+        self.assertIsNone(GdalUtils.inProcessCall(['gdal_translate', '--config GDAL_CACHEMAX 64 /tmp/source.tif /tmp/out.tif']))
+        self.assertIsNone(GdalUtils.inProcessCall(['gdal_translate', '-not_an_option /tmp/source.tif /tmp/out.tif']))
+        self.assertIsNone(GdalUtils.inProcessCall(['gdal_translate', '/tmp/out.tif']))
+
     def testCrsConversion(self):
         self.assertFalse(GdalUtils.gdal_crs_string(QgsCoordinateReferenceSystem()))
         self.assertEqual(GdalUtils.gdal_crs_string(QgsCoordinateReferenceSystem('EPSG:3111')), 'EPSG:3111')
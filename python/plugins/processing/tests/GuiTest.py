@@ -28,6 +28,10 @@ __revision__ = '$Format:%H$'
 from qgis.testing import start_app, unittest
 from qgis.core import (QgsApplication,
                        QgsCoordinateReferenceSystem,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingOutputNumber,
+                       QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterMatrix,
                        QgsProcessingOutputLayerDefinition,
                        QgsProcessingParameterFeatureSink,
@@ -36,6 +40,7 @@ from qgis.core import (QgsApplication,
                        QgsProcessingParameterVectorDestination,
                        QgsProcessingParameterRasterDestination,
                        QgsProcessingParameterRange,
+                       QgsProcessingFeedback,
                        QgsVectorLayer,
                        QgsProject)
 from qgis.analysis import QgsNativeAlgorithms
@@ -45,6 +50,9 @@ from processing.gui.BatchAlgorithmDialog import BatchAlgorithmDialog
 from processing.modeler.ModelerParametersDialog import ModelerParametersDialog
 from processing.gui.wrappers import *
 from processing.gui.DestinationSelectionPanel import DestinationSelectionPanel
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.gui.AlgorithmExecutor import executeConcurrently, executeIterating
+from processing.tools import dataobjects
 
 start_app()
 QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
@@ -60,6 +68,75 @@ class AlgorithmDialogTest(unittest.TestCase):
         self.assertEqual(a.mainWidget().alg, alg)
 
 
+class SourceCountAlgorithm(QgsProcessingAlgorithm):
+
+    """ Resolves its source in processAlgorithm, as Python algorithms do """
+
+    counts = []
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource('INPUT', 'Input'))
+        self.addOutput(QgsProcessingOutputNumber('COUNT', 'Count'))
+
+    def name(self):
+        return 'sourcecount'
+
+    def displayName(self):
+        return 'sourcecount'
+
+    def createInstance(self):
+        return SourceCountAlgorithm()
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, 'INPUT', context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, 'INPUT'))
+        SourceCountAlgorithm.counts.append(source.featureCount())
+        return {'COUNT': source.featureCount()}
+
+
+class AlgorithmExecutorTest(unittest.TestCase):
+
+    def testExecuteIteratingConcurrently(self):
+        ProcessingConfig.initialize()
+        max_executions = ProcessingConfig.getSetting(ProcessingConfig.MAX_PARALLEL_EXECUTIONS)
+        ProcessingConfig.setSettingValue(ProcessingConfig.MAX_PARALLEL_EXECUTIONS, 2)
+        try:
+            alg = SourceCountAlgorithm().create()
+            layer = QgsVectorLayer(os.path.join(testDataPath, 'points.gml'), 'points')
+            self.assertTrue(layer.isValid())
+            feedback = QgsProcessingFeedback()
+            context = dataobjects.createContext(feedback)
+            SourceCountAlgorithm.counts = []
+            self.assertTrue(executeIterating(alg, {'INPUT': layer}, 'INPUT', context, feedback))
+            # each iteration reads a single feature layer
+            self.assertEqual(SourceCountAlgorithm.counts, [1] * layer.featureCount())
+        finally:
+            ProcessingConfig.setSettingValue(ProcessingConfig.MAX_PARALLEL_EXECUTIONS, max_executions)
+
+    def testExecuteConcurrentlyFewerExecutions(self):
+        alg = QgsApplication.processingRegistry().createAlgorithmById('native:centroids')
+        layer = QgsVectorLayer(os.path.join(testDataPath, 'points.gml'), 'points')
+        self.assertTrue(layer.isValid())
+        feedback = QgsProcessingFeedback()
+        executed_runs = []
+
+        def prepare(i):
+            # only 2 of the 5 expected executions have some work
+            if i >= 2:
+                return None
+            execution_feedback = QgsProcessingFeedback()
+            context = dataobjects.createContext(execution_feedback)
+            return {'INPUT': layer, 'OUTPUT': 'memory:'}, context, execution_feedback
+
+        def executed(i, ok, results, context, execution_feedback):
+            executed_runs.append((i, ok))
+            return ok
+
+        self.assertTrue(executeConcurrently(alg, 5, prepare, executed, 2, feedback))
+        self.assertEqual(sorted(executed_runs), [(0, True), (1, True)])
+
+
 class WrappersTest(unittest.TestCase):
 
     @classmethod
@@ -30,16 +30,30 @@ import AlgorithmsTestBase
 import nose2
 import shutil
 import os
+import numpy
 
-from qgis.core import (QgsApplication,
+from qgis.core import (NULL,
+                       QgsApplication,
+                       QgsFeature,
+                       QgsGeometry,
                        QgsProcessingAlgorithm,
                        QgsProcessingFeedback,
-                       QgsProcessingException)
+                       QgsProcessingException,
+                       QgsProcessingUtils,
+                       QgsVectorFileWriter,
+                       QgsVectorLayer,
+                       QgsWkbTypes)
 from qgis.analysis import (QgsNativeAlgorithms)
 from qgis.testing import start_app, unittest
 from processing.tools.dataobjects import createContext
 from processing.core.ProcessingConfig import ProcessingConfig
 from processing.modeler.ModelerUtils import ModelerUtils
+from processing.algs.qgis.TopoColors import TopoColor
+from processing.algs.qgis.NearestNeighbourAnalysis import NearestNeighbourAnalysis
+from processing.algs.qgis.VectorSplit import VectorSplit
+from processing.algs.qgis.UniqueValues import SpillingValueSet
+from processing.algs.qgis.ExecuteSQL import ExecuteSQL, replaceInputNames, usesOnlySqliteFunctions
+from processing.tools.system import getTempDirInTempFolder
 
 
 class TestAlg(QgsProcessingAlgorithm):
@@ -100,6 +114,322 @@ class TestQgisAlgorithms(unittest.TestCase, AlgorithmsTestBase.AlgorithmsTest):
         results, ok = alg.run({}, context, feedback)
         self.assertFalse(ok)
 
+    def testTopoColorsPartitions(self):
+        """
+        Test that the adjacency graph does not depend on the spatial partitioning
+        """
+        layer = QgsVectorLayer(os.path.join(os.path.dirname(__file__), 'testdata', 'custom', 'adjacent_polys.gml'),
+                               'polys', 'ogr')
+        self.assertTrue(layer.isValid())
+        geometries = {f.id(): f.geometry() for f in layer.getFeatures()}
+        feedback = QgsProcessingFeedback()
+
+        for min_distance in (0, 4):
+            graph, _ = TopoColor.compute_graph(geometries, feedback, min_distance=min_distance)
+            partition_size = TopoColor.PARTITION_SIZE
+            try:
+                TopoColor.PARTITION_SIZE = 2
+                partitioned_graph, _ = TopoColor.compute_graph(geometries, feedback, min_distance=min_distance)
+            finally:
+                TopoColor.PARTITION_SIZE = partition_size
+
+            self.assertEqual(list(partitioned_graph.node_edge.keys()), list(graph.node_edge.keys()))
+            self.assertEqual(partitioned_graph.node_edge, graph.node_edge)
+
+    def testSpillingValueSet(self):
+        """
+        Test unique values spilled to disk
+        """
+        folder = getTempDirInTempFolder()
+        values = SpillingValueSet(3, folder)
+        for i in range(100):
+            values.add((i % 10, 'a' if i % 2 else NULL))
+        values.deduplicate(QgsProcessingFeedback())
+        self.assertEqual(len(values), 10)
+        self.assertCountEqual(list(values), [(i, 'a' if i % 2 else NULL) for i in range(10)])
+        values.close()
+        self.assertFalse(os.path.exists(folder))
+
+        # values fitting in memory are not written
+        values = SpillingValueSet(100, getTempDirInTempFolder())
+        values.add((1, 2))
+        values.add((1, 2))
+        values.deduplicate(QgsProcessingFeedback())
+        self.assertIsNone(values.bucket_files)
+        self.assertEqual(list(values), [(1, 2)])
+        values.close()
+
+        # buckets with more unique values than max_values are split again
+        folder = getTempDirInTempFolder()
+        values = SpillingValueSet(5, folder)
+        for i in range(3000):
+            values.add((i % 1000,))
+        values.deduplicate(QgsProcessingFeedback())
+        self.assertEqual(len(values), 1000)
+        self.assertCountEqual(list(values), [(i,) for i in range(1000)])
+        self.assertLessEqual(values.peak_size, 5)
+        values.close()
+        self.assertFalse(os.path.exists(folder))
+
+    def testUniqueValuesNotSpilled(self):
+        """
+        Test unique values fitting under MAX_VALUES_IN_MEMORY are listed
+        """
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:listuniquevalues')
+        layer = QgsVectorLayer(os.path.join(AlgorithmsTestBase.processingTestDataPath(), 'dissolve_polys.gml'), 'polys')
+        self.assertTrue(layer.isValid())
+        context = createContext()
+        feedback = QgsProcessingFeedback()
+        results, ok = alg.run({'INPUT': layer, 'FIELDS': ['name'], 'MAX_VALUES_IN_MEMORY': 1000}, context, feedback)
+        self.assertTrue(ok)
+        self.assertEqual(results['TOTAL_VALUES'], 5)
+        self.assertCountEqual(results['UNIQUE_VALUES'].split(';'), ['aa', 'bb', 'cc', 'dd', 'NULL'])
+
+    def testRandomPointsPoissonDisk(self):
+        """
+        Test Poisson disk sampling generates the requested number of points
+        """
+        context = createContext()
+        feedback = QgsProcessingFeedback()
+
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:randompointsinextent')
+        results, ok = alg.run({'EXTENT': '0,100,0,50 [EPSG:3857]', 'POINTS_NUMBER': 20, 'MIN_DISTANCE': 5,
+                               'TARGET_CRS': 'EPSG:3857', 'METHOD': 1, 'OUTPUT': 'memory:'}, context, feedback)
+        self.assertTrue(ok)
+        output = QgsProcessingUtils.mapLayerFromString(results['OUTPUT'], context)
+        self.assertEqual(output.featureCount(), 20)
+        # the points are spread over the whole extent
+        self.assertGreater(output.extent().width(), 50)
+        self.assertGreater(output.extent().height(), 25)
+
+        polygons = QgsVectorLayer('Polygon?crs=EPSG:3857', 'polygons', 'memory')
+        f = QgsFeature()
+        f.setGeometry(QgsGeometry.fromWkt('Polygon((0 0, 100 0, 100 50, 0 50, 0 0))'))
+        polygons.dataProvider().addFeatures([f])
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:randompointsinsidepolygons')
+        results, ok = alg.run({'INPUT': polygons, 'STRATEGY': 0, 'EXPRESSION': '20', 'MIN_DISTANCE': 5,
+                               'METHOD': 1, 'OUTPUT': 'memory:'}, context, feedback)
+        self.assertTrue(ok)
+        output = QgsProcessingUtils.mapLayerFromString(results['OUTPUT'], context)
+        self.assertEqual(output.featureCount(), 20)
+        self.assertGreater(output.extent().width(), 50)
+        self.assertGreater(output.extent().height(), 25)
+
+    def testNearestNeighbours(self):
+        """
+        Test the grid search of nearest neighbours against a brute force search
+        """
+        alg = NearestNeighbourAnalysis()
+        feedback = QgsProcessingFeedback()
+        random = numpy.random.RandomState(1)
+        cases = {
+            'uniform': random.uniform(0, 100, (500, 2)),
+            # dense clusters far apart and sparse points, leaving most cells empty
+            'clustered': numpy.concatenate((random.normal(0, 0.01, (300, 2)),
+                                            random.normal(1000, 0.01, (300, 2)),
+                                            random.uniform(-5000, 5000, (20, 2)))),
+            'duplicates': numpy.repeat(random.uniform(0, 10, (50, 2)), 3, axis=0),
+            'line': numpy.column_stack((numpy.arange(200.0) ** 1.5, numpy.zeros(200))),
+            'same point': numpy.zeros((5, 2)),
+            'two points': numpy.array([[0.0, 0.0], [3.0, 4.0]])
+        }
+
+        def check(name, points):
+            neighbours = alg.nearestNeighbours(points, feedback)
+            distances = ((points[:, None] - points[None]) ** 2).sum(axis=2)
+            numpy.fill_diagonal(distances, numpy.inf)
+            indexes = numpy.arange(len(points))
+            self.assertTrue((neighbours != indexes).all(), name)
+            self.assertTrue(numpy.array_equal(distances[indexes, neighbours], distances.min(axis=1)), name)
+
+        for name, points in cases.items():
+            check(name, points)
+
+        # candidates and points searched by small slices
+        maxCandidates = NearestNeighbourAnalysis.MAX_CANDIDATES
+        chunkSize = NearestNeighbourAnalysis.SEARCH_CHUNK_SIZE
+        try:
+            NearestNeighbourAnalysis.MAX_CANDIDATES = 7
+            NearestNeighbourAnalysis.SEARCH_CHUNK_SIZE = 16
+            for name, points in cases.items():
+                check(name, points)
+        finally:
+            NearestNeighbourAnalysis.MAX_CANDIDATES = maxCandidates
+            NearestNeighbourAnalysis.SEARCH_CHUNK_SIZE = chunkSize
+
+    def testNearestNeighbourGrid(self):
+        points = numpy.array([[0.0, 0.0], [2.5, 0.5], [0.5, 1.5], [2.0, 0.0]])
+        cells, columns, rows, keys, order = NearestNeighbourAnalysis().pointGrid(points, points.min(axis=0), 1.0)
+        self.assertEqual(cells.tolist(), [[0, 0], [2, 0], [0, 1], [2, 0]])
+        self.assertEqual((columns, rows), (3, 2))
+        self.assertEqual(keys.tolist(), [0, 2, 2, 3])
+        self.assertEqual(order.tolist(), [0, 1, 3, 2])
+
+        dx, dy = NearestNeighbourAnalysis.ringOffsets(0, 3, 2)
+        self.assertEqual((dx.tolist(), dy.tolist()), ([0], [0]))
+        dx, dy = NearestNeighbourAnalysis.ringOffsets(1, 5, 5)
+        self.assertCountEqual(zip(dx.tolist(), dy.tolist()),
+                              [(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1) if (x, y) != (0, 0)])
+        # offsets out of any cell of a 2 x 5 grid are skipped
+        dx, dy = NearestNeighbourAnalysis.ringOffsets(2, 2, 5)
+        self.assertCountEqual(zip(dx.tolist(), dy.tolist()),
+                              [(x, y) for x in (-1, 0, 1) for y in (-2, 2)])
+
+    def testExecuteSqlNativeQuery(self):
+        """
+        Test queries on GeoPackage tables are executed by the database
+        """
+        self.assertEqual(replaceInputNames("select * from input1 where name = 'input1' -- input2", ['a', 'b"c']),
+                         "select * from \"a\" where name = 'input1' -- input2")
+        self.assertEqual(replaceInputNames('select * from input1, INPUT2', ['a', 'b"c']),
+                         'select * from "a", "b""c"')
+        # a quoted inputN may be a column
+        self.assertIsNone(replaceInputNames('select "input1" from input1', ['a']))
+
+        points = QgsVectorLayer(os.path.join(AlgorithmsTestBase.processingTestDataPath(), 'points.gml'), 'points')
+        path = os.path.join(getTempDirInTempFolder(), 'points.gpkg')
+        error, _ = QgsVectorFileWriter.writeAsVectorFormat(points, path, 'utf-8', points.crs(), 'GPKG')
+        self.assertEqual(error, QgsVectorFileWriter.NoError)
+        layer = QgsVectorLayer(path, 'points')
+        self.assertTrue(layer.isValid())
+
+        alg = ExecuteSQL()
+        native = alg.nativeQueryLayer([layer], "select *, 'input1' as source from input1 where id2 = 2", '', '', False)
+        self.assertIsNotNone(native)
+        self.assertEqual(native.providerType(), 'ogr')
+        self.assertEqual([f['source'] for f in native.getFeatures()], ['input1', 'input1'])
+
+        # the virtual layer runs the queries the database can't
+        self.assertIsNone(alg.nativeQueryLayer([layer], 'select * from "input1" where id2 = 2', '', '', False))
+        self.assertIsNone(alg.nativeQueryLayer([layer], 'select * from input1', 'id', '', False))
+        self.assertIsNone(alg.nativeQueryLayer([layer, points], 'select * from input1, input2', '', '', False))
+        self.assertIsNone(alg.nativeQueryLayer([points], 'select * from input1', '', '', False))
+        layer.setSubsetString('id2 = 2')
+        self.assertIsNone(alg.nativeQueryLayer([layer], 'select * from input1', '', '', False))
+        layer.setSubsetString('')
+
+        context = createContext()
+        feedback = QgsProcessingFeedback()
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:executesql')
+        for query in ('select * from input1 where id2 = 2', 'select * from "input1" where id2 = 2'):
+            results, ok = alg.run({'INPUT_DATASOURCES': [layer], 'INPUT_QUERY': query, 'INPUT_UID_FIELD': '',
+                                   'INPUT_GEOMETRY_FIELD': '', 'INPUT_GEOMETRY_TYPE': 0, 'OUTPUT': 'memory:'},
+                                  context, feedback)
+            self.assertTrue(ok)
+            self.assertEqual(QgsProcessingUtils.mapLayerFromString(results['OUTPUT'], context).featureCount(), 2)
+
+    def testExecuteSqlSpatialFunctions(self):
+        """
+        Test queries with spatial functions on GeoPackage tables are run by the virtual layer
+        """
+        self.assertTrue(usesOnlySqliteFunctions("select count(*), 'st_area(x)' from t where id in (1, 2)"))
+        self.assertFalse(usesOnlySqliteFunctions('select st_buffer(geometry, 1) from t'))
+
+        points = QgsVectorLayer(os.path.join(AlgorithmsTestBase.processingTestDataPath(), 'points.gml'), 'points')
+        path = os.path.join(getTempDirInTempFolder(), 'points.gpkg')
+        # the geometry column has the name of the geometry column of the virtual layer tables
+        error, _ = QgsVectorFileWriter.writeAsVectorFormat(points, path, 'utf-8', points.crs(), 'GPKG',
+                                                           layerOptions=['GEOMETRY_NAME=geometry'])
+        self.assertEqual(error, QgsVectorFileWriter.NoError)
+        layer = QgsVectorLayer(path, 'points')
+        self.assertTrue(layer.isValid())
+
+        query = 'select st_buffer(geometry, 1) as geometry, id from input1'
+        self.assertIsNone(ExecuteSQL().nativeQueryLayer([layer], query, '', '', False))
+
+        context = createContext()
+        feedback = QgsProcessingFeedback()
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:executesql')
+        results, ok = alg.run({'INPUT_DATASOURCES': [layer], 'INPUT_QUERY': query, 'INPUT_UID_FIELD': '',
+                               'INPUT_GEOMETRY_FIELD': '', 'INPUT_GEOMETRY_TYPE': 0, 'OUTPUT': 'memory:'},
+                              context, feedback)
+        self.assertTrue(ok)
+        output = QgsProcessingUtils.mapLayerFromString(results['OUTPUT'], context)
+        self.assertEqual(output.featureCount(), points.featureCount())
+        for f in output.getFeatures():
+            self.assertEqual(f.geometry().type(), QgsWkbTypes.PolygonGeometry)
+
+    def testSplitVectorLayerSinglePass(self):
+        """
+        Test splitting a layer in a single read, with more values than open outputs
+        """
+        points = QgsVectorLayer(os.path.join(AlgorithmsTestBase.processingTestDataPath(), 'points.gml'), 'points')
+        expected = {}
+        for f in points.getFeatures():
+            expected.setdefault(f['id2'], []).append(f['id'])
+
+        max_open_outputs = VectorSplit.MAX_OPEN_OUTPUTS
+        try:
+            # the 3 values are interleaved, so outputs are closed and reopened
+            VectorSplit.MAX_OPEN_OUTPUTS = 2
+            for file_type in ('gpkg', 'shp'):
+                context = createContext()
+                feedback = QgsProcessingFeedback()
+                alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:splitvectorlayer')
+                results, ok = alg.run({'INPUT': points, 'FIELD': 'id2', 'FILE_TYPE': file_type, 'METHOD': 1,
+                                       'OUTPUT': getTempDirInTempFolder()}, context, feedback)
+                self.assertTrue(ok)
+                self.assertEqual(len(results['OUTPUT_LAYERS']), 3)
+                for value, ids in expected.items():
+                    fName = os.path.join(results['OUTPUT'], 'id2_{}.{}'.format(value, file_type))
+                    layer = QgsVectorLayer(fName, 'split', 'ogr')
+                    self.assertTrue(layer.isValid())
+                    features = list(layer.getFeatures())
+                    self.assertEqual([f['id'] for f in features], ids)
+                    self.assertEqual(set(f['id2'] for f in features), {value})
+        finally:
+            VectorSplit.MAX_OPEN_OUTPUTS = max_open_outputs
+
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:splitvectorlayer')
+        results, ok = alg.run({'INPUT': points, 'FIELD': 'id2', 'FILE_TYPE': 'not_a_format', 'METHOD': 1,
+                               'OUTPUT': getTempDirInTempFolder()}, createContext(), QgsProcessingFeedback())
+        self.assertFalse(ok)
+
+    def testEliminateSelection(self):
+        """
+        Test the neighbour selected polygons are merged with in each mode
+        """
+        polygons = QgsVectorLayer('Polygon?crs=EPSG:3857&field=id:integer', 'polygons', 'memory')
+        wkts = [
+            # selected, then merged with its neighbour
+            'Polygon((0 0, 1 0, 1 1, 0 1, 0 0))',
+            # selected, only touching the previous one
+            'Polygon((0 -1, 1 -1, 1 0, 0 0, 0 -1))',
+            # largest area
+            'Polygon((-10 0.5, 0 0.5, 0 1, -10 1, -10 0.5))',
+            # smallest area
+            'Polygon((1 0, 1.2 0, 1.2 0.5, 1 0.5, 1 0))',
+            # longest common boundary
+            'Polygon((0 1, 1 1, 1 3, 0 3, 0 1))',
+            # smaller, but only touching a corner
+            'Polygon((1 1, 1.1 1, 1.1 1.1, 1 1.1, 1 1))'
+        ]
+        features = []
+        for i, wkt in enumerate(wkts):
+            f = QgsFeature(polygons.fields())
+            f.setAttributes([i])
+            f.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(f)
+        self.assertTrue(polygons.dataProvider().addFeatures(features))
+        polygons.selectByIds([f.id() for f in polygons.getFeatures() if f['id'] in (0, 1)])
+        self.assertEqual(polygons.selectedFeatureCount(), 2)
+
+        areas = {2: 5.0, 3: 0.1, 4: 2.0, 5: 0.01}
+        context = createContext()
+        feedback = QgsProcessingFeedback()
+        alg = QgsApplication.processingRegistry().createAlgorithmById('qgis:eliminateselectedpolygons')
+        # largest area, smallest area and common boundary modes
+        for mode, merged in ((0, 2), (1, 3), (2, 4)):
+            results, ok = alg.run({'INPUT': polygons, 'MODE': mode, 'OUTPUT': 'memory:'}, context, feedback)
+            self.assertTrue(ok)
+            output = QgsProcessingUtils.mapLayerFromString(results['OUTPUT'], context)
+            geometries = {f['id']: f.geometry() for f in output.getFeatures()}
+            self.assertCountEqual(geometries.keys(), areas.keys())
+            for i, area in areas.items():
+                # both selected polygons are merged
+                self.assertAlmostEqual(geometries[i].area(), area + 2 if i == merged else area, 6, (mode, i))
+            self.assertEqual(geometries[merged].constGet().partCount(), 1)
+
 
 if __name__ == '__main__':
     nose2.main()
@@ -28,11 +28,12 @@ __revision__ = '$Format:%H$'
 import os
 import shutil
 
-from qgis.core import NULL, QgsVectorLayer
+from qgis.core import (NULL, QgsVectorLayer, QgsRasterLayer, QgsProcessingFeedback, QgsPointXY, QgsRectangle,
+                       QgsFeature, QgsGeometry, QgsSpatialIndex)
 from qgis.testing import start_app, unittest
 
 from processing.tests.TestData import points
-from processing.tools import vector
+from processing.tools import vector, raster
 
 testDataPath = os.path.join(os.path.dirname(__file__), 'testdata')
 
@@ -88,6 +89,124 @@ class VectorTest(unittest.TestCase):
         self.assertEqual(vector.convert_nulls([1, NULL, 3, NULL]), [1, None, 3, None])
         self.assertEqual(vector.convert_nulls([1, NULL, 3, NULL], '_'), [1, '_', 3, '_'])
 
+    def testSpatialPartitions(self):
+        bounds = [QgsRectangle(x, y, x + 1, y + 1) for x in range(10) for y in range(10)]
+        self.assertEqual(vector.spatialPartitions([], 10), [])
+        self.assertEqual(vector.spatialPartitions(bounds, 100), [list(range(100))])
+
+        partitions = vector.spatialPartitions(bounds, 25)
+        self.assertEqual(len(partitions), 4)
+        self.assertEqual(sorted(p for partition in partitions for p in partition), list(range(100)))
+        for partition in partitions:
+            self.assertEqual(partition, sorted(partition))
+            # tiles of 5 x 5 boxes
+            self.assertEqual(len(set(bounds[p].xMinimum() for p in partition)), 5)
+            self.assertEqual(len(set(bounds[p].yMinimum() for p in partition)), 5)
+
+    def testNearestHubs(self):
+        index = QgsSpatialIndex()
+        self.assertEqual(vector.nearestHubs(index, [QgsPointXY(0, 0), None]), [None, None])
+
+        for fid, (x, y) in enumerate([(0, 0), (10, 0), (0, 10)]):
+            f = QgsFeature(fid)
+            f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            index.addFeature(f)
+        points = [QgsPointXY(1, 1), None, QgsPointXY(9, 1), QgsPointXY(1, 9), QgsPointXY(1, 1)]
+        self.assertEqual(vector.nearestHubs(index, points), [0, None, 1, 2, 0])
+
+    def testPointDistanceGrid(self):
+        grid = vector.PointDistanceGrid(10)
+        grid.addPoint(QgsPointXY(5, 5))
+        grid.addPoint(QgsPointXY(-25, 40))
+        self.assertFalse(grid.checkMinDistance(QgsPointXY(5, 5)))
+        self.assertFalse(grid.checkMinDistance(QgsPointXY(14, 5)))
+        self.assertFalse(grid.checkMinDistance(QgsPointXY(-2, -1)))
+        self.assertFalse(grid.checkMinDistance(QgsPointXY(-20, 35)))
+        self.assertTrue(grid.checkMinDistance(QgsPointXY(15.1, 5)))
+        self.assertTrue(grid.checkMinDistance(QgsPointXY(13, 13)))
+        self.assertTrue(grid.checkMinDistance(QgsPointXY(-100, -100)))
+
+        # no minimum distance
+        grid = vector.PointDistanceGrid(0)
+        grid.addPoint(QgsPointXY(5, 5))
+        self.assertTrue(grid.checkMinDistance(QgsPointXY(5, 5)))
+
+    def testPoissonDiskPoints(self):
+        def checkDistances(points, distance):
+            for i, p in enumerate(points):
+                for other in points[i + 1:]:
+                    self.assertGreaterEqual(p.distance(other), distance)
+
+        rect = QgsRectangle(0, 0, 100, 50)
+        points = vector.poissonDiskPoints(rect, 5)
+        # the rectangle is filled
+        self.assertGreater(len(points), 100)
+        for p in points:
+            self.assertTrue(rect.contains(p))
+        checkDistances(points, 5)
+
+        # two disjoint parts
+        def contains(p):
+            return p.x() < 20 or p.x() > 80
+
+        points = vector.poissonDiskPoints(rect, 5, contains)
+        self.assertTrue([p for p in points if p.x() < 20])
+        self.assertTrue([p for p in points if p.x() > 80])
+        for p in points:
+            self.assertTrue(contains(p))
+        checkDistances(points, 5)
+
+        with self.assertRaises(ValueError):
+            vector.poissonDiskPoints(rect, 0)
+
+
+class RasterTest(unittest.TestCase):
+
+    def testScanRaster(self):
+        layer = QgsRasterLayer(os.path.join(testDataPath, 'raster.tif'), 'test')
+        values = list(raster.scanraster(layer, QgsProcessingFeedback()))
+        self.assertEqual(len(values), 16 * 14)
+        self.assertEqual(values[:5], [None, 826.0, 826.0, 837.0, 837.0])
+        self.assertEqual(len([v for v in values if v is not None]), 120)
+
+    def testScanBlocks(self):
+        layer = QgsRasterLayer(os.path.join(testDataPath, 'raster.tif'), 'test')
+        cells = 0
+        valid = 0
+        for xoff, yoff, block in raster.scanblocks(layer):
+            cells += block.size
+            valid += block.count()
+        self.assertEqual(cells, 16 * 14)
+        self.assertEqual(valid, 120)
+
+        # windowed read
+        blocks = list(raster.scanblocks(layer, window=(3, 2, 5, 4)))
+        self.assertEqual(sum(b.size for _, _, b in blocks), 20)
+        self.assertEqual(min(b.min() for _, _, b in blocks), 851.0)
+        self.assertEqual(max(b.max() for _, _, b in blocks), 872.0)
+
+        with self.assertRaises(Exception):
+            list(raster.scanblocks(layer, window=(10, 10, 10, 10)))
+
+    def testStatistics(self):
+        layer = QgsRasterLayer(os.path.join(testDataPath, 'raster.tif'), 'test')
+        stats = raster.rasterStatistics(layer)
+        self.assertEqual(stats['count'], 120)
+        self.assertEqual(stats['min'], 826.0)
+        self.assertEqual(stats['max'], 899.0)
+        self.assertEqual(stats['sum'], 103904.0)
+        self.assertAlmostEqual(stats['mean'], 865.866667, 5)
+        self.assertAlmostEqual(stats['stddev'], 17.808207, 5)
+
+    def testHistogram(self):
+        layer = QgsRasterLayer(os.path.join(testDataPath, 'raster.tif'), 'test')
+        counts, edges = raster.rasterHistogram(layer, 4, QgsProcessingFeedback())
+        self.assertEqual(list(counts), [16, 33, 46, 25])
+        self.assertEqual(list(edges), [826.0, 844.25, 862.5, 880.75, 899.0])
+
+        percentiles = raster.rasterPercentiles(layer, [0, 100])
+        self.assertEqual(percentiles, [826.0, 899.0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -27,6 +27,7 @@ __revision__ = '$Format:%H$'
 
 import psycopg2
 import psycopg2.extensions  # For isolation levels
+import io
 import re
 import os
 
@@ -552,6 +553,114 @@ class GeoDB(object):
                 sql += " AND f_table_schema='%s'" % self._quote_unicode(schema)
             self._exec_sql_and_commit(sql)
 
+    def table_exists(self, table, schema=None):
+        """Check whether a table exists in the database."""
+
+        sql = "SELECT count(*) FROM pg_class c \
+               JOIN pg_namespace n ON n.oid = c.relnamespace \
+               WHERE c.relname = '%s' AND c.relkind IN ('r', 'p')" \
+              % self._quote_unicode(table)
+        if schema:
+            sql += " AND n.nspname = '%s'" % self._quote_unicode(schema)
+        else:
+            sql += " AND pg_table_is_visible(c.oid)"
+        c = self.con.cursor()
+        self._exec_sql(c, sql)
+        return c.fetchone()[0] > 0
+
+    def set_table_logged(self, table, logged, schema=None):
+        """Switch a table between logged and unlogged (PostgreSQL 9.5+).
+
+        Unlogged tables are not written to the write-ahead log, which makes
+        loading them faster, but they are emptied after a crash. Switching
+        a table to logged writes all of it to the write-ahead log, unless
+        wal_level is minimal.
+        """
+
+        table_name = self._table_name(schema, table)
+        sql = 'ALTER TABLE %s SET %s' % (table_name,
+                                         'LOGGED' if logged else 'UNLOGGED')
+        self._exec_sql_and_commit(sql)
+
+    def replace_table(self, table, new_table, schema=None):
+        """Replace a table with another one, dropping the replaced table
+        if it exists. Both changes are done in a single transaction.
+        """
+
+        try:
+            c = self.con.cursor()
+            try:
+                c.execute('DROP TABLE IF EXISTS %s'
+                          % self._table_name(schema, table))
+            except psycopg2.Error as e:
+                # dependent_objects_still_exist
+                if e.pgcode == '2BP01':
+                    raise QgsProcessingException(QCoreApplication.translate("PostGIS", 'Table {0} cannot be replaced, other objects such as views depend on it: {1}').format(table, e.diag.message_detail or str(e)))
+                raise QgsProcessingException(str(e))
+            self._exec_sql(c, 'ALTER TABLE %s RENAME TO %s'
+                           % (self._table_name(schema, new_table),
+                              self._quote(table)))
+            self.con.commit()
+        except QgsProcessingException:
+            self.con.rollback()
+            raise
+
+    def copy_rows(self, table, columns, rows, schema=None):
+        """Bulk load rows into a table with COPY ... FROM STDIN.
+
+        'rows' is an iterable of sequences of values in the order of
+        'columns'. None values are loaded as NULL, other values are loaded
+        from their text representation. Rows are committed at once.
+
+        Returns the number of loaded rows.
+        """
+
+        data = io.StringIO()
+        count = 0
+        for row in rows:
+            data.write('\t'.join(self._copy_text(v) for v in row))
+            data.write('\n')
+            count += 1
+        if count == 0:
+            return 0
+        data.seek(0)
+
+        sql = 'COPY %s (%s) FROM STDIN' % (
+            self._table_name(schema, table),
+            ', '.join(self._quote(column) for column in columns))
+        try:
+            c = self.con.cursor()
+            c.copy_expert(sql, data)
+            self.con.commit()
+        except psycopg2.Error as e:
+            self.con.rollback()
+            raise QgsProcessingException(str(e) + ' QUERY: ' + sql)
+        return count
+
+    def distinct_rows(self, table, columns, schema=None, where=None, batch_size=10000):
+        """Yields the distinct combinations of values of some columns of a
+        table, optionally filtered by a 'where' clause.
+
+        Rows are fetched by batches with a server side cursor, so that only
+        one batch is held in memory.
+        """
+
+        sql = 'SELECT DISTINCT %s FROM %s' % (
+            ', '.join(self._quote(column) for column in columns),
+            self._table_name(schema, table))
+        if where:
+            sql += ' WHERE %s' % where
+
+        c = self.con.cursor('processing_distinct_rows')
+        c.itersize = batch_size
+        self._exec_sql(c, sql)
+        try:
+            for row in c:
+                yield row
+        finally:
+            c.close()
+            self.con.rollback()
+
     def create_view(self, name, query, schema=None):
         view_name = self._table_name(schema, name)
         sql = 'CREATE VIEW %s AS %s' % (view_name, query)
@@ -853,6 +962,16 @@ class GeoDB(object):
         txt = str(txt)
         return txt.replace("'", "''")
 
+    def _copy_text(self, value):
+        """Format a value for COPY text format, escaping the characters
+        with a special meaning.
+        """
+
+        if value is None:
+            return '\\N'
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+            .replace('\n', '\\n').replace('\r', '\\r')
+
     def _table_name(self, schema, table):
         if not schema:
             return self._quote(table)
@@ -25,45 +25,357 @@ __copyright__ = '(C) 2013, Victor Olaya  and Alexander Bruy'
 
 __revision__ = '$Format:%H$'
 
+import math
 import os
-import struct
+from collections import OrderedDict
 
 import numpy
 from osgeo import gdal
 
-from qgis.core import QgsProcessingException
+from qgis.core import (QgsProcessingException,
+                       QgsProcessingMultiStepFeedback,
+                       QgsRasterDataProvider,
+                       QgsRectangle)
 
+# GDAL data types which can be read by the scanning functions
+SUPPORTED_DATA_TYPES = ('Byte', 'Int16', 'UInt16', 'Int32', 'UInt32',
+                        'Float32', 'Float64')
 
-def scanraster(layer, feedback, band_number=1):
+# Minimum number of pixels fetched by a single read when the natural
+# block of a band is a thin strip (e.g. a single scanline in striped
+# GeoTIFFs). Consecutive strips are merged until this size is reached.
+MIN_BLOCK_PIXELS = 1 << 20
+
+# Maximum number of distinct values for which integer bands get exact
+# percentiles (one histogram bin per value)
+MAX_EXACT_PERCENTILE_BINS = 1 << 20
+
+
+def openBand(layer, band_number=1):
+    """
+    Opens the given band of a raster layer with GDAL.
+
+    Returns a (dataset, band) tuple. The dataset must be kept alive for
+    as long as the band is used.
+    """
     filename = str(layer.source())
     dataset = gdal.Open(filename, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise QgsProcessingException(
+            'Could not open raster file {}'.format(filename))
     band = dataset.GetRasterBand(band_number)
+    if band is None:
+        raise QgsProcessingException(
+            'Band {} does not exist in {}'.format(band_number, filename))
+    if gdal.GetDataTypeName(band.DataType) not in SUPPORTED_DATA_TYPES:
+        raise QgsProcessingException('Raster format not supported')
+    return dataset, band
+
+
+def blockWindows(band, window=None):
+    """
+    Yields (xoff, yoff, xsize, ysize) windows covering the whole band,
+    or only the (xoff, yoff, xsize, ysize) window if one is given.
+
+    Windows are aligned on the natural block size of the band, so each
+    read touches as few blocks of the underlying file as possible.
+    """
+    if window is None:
+        window = (0, 0, band.XSize, band.YSize)
+    x0, y0, width, height = window
+    if x0 < 0 or y0 < 0 or width < 0 or height < 0 or \
+            x0 + width > band.XSize or y0 + height > band.YSize:
+        raise QgsProcessingException(
+            'Window {} is outside of raster extent'.format(window))
+
+    blockX, blockY = band.GetBlockSize()
+    if blockX >= band.XSize:
+        # striped layout, merge strips to avoid tiny reads
+        blockX = band.XSize
+        blockY *= max(1, MIN_BLOCK_PIXELS // max(1, blockX * blockY))
+
+    for yb in range(y0 - y0 % blockY, y0 + height, blockY):
+        ys = max(yb, y0)
+        ye = min(yb + blockY, y0 + height)
+        for xb in range(x0 - x0 % blockX, x0 + width, blockX):
+            xs = max(xb, x0)
+            xe = min(xb + blockX, x0 + width)
+            yield xs, ys, xe - xs, ye - ys
+
+
+def maskNoData(data, nodata):
+    """
+    Returns a masked array where nodata (and NaN) cells are masked.
+    """
+    mask = numpy.zeros(data.shape, dtype=bool)
+    if nodata is not None and not math.isnan(nodata):
+        mask |= data == nodata
+    if data.dtype.kind == 'f':
+        mask |= numpy.isnan(data)
+    return numpy.ma.MaskedArray(data, mask=mask)
+
+
+def _readWindows(band, windows, feedback):
     nodata = band.GetNoDataValue()
-    bandtype = gdal.GetDataTypeName(band.DataType)
-    for y in range(band.YSize):
-        feedback.setProgress(y / float(band.YSize) * 100)
-        scanline = band.ReadRaster(0, y, band.XSize, 1, band.XSize, 1,
-                                   band.DataType)
-        if bandtype == 'Byte':
-            values = struct.unpack('B' * band.XSize, scanline)
-        elif bandtype == 'Int16':
-            values = struct.unpack('h' * band.XSize, scanline)
-        elif bandtype == 'UInt16':
-            values = struct.unpack('H' * band.XSize, scanline)
-        elif bandtype == 'Int32':
-            values = struct.unpack('i' * band.XSize, scanline)
-        elif bandtype == 'UInt32':
-            values = struct.unpack('I' * band.XSize, scanline)
-        elif bandtype == 'Float32':
-            values = struct.unpack('f' * band.XSize, scanline)
-        elif bandtype == 'Float64':
-            values = struct.unpack('d' * band.XSize, scanline)
+    total = 100.0 / len(windows) if windows else 0
+    for current, (xoff, yoff, xsize, ysize) in enumerate(windows):
+        if feedback is not None:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(current * total)
+        data = band.ReadAsArray(xoff, yoff, xsize, ysize)
+        yield xoff, yoff, maskNoData(data, nodata)
+
+
+def scanblocks(layer, feedback=None, band_number=1, window=None):
+    """
+    Yields (xoff, yoff, block) tuples for every block of the band, where
+    block is a numpy masked array with nodata cells masked.
+
+    If window is set to a (xoff, yoff, xsize, ysize) tuple, only the
+    cells inside that window are read.
+    """
+    dataset, band = openBand(layer, band_number)
+    windows = list(blockWindows(band, window))
+    yield from _readWindows(band, windows, feedback)
+    dataset = None
+
+
+def scanraster(layer, feedback, band_number=1):
+    """
+    Yields every cell value of the band in row order, with None for
+    nodata cells.
+    """
+    dataset, band = openBand(layer, band_number)
+    # full width strips keep the row order of the values
+    blockY = band.GetBlockSize()[1]
+    blockY *= max(1, MIN_BLOCK_PIXELS // max(1, band.XSize * blockY))
+    windows = [(0, y, band.XSize, min(blockY, band.YSize - y))
+               for y in range(0, band.YSize, blockY)]
+    for _, _, block in _readWindows(band, windows, feedback):
+        for row in block.tolist():
+            yield from row
+    dataset = None
+
+
+def rasterStatistics(layer, feedback=None, band_number=1, window=None):
+    """
+    Computes count, min, max, sum, mean and standard deviation of the
+    valid cells of a band in a single streaming pass.
+
+    Returns a dictionary with those keys. All values but count are None
+    if the band has no valid cells.
+    """
+    count = 0
+    minValue = None
+    maxValue = None
+    total = 0.0
+    mean = 0.0
+    m2 = 0.0
+    for _, _, block in scanblocks(layer, feedback, band_number, window):
+        values = block.compressed().astype(numpy.float64)
+        n = values.size
+        if n == 0:
+            continue
+        blockMean = values.mean()
+        blockM2 = ((values - blockMean) ** 2).sum()
+        # merge running moments (Chan et al.)
+        delta = blockMean - mean
+        newCount = count + n
+        mean += delta * n / newCount
+        m2 += blockM2 + delta * delta * count * n / newCount
+        count = newCount
+        total += values.sum()
+        blockMin = values.min()
+        blockMax = values.max()
+        minValue = blockMin if minValue is None else min(minValue, blockMin)
+        maxValue = blockMax if maxValue is None else max(maxValue, blockMax)
+
+    if count == 0:
+        return {'count': 0, 'min': None, 'max': None, 'sum': None,
+                'mean': None, 'stddev': None}
+    return {'count': count,
+            'min': float(minValue),
+            'max': float(maxValue),
+            'sum': float(total),
+            'mean': float(mean),
+            'stddev': math.sqrt(m2 / count)}
+
+
+def rasterHistogram(layer, bins=10, feedback=None, band_number=1,
+                    window=None, valueRange=None):
+    """
+    Computes a histogram of the valid cells of a band block by block,
+    so memory use does not depend on the raster size.
+
+    If valueRange is not set, a first pass over the raster computes the
+    minimum and maximum values. Returns a (counts, edges) tuple of numpy
+    arrays, like numpy.histogram.
+    """
+    if valueRange is None:
+        if feedback is not None:
+            feedback = QgsProcessingMultiStepFeedback(2, feedback)
+        stats = rasterStatistics(layer, feedback, band_number, window)
+        if stats['count'] == 0:
+            valueRange = (0, 1)
+        else:
+            valueRange = (stats['min'], stats['max'])
+        if feedback is not None:
+            feedback.setCurrentStep(1)
+
+    counts, edges = numpy.histogram([], bins=bins, range=valueRange)
+    counts = counts.astype(numpy.int64)
+    for _, _, block in scanblocks(layer, feedback, band_number, window):
+        values = block.compressed()
+        if values.size:
+            counts += numpy.histogram(values, bins=edges)[0]
+    return counts, edges
+
+
+def rasterPercentiles(layer, percentiles, feedback=None, band_number=1,
+                      window=None, bins=10000):
+    """
+    Computes the given percentiles (0-100) of the valid cells of a band
+    without loading the whole band in memory.
+
+    Percentiles are exact (nearest rank) for integer bands with at most
+    MAX_EXACT_PERCENTILE_BINS distinct possible values. Otherwise they
+    are interpolated from a histogram with the given number of bins.
+    Returns a list of values, None if the band has no valid cells.
+    """
+    if feedback is not None:
+        feedback = QgsProcessingMultiStepFeedback(2, feedback)
+    stats = rasterStatistics(layer, feedback, band_number, window)
+    if stats['count'] == 0:
+        return [None] * len(percentiles)
+    if feedback is not None:
+        feedback.setCurrentStep(1)
+
+    dataset, band = openBand(layer, band_number)
+    isInteger = gdal.GetDataTypeName(band.DataType) not in ('Float32', 'Float64')
+    dataset = None
+
+    minValue = stats['min']
+    maxValue = stats['max']
+    exact = isInteger and maxValue - minValue < MAX_EXACT_PERCENTILE_BINS
+    if exact:
+        bins = int(maxValue - minValue) + 1
+        valueRange = (minValue - 0.5, maxValue + 0.5)
+    else:
+        valueRange = (minValue, maxValue)
+
+    counts, edges = rasterHistogram(layer, bins, feedback, band_number,
+                                    window, valueRange)
+    cumulative = numpy.cumsum(counts)
+    total = cumulative[-1]
+
+    results = []
+    for p in percentiles:
+        if exact:
+            rank = max(1, int(math.ceil(p / 100.0 * total)))
+            index = int(numpy.searchsorted(cumulative, rank))
+            results.append(minValue + index)
+        else:
+            rank = p / 100.0 * total
+            index = min(int(numpy.searchsorted(cumulative, rank)), len(counts) - 1)
+            before = cumulative[index - 1] if index > 0 else 0
+            fraction = (rank - before) / counts[index] if counts[index] else 0
+            results.append(float(edges[index] + fraction * (edges[index + 1] - edges[index])))
+    return results
+
+
+class RasterBlockSampler:
+    """
+    Samples all the bands of a raster data provider at many points.
+
+    Cells are read block by block through the provider, and each block
+    (for all bands) stays in a bounded LRU cache, so sampling points
+    sorted by block() reads every block only once.
+    """
+
+    def __init__(self, provider, maxCachedBlocks=64):
+        self.provider = provider
+        self.bandCount = provider.bandCount()
+        self.extent = provider.extent()
+        self.width = provider.xSize()
+        self.height = provider.ySize()
+        self.xRes = self.extent.width() / self.width
+        self.yRes = self.extent.height() / self.height
+        self.maxCachedBlocks = max(1, maxCachedBlocks)
+        self.cache = OrderedDict()
+
+        self.blockWidth = provider.xBlockSize() if provider.xBlockSize() > 0 else 256
+        self.blockHeight = provider.yBlockSize() if provider.yBlockSize() > 0 else 256
+        if self.blockWidth >= self.width:
+            # striped layout, merge strips to avoid tiny reads
+            self.blockWidth = self.width
+            self.blockHeight *= max(1, (256 * 256) // max(1, self.blockWidth * self.blockHeight))
+
+    @staticmethod
+    def canSample(provider):
+        """
+        Returns True if the provider has a native size, which is required
+        to read it block by block.
+        """
+        return bool(provider.capabilities() & QgsRasterDataProvider.Size) and \
+            provider.xSize() > 0 and provider.ySize() > 0
+
+    def cell(self, point):
+        """
+        Returns the (row, column) of the cell containing point, or None
+        if the point is outside the raster.
+        """
+        if not self.extent.contains(point):
+            return None
+        col = int((point.x() - self.extent.xMinimum()) / self.xRes)
+        row = int((self.extent.yMaximum() - point.y()) / self.yRes)
+        return min(row, self.height - 1), min(col, self.width - 1)
+
+    def block(self, cell):
+        """
+        Returns the key of the block containing a (row, column) cell.
+        """
+        return cell[0] // self.blockHeight, cell[1] // self.blockWidth
+
+    def sample(self, cell):
+        """
+        Returns the list of band values at a (row, column) cell, with
+        None for nodata values or cells outside the raster.
+        """
+        if cell is None:
+            return [None] * self.bandCount
+
+        key = self.block(cell)
+        blocks = self.cache.get(key)
+        if blocks is None:
+            blocks = self._readBlocks(key)
+            self.cache[key] = blocks
+            if len(self.cache) > self.maxCachedBlocks:
+                self.cache.popitem(last=False)
         else:
-            raise QgsProcessingException('Raster format not supported')
-        for value in values:
-            if value == nodata:
-                value = None
-            yield value
+            self.cache.move_to_end(key)
+
+        row = cell[0] - key[0] * self.blockHeight
+        col = cell[1] - key[1] * self.blockWidth
+        values = []
+        for block in blocks:
+            if block.isNoData(row, col):
+                values.append(None)
+            else:
+                values.append(block.value(row, col))
+        return values
+
+    def _readBlocks(self, key):
+        startRow = key[0] * self.blockHeight
+        startCol = key[1] * self.blockWidth
+        width = min(self.blockWidth, self.width - startCol)
+        height = min(self.blockHeight, self.height - startRow)
+        xMin = self.extent.xMinimum() + startCol * self.xRes
+        yMax = self.extent.yMaximum() - startRow * self.yRes
+        extent = QgsRectangle(xMin, yMax - height * self.yRes,
+                              xMin + width * self.xRes, yMax)
+        return [self.provider.block(b + 1, extent, width, height)
+                for b in range(self.bandCount)]
 
 
 def mapToPixel(mX, mY, geoTransform):
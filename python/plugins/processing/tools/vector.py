@@ -25,8 +25,12 @@ __copyright__ = '(C) 2013, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import math
+import random
+
 from qgis.core import (NULL,
-                       QgsFeatureRequest)
+                       QgsFeatureRequest,
+                       QgsPointXY)
 
 
 def resolveFieldIndex(source, attr):
@@ -98,20 +102,171 @@ def convert_nulls(values, replacement=None):
     return [i if i != NULL else replacement for i in values]
 
 
-def checkMinDistance(point, index, distance, points):
-    """Check if distance from given point to all other points is greater
-    than given value.
+def nearestHubs(index, points):
+    """Returns the id of the nearest hub of a spatial index for each point
+    of a batch, or None for None points or if there is no hub. Points
+    sharing the same location are only looked up once.
     """
-    if distance == 0:
-        return True
+    found = {}
+    nearest = []
+    for point in points:
+        if point is None:
+            nearest.append(None)
+            continue
+        key = (point.x(), point.y())
+        if key not in found:
+            neighbors = index.nearestNeighbor(point, 1)
+            found[key] = neighbors[0] if neighbors else None
+        nearest.append(found[key])
+    return nearest
+
+
+def spatialPartitions(bounds, partitionSize):
+    """Splits the positions of a list of bounding boxes into partitions of
+    at most partitionSize neighbouring boxes, sorting boxes into vertical
+    strips by their center x and then into tiles by their center y (as
+    done by Sort-Tile-Recursive packing of R-trees).
+
+    Returns a list of partitions, each being a sorted list of positions.
+    """
+    count = len(bounds)
+    if count == 0:
+        return []
+
+    tileCount = int(math.ceil(count / partitionSize))
+    stripSize = int(math.ceil(count / math.ceil(math.sqrt(tileCount)))) if tileCount > 1 else count
+
+    byX = sorted(range(count), key=lambda p: bounds[p].center().x())
+    partitions = []
+    for stripStart in range(0, count, stripSize):
+        strip = sorted(byX[stripStart:stripStart + stripSize], key=lambda p: bounds[p].center().y())
+        for tileStart in range(0, len(strip), partitionSize):
+            partitions.append(sorted(strip[tileStart:tileStart + partitionSize]))
+    return partitions
+
+
+class PointDistanceGrid:
+    """Uniform grid of points, with cells as large as the minimum distance
+    between points, checking in constant time whether a point is at least
+    at the minimum distance from all points of the grid.
+    """
+
+    def __init__(self, distance):
+        self.distance = distance
+        self.sqrDistance = distance * distance
+        # (column, row) -> list of (x, y) of the points in the cell
+        self.cells = {}
+
+    def checkMinDistance(self, point):
+        """Check if distance from given point to all points of the grid is
+        greater than the minimum distance.
+        """
+        return self.fits(point.x(), point.y())
 
-    neighbors = index.nearestNeighbor(point, 1)
-    if len(neighbors) == 0:
+    def addPoint(self, point):
+        self.add(point.x(), point.y())
+
+    def fits(self, x, y):
+        if self.distance == 0:
+            return True
+
+        # closer points can only be in the cell of the point or around it
+        column = int(math.floor(x / self.distance))
+        row = int(math.floor(y / self.distance))
+        cells = self.cells
+        for cx in (column - 1, column, column + 1):
+            for cy in (row - 1, row, row + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    for ox, oy in cell:
+                        if (ox - x) * (ox - x) + (oy - y) * (oy - y) < self.sqrDistance:
+                            return False
         return True
 
-    if neighbors[0] in points:
-        np = points[neighbors[0]]
-        if np.sqrDist(point) < (distance * distance):
+    def add(self, x, y):
+        if self.distance == 0:
+            return
+        key = (int(math.floor(x / self.distance)), int(math.floor(y / self.distance)))
+        cell = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = [(x, y)]
+        else:
+            cell.append((x, y))
+
+
+def poissonDiskPoints(rect, distance, contains=None, feedback=None, attempts=30, seedAttempts=1000):
+    """Generates random points in a rectangle, at least at the given distance
+    from each other, with Bridson's Poisson disk sampling: new points are
+    tried around the points already generated until no more point fits.
+
+    If contains is given, only points for which contains(point) returns
+    True are generated. As points are only generated near other points, a
+    new starting point is searched among seedAttempts random points once
+    no more point fits around the generated points, so that disjoint parts
+    of the area are filled too.
+
+    Returns a list of QgsPointXY.
+    """
+    if distance <= 0:
+        raise ValueError('Poisson disk sampling needs a distance greater than 0')
+
+    grid = PointDistanceGrid(distance)
+    cells = grid.cells
+    sqrDistance = grid.sqrDistance
+    floor = math.floor
+    xMin = rect.xMinimum()
+    yMin = rect.yMinimum()
+    xMax = rect.xMaximum()
+    yMax = rect.yMaximum()
+    points = []
+    active = []
+
+    def accept(x, y):
+        if not (xMin <= x <= xMax and yMin <= y <= yMax):
             return False
+        # same as grid.fits(x, y), inlined as it is called a lot
+        column = int(floor(x / distance))
+        row = int(floor(y / distance))
+        for cx in (column - 1, column, column + 1):
+            for cy in (row - 1, row, row + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    for ox, oy in cell:
+                        if (ox - x) * (ox - x) + (oy - y) * (oy - y) < sqrDistance:
+                            return False
+        return contains is None or contains(QgsPointXY(x, y))
+
+    while feedback is None or not feedback.isCanceled():
+        for attempt in range(seedAttempts):
+            x = xMin + (xMax - xMin) * random.random()
+            y = yMin + (yMax - yMin) * random.random()
+            if accept(x, y):
+                break
+        else:
+            break
+        grid.add(x, y)
+        points.append(QgsPointXY(x, y))
+        active.append((x, y))
+
+        while active:
+            if feedback is not None and len(points) % 1000 == 0 and feedback.isCanceled():
+                break
+
+            i = random.randrange(len(active))
+            px, py = active[i]
+            for attempt in range(attempts):
+                angle = 2 * math.pi * random.random()
+                radius = distance * (1 + random.random())
+                x = px + radius * math.cos(angle)
+                y = py + radius * math.sin(angle)
+                if accept(x, y):
+                    grid.add(x, y)
+                    points.append(QgsPointXY(x, y))
+                    active.append((x, y))
+                    break
+            else:
+                # no more point fits around this point
+                active[i] = active[-1]
+                active.pop()
 
-    return True
+    return points
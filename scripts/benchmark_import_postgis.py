@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Compares the throughput of the loading methods of the Processing
+# "Export to PostgreSQL" algorithm (qgis:importintopostgis).
+#
+# The input can be generated with random_vector.py, and the connection
+# must be an existing PostgreSQL connection of the QGIS settings.
+
+import sys
+import time
+from optparse import OptionParser
+
+from qgis.core import QgsApplication, QgsVectorLayer
+from qgis.analysis import QgsNativeAlgorithms
+
+
+def error(msg):
+    print(msg)
+    sys.exit(1)
+
+
+parser = OptionParser("usage: %prog [options] input connection")
+parser.add_option("-s", "--schema", dest="schema", default="public", help="Schema of the benchmark table")
+parser.add_option("-t", "--table", dest="table", default="benchmark_import", help="Name of the benchmark table")
+parser.add_option("-b", "--batch-size", dest="batch_size", type="int", default=10000, help="Number of features per COPY batch")
+parser.add_option("-r", "--runs", dest="runs", type="int", default=3, help="Number of runs of each method")
+
+(options, args) = parser.parse_args()
+if len(args) != 2:
+    error("Input file path or connection name missing")
+
+app = QgsApplication([], False)
+app.initQgis()
+
+from processing.core.Processing import Processing  # NOQA
+import processing  # NOQA
+
+Processing.initialize()
+QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+
+layer = QgsVectorLayer(args[0], 'input', 'ogr')
+if not layer.isValid():
+    error("Could not open %s" % args[0])
+count = layer.featureCount()
+
+methods = (('Add features one by one', {'METHOD': 0}),
+           ('Bulk load with COPY', {'METHOD': 1}),
+           ('Bulk load with COPY into an unlogged staging table', {'METHOD': 1, 'UNLOGGED_STAGING': True}))
+
+print("%d features, best of %d runs" % (count, options.runs))
+for name, method_parameters in methods:
+    parameters = {'INPUT': layer,
+                  'DATABASE': args[1],
+                  'SCHEMA': options.schema,
+                  'TABLENAME': options.table,
+                  'OVERWRITE': True,
+                  'BATCH_SIZE': options.batch_size}
+    parameters.update(method_parameters)
+
+    best = None
+    for run in range(options.runs):
+        start = time.time()
+        processing.run('qgis:importintopostgis', parameters)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%s: %.2f s, %.0f features/s" % (name, best, count / best if best else 0))
+
+app.exitQgis()
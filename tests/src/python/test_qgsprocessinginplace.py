@@ -19,6 +19,7 @@ from qgis.core import (
 from processing.core.Processing import Processing
 from processing.core.ProcessingConfig import ProcessingConfig
 from processing.tools import dataobjects
+from processing.gui import AlgorithmExecutor
 from processing.gui.AlgorithmExecutor import execute_in_place_run
 from qgis.testing import start_app, unittest
 from qgis.PyQt.QtTest import QSignalSpy
@@ -729,6 +730,49 @@ class TestQgsProcessingInPlace(unittest.TestCase):
         old_features, new_features = self._test_difference_on_invalid_geometries(2)
         self.assertEqual(len(new_features), 1)
 
+    def test_batched_edits(self):
+        """Check that features spanning several edit batches are all processed"""
+
+        layer = self._make_layer('Point')
+        layer.startEditing()
+        for i in range(7):
+            f = QgsFeature(layer.fields())
+            f.setAttributes([i])
+            f.setGeometry(QgsGeometry.fromWkt('Point({} {})'.format(i, i)))
+            self.assertTrue(layer.addFeature(f))
+        self.assertTrue(layer.commitChanges())
+        old_ids = set(layer.allFeatureIds())
+
+        context = QgsProcessingContext()
+        context.setProject(QgsProject.instance())
+        feedback = ConsoleFeedBack()
+
+        batch_size = AlgorithmExecutor.IN_PLACE_BATCH_SIZE
+        AlgorithmExecutor.IN_PLACE_BATCH_SIZE = 3
+        try:
+            # Each feature is replaced by two features
+            alg = self.registry.createAlgorithmById('native:arraytranslatedfeatures')
+            ok, _ = execute_in_place_run(
+                alg, {'INPUT': layer, 'COUNT': 1, 'DELTA_X': 1.1}, context=context, feedback=feedback, raise_exceptions=True)
+            self.assertTrue(ok)
+            self.assertEqual(layer.featureCount(), 14)
+            self.assertEqual(len(layer.selectedFeatureIds()), 14)
+            self.assertFalse(old_ids.intersection(layer.selectedFeatureIds()))
+            self.assertEqual(sorted(f['int_f'] for f in layer.getFeatures()), sorted(list(range(7)) * 2))
+
+            # Each feature is modified
+            layer.rollBack()
+            layer.selectByIds(list(old_ids))
+            alg = self.registry.createAlgorithmById('native:translategeometry')
+            ok, _ = execute_in_place_run(
+                alg, {'INPUT': layer, 'DELTA_X': 1.1}, context=context, feedback=feedback, raise_exceptions=True)
+            self.assertTrue(ok)
+            self.assertEqual(set(layer.selectedFeatureIds()), old_ids)
+            self.assertEqual(sorted(f.geometry().asPoint().x() for f in layer.getFeatures()), [i + 1.1 for i in range(7)])
+        finally:
+            AlgorithmExecutor.IN_PLACE_BATCH_SIZE = batch_size
+            layer.rollBack()
+
 
 if __name__ == '__main__':
     unittest.main()